@@ -82,6 +82,10 @@ module "lambda_inbox" {
     LANGCHAIN_TRACING_V2        = var.langchain_tracing
     LANGCHAIN_API_KEY           = var.langchain_api_key
     LANGCHAIN_ENDPOINT          = var.langchain_endpoint
+    BATCH_INFERENCE             = var.batch_inference
+    BATCH_JOB_BUCKET            = data.aws_s3_bucket.existing_bucket.id
+    BATCH_JOB_PREFIX            = var.batch_job_prefix
+    BATCH_JOB_ROLE_ARN          = aws_iam_role.bedrock_batch_role.arn
   }
   depends_on = [null_resource.docker_push]
 }
@@ -108,6 +112,16 @@ resource "aws_iam_role_policy" "ocr_policy" {
           "${data.aws_s3_bucket.existing_bucket.arn}/*",
         ]
       },
+      {
+        # collected batch job manifests are moved from pending/ to done/
+        Effect = "Allow"
+        Action = [
+          "s3:DeleteObject",
+        ]
+        Resource = [
+          "${data.aws_s3_bucket.existing_bucket.arn}/${var.batch_job_prefix}/*",
+        ]
+      },
       {
         Effect = "Allow"
         Action = [
@@ -137,6 +151,103 @@ resource "aws_iam_role_policy" "inbox_bedrock_policy" {
         "Effect" : "Allow",
         "Resource" : "arn:aws:bedrock:*::foundation-model/*"
       },
+      {
+        "Action" : [
+          "bedrock:CreateModelInvocationJob",
+          "bedrock:GetModelInvocationJob"
+        ],
+        "Effect" : "Allow",
+        "Resource" : [
+          "arn:aws:bedrock:*::foundation-model/*",
+          "arn:aws:bedrock:${var.aws_region_primary}:${var.aws_account_num}:model-invocation-job/*"
+        ]
+      },
+      {
+        "Action" : [
+          "iam:PassRole"
+        ],
+        "Effect" : "Allow",
+        "Resource" : aws_iam_role.bedrock_batch_role.arn,
+        "Condition" : {
+          "StringEquals" : {
+            "iam:PassedToService" : "bedrock.amazonaws.com"
+          }
+        }
+      },
+    ]
+  })
+}
+
+# Service role Bedrock batch inference jobs run as, reads job inputs and writes job outputs
+resource "aws_iam_role" "bedrock_batch_role" {
+  name = "${var.app_name}-bedrock-batch-${var.stack_env}"
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Principal = {
+          Service = "bedrock.amazonaws.com"
+        }
+        Action = "sts:AssumeRole"
+        Condition = {
+          StringEquals = {
+            "aws:SourceAccount" = var.aws_account_num
+          }
+        }
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "bedrock_batch_policy" {
+  name = "bedrock_batch_job_policy-${var.stack_env}"
+  role = aws_iam_role.bedrock_batch_role.id
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+        ]
+        Resource = [
+          "${data.aws_s3_bucket.existing_bucket.arn}/${var.batch_job_prefix}/jobs/*",
+        ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket",
+        ]
+        Resource = [
+          data.aws_s3_bucket.existing_bucket.arn,
+        ]
+      }
     ]
   })
 }
+
+# Collects ended batch jobs in batch inference mode, see handler.lambda_handler
+resource "aws_cloudwatch_event_rule" "batch_collect_schedule" {
+  count               = var.batch_inference == "none" ? 0 : 1
+  name                = "${var.app_name}-batch-collect-${var.stack_env}"
+  schedule_expression = var.batch_collect_schedule
+}
+
+resource "aws_cloudwatch_event_target" "batch_collect_target" {
+  count = var.batch_inference == "none" ? 0 : 1
+  rule  = aws_cloudwatch_event_rule.batch_collect_schedule[0].name
+  arn   = module.lambda_inbox.lambda.arn
+  input = jsonencode({ action = "collect_batch_jobs" })
+}
+
+resource "aws_lambda_permission" "batch_collect_permission" {
+  count         = var.batch_inference == "none" ? 0 : 1
+  statement_id  = "AllowBatchCollectSchedule"
+  action        = "lambda:InvokeFunction"
+  function_name = module.lambda_inbox.lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.batch_collect_schedule[0].arn
+}
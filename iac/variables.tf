@@ -192,3 +192,23 @@ variable "anthropic_api_key" {
   type        = string
   default     = ""
 }
+
+variable "batch_inference" {
+  description = "Offline batch inference mode of the inbox lambda, none or provider"
+  type        = string
+  default     = "none"
+  validation {
+    condition     = contains(["none", "provider"], var.batch_inference)
+    error_message = "Invalid batch inference mode. Must be one of none or provider."
+  }
+}
+variable "batch_job_prefix" {
+  description = "Key prefix of batch job manifests and Bedrock job files in the bucket"
+  type        = string
+  default     = "ocr_batch_jobs"
+}
+variable "batch_collect_schedule" {
+  description = "Schedule expression of the batch job collection in batch inference mode"
+  type        = string
+  default     = "rate(15 minutes)"
+}
@@ -5,7 +5,7 @@ from __future__ import annotations
 import os
 
 from . import lib
-from .__main__ import main
+from .__main__ import collect_batch_jobs, main, submit_batch_job
 
 __author__ = "Paul Robello"
 __credits__ = ["Paul Robello"]
@@ -28,5 +28,7 @@ __all__: list[str] = [
     "__application_title__",
     "__application_binary__",
     "main",
+    "submit_batch_job",
+    "collect_batch_jobs",
     "lib",
 ]
@@ -3,127 +3,896 @@
 from __future__ import annotations
 
 import concurrent.futures
+import io
 import os
+import re
 import tempfile
 import time
+from collections import deque
+from collections.abc import Generator, Iterable
 from pathlib import Path
+from typing import Literal
 
-import boto3
+import orjson as json
 from aws_lambda_powertools import Logger
+from botocore.exceptions import ClientError
 from dotenv import load_dotenv
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
 
-from ai_ocr.lib.par_ai_core.llm_config import LlmConfig, llm_run_manager
-from ai_ocr.lib.par_ai_core.llm_image_utils import image_to_base64, try_get_image_type
-from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider, provider_env_key_names, provider_vision_models
-from ai_ocr.lib.par_ai_core.pricing_lookup import PricingDisplay
+from ai_ocr.batch_jobs import (
+    BatchDocument,
+    BatchJob,
+    BatchJobBuilder,
+    BatchPage,
+    build_batch_endpoint,
+    manifest_key,
+    manifest_prefix,
+)
+from ai_ocr.blank_pages import BLANK_PAGE_PLACEHOLDER, BlankPageDetector
+from ai_ocr.lib.get_client import cached_client
+from ai_ocr.lib.par_ai_core.llm_batch_api import BatchJobState, BatchRequest, BatchResult
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig
+from ai_ocr.lib.par_ai_core.llm_image_policy import ImagePolicy, get_image_policy
+from ai_ocr.lib.par_ai_core.llm_image_utils import image_to_base64
+from ai_ocr.lib.par_ai_core.llm_provider_pool import ProviderPool
+from ai_ocr.lib.par_ai_core.llm_providers import (
+    LlmProvider,
+    provider_env_key_names,
+    provider_vision_models,
+)
+from ai_ocr.lib.par_ai_core.pricing_lookup import PricingDisplay, get_api_call_cost, mk_usage_metadata
 from ai_ocr.lib.par_ai_core.provider_cb_info import get_parai_callback
+from ai_ocr.ocr_cache import build_ocr_cache, make_ocr_cache_key
+from ai_ocr.ocr_config import BatchInferenceBackend, OcrConfig, OutputFormat, TextLayerMode
+from ai_ocr.ocr_engine import (
+    OCR_USER_PROMPT,
+    TILE_OCR_USER_PROMPT,
+    PageOcrEngine,
+    clean_ocr_content,
+    page_num_from_suffix,
+    page_suffix,
+)
+from ai_ocr.page_bundle import BundleRecordKind, PageBundleWriter
+from ai_ocr.page_dedupe import DuplicatePageIndex
+from ai_ocr.page_image import PageImage, PageImageStore
+from ai_ocr.page_tiles import PageTile, needs_tiling, split_page_tiles, stitch_tile_markdown
+from ai_ocr.run_summary import OcrRunSummary
+from ai_ocr.s3_input import (
+    LINEARIZATION_HEAD_BYTES,
+    DiskUsageTracker,
+    InputDownload,
+    Linearization,
+    ProgressiveDownload,
+    parse_linearization,
+)
+from ai_ocr.s3_transfer import S3Transfers
+from ai_ocr.text_layer import find_text_pages
 
 logger = Logger()
 
-s3 = boto3.client("s3")
-
 load_dotenv()
 load_dotenv(str(Path("~/.par_ocr_config").expanduser()))
 
+# shared by the page workers, its connection pool is sized for the configured concurrency
+s3 = cached_client(
+    "s3",
+    max_pool_connections=OcrConfig.from_env().s3_pool_connections(int(os.environ.get("MAX_OCR_WORKERS", 0)) or None),
+)
+
 
 doc_folder = Path("./test_data").absolute()
 input_file_default = doc_folder / "test1.pdf"
 system_prompt_file_default = Path(__file__).parent / "system_prompt.md"
+text_format_prompt_file_default = Path(__file__).parent / "text_format_prompt.md"
+
+PDFINFO_PAGE_SIZE_PATTERN = re.compile(r"Page\s+(\d+) size")
+PDFINFO_SIZE_PATTERN = re.compile(r"([\d.]+) x ([\d.]+) pts")
+
+
+def check_provider_api_key(provider: LlmProvider) -> None:
+    """Raise ValueError if the API key environment variable of a provider is not set."""
+    if provider in [LlmProvider.BEDROCK]:
+        return
+    key_name = provider_env_key_names[provider]
+    if not os.environ.get(key_name):
+        raise ValueError(f"{key_name} environment variable not set.")
+
+
+def build_provider_pool(llm_config: LlmConfig, ocr_config: OcrConfig) -> ProviderPool:
+    """Build the provider pool of the configured model followed by the ``ocr_config.provider_pool`` endpoints."""
+    endpoints: list[tuple[LlmConfig, float]] = [(llm_config, 1.0)]
+    for endpoint in ocr_config.provider_pool:
+        provider = LlmProvider(endpoint["provider"])
+        check_provider_api_key(provider)
+        endpoints.append(
+            (
+                LlmConfig(
+                    provider=provider,
+                    model_name=endpoint.get("model") or provider_vision_models[provider],
+                    base_url=endpoint.get("base_url"),
+                    temperature=llm_config.temperature,
+                ),
+                float(endpoint.get("weight", 1.0)),
+            )
+        )
+    return ProviderPool.from_configs(
+        endpoints,
+        strategy=ocr_config.pool_strategy,
+        failure_threshold=ocr_config.pool_failure_threshold,
+        reset_timeout=ocr_config.pool_reset_timeout,
+    )
+
+
+def get_pdf_page_count(pdf_path: Path) -> int:
+    """Probe the number of pages in a pdf without rendering it."""
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def get_pdf_page_sizes(pdf_path: Path, page_count: int) -> dict[int, tuple[float, float]]:
+    """Probe the width and height in points (1/72 inch) of every page in a pdf without rendering it."""
+    info = pdfinfo_from_path(pdf_path, first_page=1, last_page=page_count)
+    page_sizes: dict[int, tuple[float, float]] = {}
+    for key, value in info.items():
+        key_match = PDFINFO_PAGE_SIZE_PATTERN.fullmatch(key)
+        size_match = PDFINFO_SIZE_PATTERN.match(str(value))
+        if key_match and size_match:
+            page_sizes[int(key_match.group(1))] = (float(size_match.group(1)), float(size_match.group(2)))
+    return page_sizes
+
+
+def find_oversized_pages(
+    pdf_path: Path, page_count: int, image_policy: ImagePolicy, *, dpi: int, min_scale: float
+) -> set[int]:
+    """Find the pdf pages that are too large for the model's image resolution when rendered at dpi.
+
+    Failures to read the page sizes are logged and treated as a pdf without oversized pages.
+    """
+    try:
+        page_sizes = get_pdf_page_sizes(pdf_path, page_count)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning(f"Could not read page sizes of {pdf_path}: {e}")
+        return set()
+    oversized = {
+        page_num
+        for page_num, (width, height) in page_sizes.items()
+        if needs_tiling(round(width * dpi / 72), round(height * dpi / 72), image_policy, min_scale=min_scale)
+    }
+    if oversized:
+        logger.info(f"Found {len(oversized)} of {page_count} pages too large for the model's image resolution")
+    return oversized
+
+
+def split_page_ranges(
+    pages: list[int], chunk_size: int, tiled_pages: set[int] | frozenset[int] = frozenset()
+) -> list[tuple[int, int]]:
+    """Split sorted page numbers into contiguous (first_page, last_page) ranges of at most chunk_size pages.
+
+    A range never mixes pages in ``tiled_pages`` with other pages since they are rendered differently.
+    """
+    page_ranges: list[tuple[int, int]] = []
+    for page_num in pages:
+        if page_ranges:
+            first_page, last_page = page_ranges[-1]
+            if (
+                page_num == last_page + 1
+                and page_num - first_page < chunk_size
+                and (page_num in tiled_pages) == (last_page in tiled_pages)
+            ):
+                page_ranges[-1] = (first_page, page_num)
+                continue
+        page_ranges.append((page_num, page_num))
+    return page_ranges
+
+
+def render_page_range(
+    *,
+    pdf_path: Path,
+    image_store: PageImageStore,
+    first_page: int,
+    last_page: int,
+    blank_detector: BlankPageDetector | None = None,
+    image_policy: ImagePolicy | None = None,
+    tile_dpi: int | None = None,
+    strict: bool = False,
+) -> list[PageImage]:
+    """Render a contiguous page range with a single pdftoppm call and encode each page as a JPEG.
+
+    pdftoppm streams the pages over a pipe and each page is encoded once into ``image_store``,
+    so nothing touches the disk unless the store spills. Pages are classified by ``blank_detector``
+    while still decoded. ``image_policy`` sets the render size and encoding, otherwise pages are
+    rendered at 200 DPI. Pages to be tiled are rendered at ``tile_dpi`` and kept at full resolution.
+    With ``strict`` a syntax error reported by poppler fails the render instead of being ignored.
+    """
+    ret: list[PageImage] = []
+    render_kwargs = image_policy.render_kwargs() if image_policy else {}
+    if tile_dpi:
+        render_kwargs = {**render_kwargs, "dpi": tile_dpi}
+        render_kwargs.pop("size", None)
+    image_data = convert_from_path(pdf_path, first_page=first_page, last_page=last_page, strict=strict, **render_kwargs)
+    for page_num, image in enumerate(image_data, start=first_page):
+        suffix = page_suffix(page_num)
+        name = pdf_path.stem + Path(suffix).stem
+        # fine print on a large page washes out in the blank detector's downsampled copy
+        if blank_detector and not tile_dpi:
+            blank_detector.check_page(image, page_num)
+        if tile_dpi and image_policy:
+            ret.append(image_store.add_image(name=name, suffix=suffix, image=image, quality=image_policy.jpeg_quality))
+        elif image_policy:
+            ret.append(image_store.add(name=name, suffix=suffix, data=image_policy.encode(image)))
+        else:
+            ret.append(image_store.add_image(name=name, suffix=suffix, image=image))
+        image.close()
+    return ret
 
 
 def convert_pdf_to_images(
     *,
     src_file: Path,
     pdf_path: Path,
-    output_path: Path,
-) -> list[tuple[Path, str]]:
-    """convert_pdf_to_images"""
-    logger.info(f"Converting {src_file} to images and saving to {output_path}")
-
-    ret: list[tuple[Path, str]] = []
-    image_data = convert_from_path(pdf_path, output_folder=output_path)
-    for i, image in enumerate(image_data):
-        suffix = "-page" + str(i + 1).zfill(3) + ".jpg"
-        out_image_path = output_path / (pdf_path.stem + suffix)
-        image.save(out_image_path, "JPEG")
-        ret.append((out_image_path, suffix))
-    return ret
+    image_store: PageImageStore,
+    page_count: int | None = None,
+    pages: list[int] | None = None,
+    render_workers: int = 1,
+    chunk_size: int = 4,
+    blank_detector: BlankPageDetector | None = None,
+    image_policy: ImagePolicy | None = None,
+    tiled_pages: set[int] | None = None,
+    tile_dpi: int = 200,
+) -> Generator[PageImage, None, None]:
+    """Render a pdf, yielding each page image in page order as soon as it is encoded.
+
+    With a single render worker pages are rendered one at a time so only one rendered page is
+    held in memory and consumers can start OCR on early pages while later pages are still rendering.
+    With more workers the page range is split into chunks of ``chunk_size`` pages and each chunk is
+    rendered by its own pdftoppm process, at most ``render_workers`` chunks ahead of the consumer so
+    rendered pages waiting to be consumed stay bounded in memory.
+    Only the sorted page numbers in ``pages`` are rendered if given. ``image_policy`` sets the
+    render size and encoding for the model the pages are sent to, except for ``tiled_pages`` which
+    are rendered at ``tile_dpi`` to be OCRed as tiles.
+    """
+    tiled_pages = tiled_pages or set()
+    if page_count is None:
+        page_count = get_pdf_page_count(pdf_path)
+    if pages is None:
+        pages = list(range(1, page_count + 1))
+    logger.info(f"Converting {src_file} ({len(pages)} of {page_count} pages) to images")
+
+    if render_workers <= 1 or len(pages) <= 1:
+        for page_num in pages:
+            yield from render_page_range(
+                pdf_path=pdf_path,
+                image_store=image_store,
+                first_page=page_num,
+                last_page=page_num,
+                blank_detector=blank_detector,
+                image_policy=image_policy,
+                tile_dpi=tile_dpi if page_num in tiled_pages else None,
+            )
+        return
+
+    page_ranges = split_page_ranges(pages, max(1, chunk_size), tiled_pages)
+    render_workers = min(render_workers, len(page_ranges))
+    logger.info(f"Rendering {len(page_ranges)} page ranges with {render_workers} workers")
+
+    # pdftoppm does the rendering in its own process, so threads are enough to keep every core busy
+    # and avoid multiprocessing primitives which need /dev/shm (not available on Lambda).
+    with concurrent.futures.ThreadPoolExecutor(max_workers=render_workers) as executor:
+        pending_ranges = iter(page_ranges)
+        futures: deque[concurrent.futures.Future[list[PageImage]]] = deque()
+
+        def submit_next_range() -> None:
+            page_range = next(pending_ranges, None)
+            if page_range:
+                first_page, last_page = page_range
+                futures.append(
+                    executor.submit(
+                        render_page_range,
+                        pdf_path=pdf_path,
+                        image_store=image_store,
+                        first_page=first_page,
+                        last_page=last_page,
+                        blank_detector=blank_detector,
+                        image_policy=image_policy,
+                        tile_dpi=tile_dpi if first_page in tiled_pages else None,
+                    )
+                )
+
+        for _ in range(render_workers):
+            submit_next_range()
+        while futures:
+            page_images = futures.popleft().result()
+            # the next range is only submitted as one is consumed, so render_workers ranges are in flight
+            submit_next_range()
+            yield from page_images
+
+
+def upload_page_images(
+    *,
+    images: Iterable[PageImage],
+    src_file: Path,
+    output_bucket: str,
+    output_key: str,
+    transfers: S3Transfers,
+    bundle: PageBundleWriter | None = None,
+) -> Generator[PageImage, None, None]:
+    """Queue each page image for upload to s3 as it is produced and pass it on to the next stage.
+
+    The uploads run on the ``transfers`` threads, overlapped with OCR of the pages. Once its
+    upload queue is full the next image waits for a slot, holding back the rasterizer.
+    With a ``bundle`` the images are appended to it instead.
+    """
+    for page_image in images:
+        if bundle:
+            bundle.add(
+                page_num_from_suffix(page_image.suffix),
+                BundleRecordKind.IMAGE,
+                page_image.read_bytes(),
+                content_type=f"image/{page_image.image_type}",
+            )
+        else:
+            transfers.upload(page_image.read_bytes(), output_bucket, f"{output_key}/{src_file.stem}{page_image.suffix}")
+        yield page_image
+
+
+def track_page_images(
+    images: Iterable[PageImage], *, summary: OcrRunSummary, disk_usage: DiskUsageTracker, start_time: float
+) -> Generator[PageImage, None, None]:
+    """Record the time to the first page image and sample the disk usage as page images are produced.
+
+    Args:
+        images: Page images in the order they are produced
+        summary: Summary the time to the first page is recorded in
+        disk_usage: Tracker of the run's disk usage, spilled page images add to it
+        start_time: time.monotonic() timestamp the run started at
+    """
+    for page_image in images:
+        if not summary.first_page_seconds:
+            summary.first_page_seconds = time.monotonic() - start_time
+            logger.info(f"First page image ready {summary.first_page_seconds:.2f}s after the run started")
+        disk_usage.sample()
+        yield page_image
+
+
+def streamable_linearization(download: ProgressiveDownload, ocr_config: OcrConfig) -> Linearization | None:
+    """Get the linearization of a pdf being downloaded if its first page can be OCRed before the download completes.
+
+    Text layer detection and finding oversized pages read every page, so with text_layer or tile_pages on
+    the pdf is downloaded in full first. So are pdfs that are not linearized, were updated after being
+    linearized, or whose first page section is not page 1.
+    """
+    if ocr_config.text_layer != TextLayerMode.OFF or ocr_config.tile_pages:
+        logger.info("Text layer or page tiling is on, rendering the pdf once it is downloaded")
+        return None
+    linearization = parse_linearization(download.read_head(LINEARIZATION_HEAD_BYTES))
+    if (
+        linearization is None
+        or linearization.length != download.size
+        or linearization.first_page != 1
+        or linearization.first_page_end > download.size
+    ):
+        logger.info("The pdf is not linearized for fast web view, rendering it once it is downloaded")
+        return None
+    logger.info(
+        f"The pdf is linearized, rendering page 1 once the first {linearization.first_page_end} bytes are downloaded"
+    )
+    return linearization
+
+
+def render_first_page(
+    *,
+    download: ProgressiveDownload,
+    linearization: Linearization,
+    image_store: PageImageStore,
+    blank_detector: BlankPageDetector | None = None,
+    image_policy: ImagePolicy | None = None,
+) -> list[PageImage]:
+    """Render page 1 of a linearized pdf from the downloaded prefix of the file.
+
+    Poppler opens a linearized pdf from the cross reference table of its first page section, so page 1
+    renders from a file that is only downloaded up to the end of that section. Any error poppler reports
+    fails the render instead of rendering from the zeros past the downloaded prefix.
+
+    Returns:
+        list[PageImage]: Image of page 1, empty if it could not be rendered before the download completes
+    """
+    download.wait_for(linearization.first_page_end)
+    try:
+        return render_page_range(
+            pdf_path=download.path,
+            image_store=image_store,
+            first_page=1,
+            last_page=1,
+            blank_detector=blank_detector,
+            image_policy=image_policy,
+            strict=True,
+        )
+    except Exception as e:
+        logger.warning(f"Rendering page 1 before the download completed failed, rendering it once downloaded: {e}")
+        return []
+
+
+def stream_pdf_images(
+    *,
+    download: ProgressiveDownload,
+    linearization: Linearization,
+    summary: OcrRunSummary,
+    disk_usage: DiskUsageTracker,
+    src_file: Path,
+    image_store: PageImageStore,
+    render_workers: int = 1,
+    chunk_size: int = 4,
+    blank_detector: BlankPageDetector | None = None,
+    image_policy: ImagePolicy | None = None,
+) -> Generator[PageImage, None, None]:
+    """Yield page 1 of a linearized pdf while it downloads, then render the other pages once it is complete.
+
+    Args:
+        download: Started download of the pdf
+        linearization: Linearization of the pdf, see streamable_linearization
+        summary: Summary the download is recorded in
+        disk_usage: Tracker of the run's disk usage, sampled once the download completes
+        src_file: Source document name
+        image_store: Store the page images are encoded into
+        render_workers: Number of pdftoppm processes rendering the other pages
+        chunk_size: Pages per pdftoppm call with more than one render worker
+        blank_detector: Classifies pages as blank while they are rendered
+        image_policy: Render size and encoding of the pages
+    """
+    first_page = render_first_page(
+        download=download,
+        linearization=linearization,
+        image_store=image_store,
+        blank_detector=blank_detector,
+        image_policy=image_policy,
+    )
+    yield from first_page
+    record_input_download(summary, download.wait())
+    disk_usage.sample()
+    yield from convert_pdf_to_images(
+        src_file=src_file,
+        pdf_path=download.path,
+        image_store=image_store,
+        page_count=linearization.page_count,
+        pages=list(range(len(first_page) + 1, linearization.page_count + 1)),
+        render_workers=render_workers,
+        chunk_size=chunk_size,
+        blank_detector=blank_detector,
+        image_policy=image_policy,
+    )
+
+
+def record_input_download(summary: OcrRunSummary, download: InputDownload) -> None:
+    """Record the size and time of the source download in the summary."""
+    summary.input_bytes = download.bytes
+    summary.input_seconds = download.seconds
 
 
 def ai_ocr(
     *,
     max_workers: int | None = None,
     llm_config: LlmConfig,
+    ocr_config: OcrConfig | None = None,
     system_prompt_text: str,
     src_file: Path,
     pdf_path: Path,
-    images: list[tuple[Path, str]],
+    images: Iterable[PageImage],
+    page_count: int,
     output_path: Path,
     output_bucket: str,
     output_key: str,
+    deadline: float | None = None,
+    blank_detector: BlankPageDetector | None = None,
+    text_pages: dict[int, str] | None = None,
+    text_format_prompt_text: str = "",
+    image_store: PageImageStore | None = None,
+    image_policy: ImagePolicy | None = None,
+    summary: OcrRunSummary | None = None,
+    provider_pool: ProviderPool | None = None,
+    bundle: PageBundleWriter | None = None,
 ) -> Path:
-    """Use AI OCR to extract text from images"""
+    """Use AI OCR to extract text from images.
 
-    model = llm_config.build_chat_model()
-    system_prompt = (
-        "system",
-        system_prompt_text,
+    Pages are submitted to the model by a ``PageOcrEngine`` as soon as they are pulled from ``images``,
+    so a streaming rasterizer overlaps rendering of later pages with OCR of earlier ones.
+    ``text_pages`` holds the embedded text of pdf pages that were not rendered. With a ``bundle``
+    page markdown is appended to it in page order instead of being written as an object per page.
+    What happened to each page is recorded in ``summary``.
+    """
+    if not ocr_config:
+        ocr_config = OcrConfig()
+    if not summary:
+        summary = OcrRunSummary()
+    summary.pages = page_count
+    text_pages = text_pages or {}
+
+    engine = PageOcrEngine(
+        s3_client=s3,
+        llm_config=llm_config,
+        ocr_config=ocr_config,
+        system_prompt_text=system_prompt_text,
+        src_file=src_file,
+        page_count=page_count,
+        output_bucket=output_bucket,
+        output_key=output_key,
+        summary=summary,
+        max_workers=max_workers,
+        deadline=deadline,
+        blank_detector=blank_detector,
+        text_format_prompt_text=text_format_prompt_text,
+        image_store=image_store,
+        image_policy=image_policy,
+        provider_pool=provider_pool,
+        bundle=bundle,
     )
+    summary.text_pages.extend(text_pages)
+    try:
+        results = engine.process_pages(images, text_pages)
+    finally:
+        engine.close()
+    engine.log_metrics()
 
     pages: list[tuple[int, str]] = []
+    for page_num, content in sorted(results, key=lambda x: x[0]):
+        pages.append((page_num, content))
+        if bundle:
+            bundle.add(
+                page_num,
+                BundleRecordKind.MARKDOWN,
+                content.encode("utf-8"),
+                content_type="text/markdown",
+                compress=True,
+            )
+
+    text_file = output_path / (pdf_path.stem + f"-{llm_config.model_name}.md")
+    text_file.write_text("\n\n".join([content for _, content in pages]), encoding="utf-8")
+    return text_file
+
+
+def prepare_batch_document(
+    *,
+    batch_job: BatchJobBuilder,
+    llm_config: LlmConfig,
+    ocr_config: OcrConfig,
+    system_prompt_text: str,
+    text_format_prompt_text: str,
+    request_id: str,
+    src_file: Path,
+    images: Iterable[PageImage],
+    output_bucket: str,
+    output_key: str,
+    text_pages: dict[int, str] | None = None,
+    blank_detector: BlankPageDetector | None = None,
+    image_store: PageImageStore | None = None,
+    image_policy: ImagePolicy | None = None,
+) -> tuple[BatchDocument, list[BatchRequest]]:
+    """Build the batch requests of a document's pages instead of OCRing them.
+
+    Pages are handled like ``ai_ocr`` handles them: blank pages get a placeholder, repeated pages reuse
+    the result of the page they duplicate, OCR cache hits are answered from the cache and, with
+    ``ocr_config.tile_pages``, oversized pages get one request per tile. ``text_pages`` are emitted as is
+    or get a formatting request depending on ``ocr_config.text_layer``. Batch requests hold one page
+    each and carry no prompt cache breakpoints.
+    """
+    text_pages = text_pages or {}
+    id_prefix = batch_job.next_id_prefix()
+    ocr_cache = build_ocr_cache(ocr_config, client=s3, default_bucket=output_bucket)
+    page_index = (
+        DuplicatePageIndex(
+            max_distance=ocr_config.dedupe_max_distance, max_diff_pixels=ocr_config.dedupe_max_diff_pixels
+        )
+        if ocr_config.dedupe_pages
+        else None
+    )
+    pages: dict[int, BatchPage] = {}
+    requests: list[BatchRequest] = []
+
+    def add_request(page: BatchPage, custom_id: str, messages: list) -> None:
+        page.custom_ids.append(custom_id)
+        requests.append(
+            BatchRequest(custom_id=custom_id, messages=messages, max_tokens=ocr_config.batch_job_max_tokens)
+        )
 
-    def process_image(image_data: tuple[Path, str]) -> tuple[int, str]:
-        image, suffix = image_data
-        page_num = int("".join([x for x in suffix if x.isdigit()]).lstrip("0") or 0)
-        text_file = output_path / (image.stem + f"-{llm_config.model_name}.md")
-        logger.info(f"Extracting text from image {page_num} of {len(images)}")
-        image_type = try_get_image_type(image)
-        image_base_64 = image_to_base64(image.read_bytes(), image_type)
-        chat = [
-            {"type": "text", "text": "Please extract all text from the following image into markdown."},
-            {
-                "type": "image_url",
-                "image_url": {"url": image_base_64},
-            },
+    def image_messages(image_bytes: bytes, image_type: Literal["jpeg", "png", "gif"], prompt: str) -> list:
+        image_base_64 = image_to_base64(image_bytes, image_type, policy=image_policy)
+        return [
+            ("system", system_prompt_text),
+            ("user", [{"type": "text", "text": prompt}, {"type": "image_url", "image_url": {"url": image_base_64}}]),
         ]
-        upload_done = False
+
+    def find_duplicate(image: PageImage, page_num: int) -> int | None:
+        if not page_index:
+            return None
         try:
-            response = model.invoke(
-                [system_prompt, ("user", chat)], config=llm_run_manager.get_runnable_config(model.name)
-            )  # type: ignore
-            content = str(response.content).strip().replace("```markdown", "").replace("```", "")
-            content += "\n\nPage # " + str(page_num) + "\n"
-            text_file.write_text(content, encoding="utf-8")
-
-            logger.info(f"Uploading {text_file} to {output_bucket}/{output_key}")
-            s3.upload_file(
-                str(text_file),
-                output_bucket,
-                f"{output_key}/{src_file.stem}{suffix.split('.')[0]}.md",
-            )
-            upload_done = True
-            return page_num, content
+            return page_index.find_duplicate(image, page_num)
         except Exception as e:  # pylint: disable=broad-except
-            logger.error(f"Error extracting text from image: {page_num}: {e}")
-            logger.exception(e)
-            if not upload_done:
-                s3.upload_file(
-                    str(f"Error extracting text from image: {page_num}: {e}"),
-                    output_bucket,
-                    f"{output_key}/{src_file.stem}{suffix.split('.')[0]}.md",
+            logger.warning(f"Duplicate check failed for page {page_num}: {e}")
+            return None
+
+    def cache_get(key: str, page_num: int) -> str | None:
+        if not ocr_cache:
+            return None
+        try:
+            entry = ocr_cache.get(key)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning(f"OCR cache lookup failed for page {page_num}: {e}")
+            return None
+        return entry["content"] if entry else None
+
+    for page_num, text in text_pages.items():
+        page = pages[page_num] = BatchPage(page_num=page_num)
+        if ocr_config.text_layer == TextLayerMode.FORMAT:
+            add_request(page, f"{id_prefix}-p{page_num}", [("system", text_format_prompt_text), ("user", text)])
+        else:
+            page.content = text
+
+    for image in images:
+        page_num = page_num_from_suffix(image.suffix)
+        page = pages[page_num] = BatchPage(page_num=page_num)
+        if blank_detector and blank_detector.is_blank_page(page_num):
+            page.content = BLANK_PAGE_PLACEHOLDER
+        elif (duplicate_of := find_duplicate(image, page_num)) is not None:
+            page.duplicate_of = duplicate_of
+        else:
+            image_bytes = image.read_bytes()
+            tiles: list[PageTile] = []
+            if ocr_config.tile_pages and image_policy:
+                with Image.open(io.BytesIO(image_bytes)) as img:
+                    if needs_tiling(img.width, img.height, image_policy, min_scale=ocr_config.tile_min_scale):
+                        tiles = split_page_tiles(
+                            img, image_policy, overlap=ocr_config.tile_overlap, max_tiles=ocr_config.tile_max_tiles
+                        )
+            for tile in tiles:
+                page.tiles.append([tile.row, tile.col])
+                add_request(
+                    page,
+                    f"{id_prefix}-p{page_num}-t{tile.row}-{tile.col}",
+                    image_messages(tile.data, "jpeg", TILE_OCR_USER_PROMPT),
                 )
-            return page_num, f"Error extracting text from image {page_num}: {e}"
+            if not tiles:
+                if ocr_cache:
+                    page.cache_key = make_ocr_cache_key(
+                        image_bytes, llm_config.model_name, system_prompt_text + OCR_USER_PROMPT
+                    )
+                    page.content = cache_get(page.cache_key, page_num)
+                if page.content is None:
+                    add_request(
+                        page, f"{id_prefix}-p{page_num}", image_messages(image_bytes, image.image_type, OCR_USER_PROMPT)
+                    )
+        # unique pages stay available for comparison with later pages
+        if image_store and not page_index:
+            image_store.release(image)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        results = list(executor.map(process_image, images))
+    document = BatchDocument(
+        request_id=request_id,
+        src_name=src_file.name,
+        output_bucket=output_bucket,
+        output_key=output_key,
+        pages=[pages[page_num] for page_num in sorted(pages)],
+    )
+    logger.info(f"Prepared {len(requests)} batch requests for {len(document.pages)} pages of {src_file}")
+    return document, requests
 
-    for page_num, content in sorted(results, key=lambda x: x[0]):
-        pages.append((page_num, content))
 
-    text_file = output_path / (pdf_path.stem + f"-{llm_config.model_name}.md")
-    text_file.write_text("\n\n".join([content for _, content in pages]), encoding="utf-8")
-    return text_file
+def write_batch_job_outputs(job: BatchJob, results: dict[str, BatchResult], ocr_config: OcrConfig) -> None:
+    """Write the per page and final markdown of every document of a batch job.
+
+    Results are assembled like ``ai_ocr`` assembles them: tiles are stitched, duplicate pages reuse the
+    markdown of the page they repeat and results are stored in the OCR cache. Pages whose requests are
+    missing from ``results`` or failed are written as errors.
+    """
+    llm_config = job.llm_config
+    usage = mk_usage_metadata()
+
+    for document in job.documents:
+        src_file = Path(document.src_name)
+        ocr_cache = build_ocr_cache(ocr_config, client=s3, default_bucket=document.output_bucket)
+        raw_pages: dict[int, str] = {}
+
+        def page_raw_content(page: BatchPage) -> str:
+            if page.content is not None:
+                return page.content
+            if page.duplicate_of is not None:
+                if page.duplicate_of not in raw_pages:
+                    raise ValueError(f"OCR of page {page.duplicate_of} it duplicates failed")
+                return raw_pages[page.duplicate_of]
+            texts: list[str] = []
+            for custom_id in page.custom_ids:
+                result = results.get(custom_id)
+                if not result or result.content is None:
+                    raise ValueError(result.error if result else "missing from the batch job results")
+                usage["input_tokens"] += result.input_tokens
+                usage["output_tokens"] += result.output_tokens
+                usage["successful_requests"] += 1
+                texts.append(result.content)
+            if page.tiles:
+                return stitch_tile_markdown([(row, col, text) for (row, col), text in zip(page.tiles, texts)])
+            if ocr_cache and page.cache_key:
+                try:
+                    ocr_cache.put(page.cache_key, {"content": texts[0], "model_name": llm_config.model_name})
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.warning(f"OCR cache store failed: {e}")
+            return texts[0]
+
+        contents: list[str] = []
+        for page in document.pages:
+            try:
+                raw_pages[page.page_num] = page_raw_content(page)
+                content = clean_ocr_content(raw_pages[page.page_num], page.page_num)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(f"Error extracting text from image: {page.page_num} of {src_file}: {e}")
+                content = f"Error extracting text from image {page.page_num}: {e}"
+            key = f"{document.output_key}/{src_file.stem}{page_suffix(page.page_num).split('.')[0]}.md"
+            s3.put_object(Bucket=document.output_bucket, Key=key, Body=content.encode("utf-8"))
+            contents.append(content)
+
+        logger.info(f"Uploading {src_file.stem}-final.md to s3://{document.output_bucket}/{document.output_key}")
+        s3.put_object(
+            Bucket=document.output_bucket,
+            Key=f"{document.output_key}/{src_file.stem}-final.md",
+            Body="\n\n".join(contents).encode("utf-8"),
+        )
+
+    cost = get_api_call_cost(llm_config, usage, batch_pricing=True)
+    logger.info(
+        f"Batch job {job.name}: {usage['successful_requests']} results for {len(job.documents)} documents, "
+        f"cost ${cost:.4f} at batch pricing",
+        extra={"batch_job_usage": usage | {"cost": cost}},
+    )
+
+
+def submit_batch_job(batch_job: BatchJobBuilder, ocr_config: OcrConfig) -> BatchJob | None:
+    """Submit the page requests collected in a builder as one batch job and store its manifest.
+
+    The manifest goes to ``ocr_config.batch_job_bucket``, the bucket ``collect_batch_jobs`` polls.
+    Documents are written right away if none of their pages need a request.
+
+    Returns:
+        BatchJob | None: Manifest of the job, None if the builder holds no documents
+
+    Raises:
+        ValueError: If ocr_config.batch_job_bucket is not set
+    """
+    if not ocr_config.batch_job_bucket:
+        raise ValueError("Batch inference needs BATCH_JOB_BUCKET, the bucket pending batch jobs are collected from")
+    if not batch_job.documents or not batch_job.llm_config:
+        return None
+    llm_config = batch_job.llm_config
+    bucket = ocr_config.batch_job_bucket
+    job = BatchJob(
+        name=batch_job.name,
+        backend=ocr_config.batch_inference,
+        provider=llm_config.provider,
+        model_name=llm_config.model_name,
+        base_url=llm_config.base_url,
+        submitted_at=time.time(),
+        documents=batch_job.documents,
+    )
+    if not batch_job.requests:
+        logger.info(f"Every page of batch job {job.name} is already known, writing its outputs")
+        write_batch_job_outputs(job, {}, ocr_config)
+        return job
+
+    endpoint = build_batch_endpoint(job.backend, ocr_config, llm_config, client=s3, bucket=bucket)
+    job.job_id = endpoint.submit(batch_job.requests, job_name=job.name)
+    s3.put_object(
+        Bucket=bucket,
+        Key=manifest_key(ocr_config, "pending", job.name),
+        Body=job.to_json(),
+        ContentType="application/json",
+    )
+    logger.info(
+        f"Submitted batch job {job.name} ({job.job_id}) with {len(batch_job.requests)} requests "
+        f"for {len(job.documents)} documents"
+    )
+    return job
+
+
+def collect_batch_jobs(*, bucket: str, ocr_config: OcrConfig | None = None) -> list[BatchJob]:
+    """Write the outputs of every pending batch job that has ended.
+
+    Jobs still running stay pending for the next poll. The pages of a failed job are written as errors,
+    like pages whose OCR failed in an online run. The manifests of collected jobs are moved to ``done/``.
+    A pending manifest whose job already has a ``done/`` manifest was collected by an earlier poll that
+    could not remove it, it is removed without writing the outputs again, which would send the documents
+    downstream twice.
+
+    Args:
+        bucket: Bucket the batch job manifests are stored in
+        ocr_config: Pipeline config, the batch job prefix, local endpoint directory and OCR cache are taken from it
+
+    Returns:
+        list[BatchJob]: Jobs whose outputs were written
+    """
+    if not ocr_config:
+        ocr_config = OcrConfig()
+    collected: list[BatchJob] = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for listing in paginator.paginate(Bucket=bucket, Prefix=manifest_prefix(ocr_config, "pending")):
+        for item in listing.get("Contents", []):
+            job = BatchJob.from_json(s3.get_object(Bucket=bucket, Key=item["Key"])["Body"].read())
+            if object_exists(bucket, manifest_key(ocr_config, "done", job.name)):
+                logger.warning(f"Batch job {job.name} was already collected, removing its pending manifest")
+                s3.delete_object(Bucket=bucket, Key=item["Key"])
+                continue
+            endpoint = build_batch_endpoint(job.backend, ocr_config, job.llm_config, client=s3, bucket=bucket)
+            state = endpoint.state(job.job_id or "")
+            if state == BatchJobState.IN_PROGRESS:
+                logger.info(f"Batch job {job.name} ({job.job_id}) is still running")
+                continue
+            results: dict[str, BatchResult] = {}
+            if state == BatchJobState.FAILED:
+                logger.error(f"Batch job {job.name} ({job.job_id}) failed")
+            else:
+                results = {result.custom_id: result for result in endpoint.results(job.job_id or "")}
+            logger.info(f"Collecting {len(results)} results of batch job {job.name}")
+            write_batch_job_outputs(job, results, ocr_config)
+            s3.put_object(
+                Bucket=bucket,
+                Key=manifest_key(ocr_config, "done", job.name),
+                Body=job.to_json(),
+                ContentType="application/json",
+            )
+            s3.delete_object(Bucket=bucket, Key=item["Key"])
+            collected.append(job)
+    return collected
+
+
+def object_exists(bucket: str, key: str) -> bool:
+    """Check if an object exists in the bucket."""
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return False
+        raise
+    return True
+
+
+def write_bundle(
+    bundle: PageBundleWriter,
+    *,
+    summary: OcrRunSummary,
+    llm_config: LlmConfig,
+    source_key: str,
+    final_key: str,
+    output_bucket: str,
+    output_key: str,
+    src_file: Path,
+) -> None:
+    """Upload a document's bundle and then its manifest, which lists each page's byte ranges, status and usage."""
+    bundle.close()
+    bundle_key = f"{output_key}/{src_file.stem}-bundle.bin"
+    manifest_key = f"{output_key}/{src_file.stem}-manifest.json"
+    logger.info(f"Uploading {bundle.size} byte bundle to s3://{output_bucket}/{bundle_key}")
+    s3.upload_file(bundle.path, output_bucket, bundle_key)
+    manifest = bundle.manifest(
+        bundle_key=bundle_key,
+        pages=summary.page_details(),
+        source=source_key,
+        final=final_key,
+        provider=llm_config.provider.value,
+        model=llm_config.model_name,
+        page_count=summary.pages,
+        summary=summary.to_json(),
+    )
+    logger.info(f"Uploading manifest to s3://{output_bucket}/{manifest_key}")
+    s3.put_object(
+        Bucket=output_bucket,
+        Key=manifest_key,
+        Body=json.dumps(manifest, option=json.OPT_NON_STR_KEYS),
+        ContentType="application/json",
+    )
+
+
+def log_input_metrics(summary: OcrRunSummary, disk_usage: DiskUsageTracker) -> None:
+    """Record the peak disk usage in the summary and log the input metrics of the run."""
+    summary.peak_disk_bytes = disk_usage.peak_bytes
+    logger.info(
+        f"Input {summary.input_bytes / 1024 / 1024:.1f} MB downloaded in {summary.input_seconds:.2f}s, "
+        f"first page image after {summary.first_page_seconds:.2f}s, "
+        f"peak disk usage {summary.peak_disk_bytes / 1024 / 1024:.1f} MB"
+    )
 
 
 # pylint: disable=too-many-arguments,too-many-branches, too-many-positional-arguments
@@ -139,8 +908,22 @@ def main(
     input_key: str,
     output_bucket: str,
     output_key: str,
+    ocr_config: OcrConfig | None = None,
+    deadline: float | None = None,
+    batch_job: BatchJobBuilder | None = None,
 ) -> None:
-    """OCR files using AI."""
+    """OCR files using AI.
+
+    ``deadline`` is the time.monotonic() timestamp the invocation must finish by, such as the Lambda timeout.
+    With ``ocr_config.batch_inference`` the page requests are added to ``batch_job`` instead of being sent,
+    the caller submits it with ``submit_batch_job`` once every document is added. Without a ``batch_job``
+    the document is submitted as a batch job of its own. The source document is archived next to the outputs
+    with a server side copy that runs while the document is OCRed.
+    With ``ocr_config.input_streaming`` page 1 of a pdf linearized for fast web view is OCRed while the rest
+    of it downloads. The source download, time to the first page image and peak disk usage are reported in
+    the run summary.
+    """
+    run_start_time = time.monotonic()
 
     # convert zero to None so default will be used
     if not max_workers:
@@ -149,15 +932,18 @@ def main(
     if not model:
         model = provider_vision_models[ai_provider]
 
-    if ai_provider not in [LlmProvider.BEDROCK]:
-        key_name = provider_env_key_names[ai_provider]
-        if not os.environ.get(key_name):
-            raise ValueError(f"{key_name} environment variable not set.")
+    if not ocr_config:
+        ocr_config = OcrConfig()
+
+    check_provider_api_key(ai_provider)
+    if ocr_config.batch_inference != BatchInferenceBackend.NONE and not ocr_config.batch_job_bucket:
+        raise ValueError("Batch inference needs BATCH_JOB_BUCKET, the bucket pending batch jobs are collected from")
 
     llm_config = LlmConfig(provider=ai_provider, model_name=model, base_url=ai_base_url, temperature=0)
 
     # Set output path
     output_path = Path(tempfile.mkdtemp(suffix="inbox_container"))
+    disk_usage = DiskUsageTracker(output_path)
 
     # config summary info
     logger.info(
@@ -172,6 +958,9 @@ def main(
             f"AI Provider Base URL:{ai_base_url or 'default'}",
             f"System Prompt: {system_prompt_file_default.name}",
             f"Pricing: {pricing}",
+            f"Render Workers: {ocr_config.effective_render_workers}",
+            f"OCR Engine: {ocr_config.engine}",
+            f"Batch Inference: {ocr_config.batch_inference}",
         ]
     )
 
@@ -187,42 +976,218 @@ def main(
     temp_file = tempfile.NamedTemporaryFile(dir=output_path, suffix=input_ext, delete=False)
     input_file = Path(temp_file.name)
 
-    logger.info(f"Downloading file from s3 {input_bucket}/{input_key} to {input_file}")
-    s3.download_file(input_bucket, input_key, input_file)
-    logger.info(f"Uploading {src_file.name} to s3://{output_bucket}/{output_key}")
-    s3.upload_file(input_file, output_bucket, f"{output_key}/{src_file.name}")
-
-    if input_ext == ".pdf":
-        image_files = convert_pdf_to_images(src_file=src_file, pdf_path=input_file, output_path=output_path)
-    elif input_ext in {".jpg", ".jpeg", ".png"}:
-        image_files = [(input_file, input_file.suffix)]
-    else:
-        raise Exception(f"Input file {input_file} has an unsupported extension. Only pdf, jpg, and png are supported.")
-
-    logger.info(f"Uploading {len(image_files)} to s3://{output_bucket}/{output_key}")
-    for image_file, suffix in image_files:
-        s3.upload_file(image_file, output_bucket, f"{output_key}/{src_file.stem}{suffix}")
-
-    with get_parai_callback(show_pricing=pricing):
-        start_time = time.time()
-        markdown_file = ai_ocr(
-            max_workers=max_workers,
-            llm_config=llm_config,
-            system_prompt_text=system_prompt_file_default.read_text(encoding="utf-8"),
+    transfers = S3Transfers(s3, max_workers=ocr_config.upload_concurrency, max_pending=ocr_config.upload_queue_size)
+    download = ProgressiveDownload(
+        s3,
+        input_bucket,
+        input_key,
+        input_file,
+        part_size=ocr_config.input_part_size_mb * 1024 * 1024,
+        max_concurrency=ocr_config.input_concurrency,
+        reserve_bytes=ocr_config.input_reserve_mb * 1024 * 1024,
+    )
+    bundle: PageBundleWriter | None = None
+    try:
+        logger.info(f"Copying {src_file.name} to s3://{output_bucket}/{output_key}")
+        transfers.copy(input_bucket, input_key, output_bucket, f"{output_key}/{src_file.name}")
+
+        logger.info(f"Downloading file from s3 {input_bucket}/{input_key} to {input_file}")
+        summary = OcrRunSummary()
+        download.start()
+        linearization = (
+            streamable_linearization(download, ocr_config)
+            if input_ext == ".pdf" and ocr_config.input_streaming
+            else None
+        )
+        if not linearization:
+            record_input_download(summary, download.wait())
+            disk_usage.sample()
+
+        blank_detector = (
+            BlankPageDetector(
+                ink_threshold=ocr_config.blank_ink_threshold,
+                max_ink_ratio=ocr_config.blank_max_ink_ratio,
+                max_stddev=ocr_config.blank_max_stddev,
+            )
+            if ocr_config.skip_blank_pages
+            else None
+        )
+        image_store = PageImageStore(
+            spill_dir=output_path / "pages", max_memory_bytes=ocr_config.max_image_memory_mb * 1024 * 1024
+        )
+        image_policy = get_image_policy(
+            ai_provider,
+            model,
+            target_tokens=ocr_config.image_target_tokens,
+            grayscale=ocr_config.image_grayscale,
+            jpeg_quality=ocr_config.image_jpeg_quality,
+        )
+        logger.info(f"Image policy: {image_policy}")
+        image_files: Iterable[PageImage]
+        text_pages: dict[int, str] = {}
+        if linearization:
+            page_count = linearization.page_count
+            image_files = stream_pdf_images(
+                download=download,
+                linearization=linearization,
+                summary=summary,
+                disk_usage=disk_usage,
+                src_file=src_file,
+                image_store=image_store,
+                render_workers=ocr_config.effective_render_workers,
+                chunk_size=ocr_config.render_chunk_size,
+                blank_detector=blank_detector,
+                image_policy=image_policy,
+            )
+        elif input_ext == ".pdf":
+            page_count = get_pdf_page_count(input_file)
+            if ocr_config.text_layer != TextLayerMode.OFF:
+                text_pages = find_text_pages(
+                    input_file, min_chars=ocr_config.text_min_chars, min_quality=ocr_config.text_min_quality
+                )
+            tiled_pages: set[int] = set()
+            if ocr_config.tile_pages:
+                tiled_pages = find_oversized_pages(
+                    input_file,
+                    page_count,
+                    image_policy,
+                    dpi=ocr_config.tile_dpi,
+                    min_scale=ocr_config.tile_min_scale,
+                )
+            image_files = convert_pdf_to_images(
+                src_file=src_file,
+                pdf_path=input_file,
+                image_store=image_store,
+                page_count=page_count,
+                pages=[page_num for page_num in range(1, page_count + 1) if page_num not in text_pages],
+                render_workers=ocr_config.effective_render_workers,
+                chunk_size=ocr_config.render_chunk_size,
+                blank_detector=blank_detector,
+                image_policy=image_policy,
+                tiled_pages=tiled_pages - text_pages.keys(),
+                tile_dpi=ocr_config.tile_dpi,
+            )
+        elif input_ext in {".jpg", ".jpeg", ".png"}:
+            page_count = 1
+            image_files = [PageImage(name=input_file.stem, suffix=input_file.suffix, path=input_file)]
+        else:
+            raise Exception(
+                f"Input file {input_file} has an unsupported extension. Only pdf, jpg, and png are supported."
+            )
+
+        logger.info(
+            f"Uploading {page_count - len(text_pages)} page images to s3://{output_bucket}/{output_key} "
+            "in the background as they are rendered"
+        )
+        bundle = (
+            PageBundleWriter(output_path / f"{src_file.stem}-bundle.bin")
+            if ocr_config.output_format == OutputFormat.BUNDLE
+            and ocr_config.batch_inference == BatchInferenceBackend.NONE
+            else None
+        )
+        image_files = upload_page_images(
+            images=track_page_images(image_files, summary=summary, disk_usage=disk_usage, start_time=run_start_time),
             src_file=src_file,
-            pdf_path=input_file,
-            images=image_files,
-            output_path=output_path,
             output_bucket=output_bucket,
             output_key=output_key,
+            transfers=transfers,
+            bundle=bundle,
         )
-        end_time = time.time()
 
-    logger.info(
-        f"Total time: {end_time - start_time:.1f}s Pages per second: {len(image_files) / (end_time - start_time):.2f}"
-    )
+        if ocr_config.batch_inference != BatchInferenceBackend.NONE:
+            submit_own_job = batch_job is None
+            if batch_job is None:
+                batch_job = BatchJobBuilder()
+            document, requests = prepare_batch_document(
+                batch_job=batch_job,
+                llm_config=llm_config,
+                ocr_config=ocr_config,
+                system_prompt_text=system_prompt_file_default.read_text(encoding="utf-8"),
+                text_format_prompt_text=text_format_prompt_file_default.read_text(encoding="utf-8"),
+                request_id=request_id,
+                src_file=src_file,
+                images=image_files,
+                output_bucket=output_bucket,
+                output_key=output_key,
+                text_pages=text_pages,
+                blank_detector=blank_detector,
+                image_store=image_store,
+                image_policy=image_policy,
+            )
+            disk_usage.sample()
+            image_store.clear()
+            batch_job.add_document(document, requests, llm_config)
+            if submit_own_job:
+                submit_batch_job(batch_job, ocr_config)
+            transfers.close()
+            log_input_metrics(summary, disk_usage)
+            return
+
+        with get_parai_callback(show_pricing=pricing):
+            start_time = time.time()
+            markdown_file = ai_ocr(
+                max_workers=max_workers,
+                llm_config=llm_config,
+                ocr_config=ocr_config,
+                system_prompt_text=system_prompt_file_default.read_text(encoding="utf-8"),
+                src_file=src_file,
+                pdf_path=input_file,
+                images=image_files,
+                page_count=page_count,
+                output_path=output_path,
+                output_bucket=output_bucket,
+                output_key=output_key,
+                deadline=deadline,
+                blank_detector=blank_detector,
+                text_pages=text_pages,
+                text_format_prompt_text=text_format_prompt_file_default.read_text(encoding="utf-8"),
+                image_store=image_store,
+                image_policy=image_policy,
+                summary=summary,
+                provider_pool=build_provider_pool(llm_config, ocr_config) if ocr_config.provider_pool else None,
+                bundle=bundle,
+            )
+            end_time = time.time()
 
-    logger.info(f"Output file: {markdown_file.absolute()}")
+        disk_usage.sample()
+        if image_store.spilled:
+            logger.info(f"Spilled {image_store.spilled} page images to disk")
+        image_store.clear()
+        summary.seconds = end_time - start_time
+        log_input_metrics(summary, disk_usage)
+        logger.info(
+            f"Total time: {end_time - start_time:.1f}s Pages per second: {page_count / (end_time - start_time):.2f}"
+        )
+        logger.info(
+            f"OCR run summary: {len(summary.ocr_pages)} OCRed, {len(summary.text_pages)} from text layer, "
+            f"{len(summary.blank_pages)} blank, {len(summary.tiled_pages)} tiled, "
+            f"{len(summary.batched_pages)} batched in {summary.batch_requests} requests, "
+            f"{len(summary.duplicate_pages)} duplicate, {len(summary.error_pages)} failed of {summary.pages} pages",
+            extra={"ocr_summary": summary.to_json()},
+        )
+
+        transfers.close()
+        if bundle:
+            # the final markdown triggers downstream processing, so the bundle and its manifest go first
+            write_bundle(
+                bundle,
+                summary=summary,
+                llm_config=llm_config,
+                source_key=f"{output_key}/{src_file.name}",
+                final_key=f"{output_key}/{src_file.stem}-final.md",
+                output_bucket=output_bucket,
+                output_key=output_key,
+                src_file=src_file,
+            )
+        logger.info(f"Output file: {markdown_file.absolute()}")
 
-    logger.info(f"Uploading {markdown_file.name} to s3://{output_bucket}/{output_key}/{src_file.stem}-final.md")
-    s3.upload_file(markdown_file, output_bucket, f"{output_key}/{src_file.stem}-final.md")
+        logger.info(f"Uploading {markdown_file.name} to s3://{output_bucket}/{output_key}/{src_file.stem}-final.md")
+        s3.upload_file(markdown_file, output_bucket, f"{output_key}/{src_file.stem}-final.md")
+    except BaseException:
+        # stop the upload threads so they do not outlive a failed run in a warm container
+        transfers.abort()
+        raise
+    finally:
+        download.close()
+        if bundle:
+            bundle.close()
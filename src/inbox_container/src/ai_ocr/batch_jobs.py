@@ -0,0 +1,194 @@
+"""Offline OCR of documents through provider batch APIs.
+
+Re-processing a backlog does not need low latency, and batch APIs bill at half the
+on-demand price. With ``OcrConfig.batch_inference`` set, ``main`` renders a document
+as usual but instead of calling the model it adds one request per page, or per tile
+of an oversized page, to a ``BatchJobBuilder``. Several documents, such as every
+record of an SQS event, can share a builder so they go out as one batch job.
+
+Submitting the job stores a ``BatchJob`` manifest under ``pending/`` of the batch job
+prefix. It records for every page where its markdown comes from: the result of a
+request, a result already known when the job was submitted (blank placeholder,
+text layer or OCR cache hit), or the result of the page it duplicates.
+``collect_batch_jobs`` polls the pending jobs and writes the same per page and
+``-final.md`` outputs as an online run for every job that ended, then moves the
+manifest to ``done/``.
+"""
+
+from __future__ import annotations
+
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+import orjson as json
+
+from ai_ocr.lib.par_ai_core.llm_batch_api import (
+    BatchEndpoint,
+    BatchRequest,
+    LocalBatchEndpoint,
+    provider_batch_endpoint,
+)
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+from ai_ocr.ocr_config import BatchInferenceBackend, OcrConfig
+
+
+@dataclass
+class BatchPage:
+    """Where the markdown of a page of a batched document comes from."""
+
+    page_num: int
+    """Page number in the document."""
+    content: str | None = None
+    """Raw markdown known when the job was submitted, such as a blank page placeholder or a cache hit."""
+    custom_ids: list[str] = field(default_factory=list)
+    """Requests whose results make up the page, one per tile for tiled pages."""
+    tiles: list[list[int]] = field(default_factory=list)
+    """Row and column of each request of a tiled page."""
+    duplicate_of: int | None = None
+    """Earlier page of the document whose markdown the page reuses."""
+    cache_key: str | None = None
+    """OCR cache key the result of the page is stored under."""
+
+
+@dataclass
+class BatchDocument:
+    """Document whose pages are OCRed by a batch job."""
+
+    request_id: str
+    """Request the document was submitted by."""
+    src_name: str
+    """File name of the document."""
+    output_bucket: str
+    """Bucket the outputs are written to."""
+    output_key: str
+    """Key prefix the outputs are written under."""
+    pages: list[BatchPage] = field(default_factory=list)
+    """Every page of the document in page order."""
+
+
+@dataclass
+class BatchJob:
+    """Manifest of a submitted batch job."""
+
+    name: str
+    """Job name, also the manifest file name."""
+    backend: BatchInferenceBackend
+    """Endpoint the job was submitted to."""
+    provider: LlmProvider
+    """AI provider of the model."""
+    model_name: str
+    """Model the requests are sent to."""
+    base_url: str | None = None
+    """Base url of the provider api."""
+    job_id: str | None = None
+    """Id of the job at the endpoint, None if every page was known when submitting."""
+    submitted_at: float = 0.0
+    """Unix timestamp the job was submitted at."""
+    documents: list[BatchDocument] = field(default_factory=list)
+    """Documents OCRed by the job."""
+
+    @property
+    def llm_config(self) -> LlmConfig:
+        """Config of the model the requests are sent to."""
+        return LlmConfig(provider=self.provider, model_name=self.model_name, base_url=self.base_url, temperature=0)
+
+    def to_json(self) -> bytes:
+        """Serialize the manifest."""
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, data: bytes) -> BatchJob:
+        """Load a manifest."""
+        values: dict[str, Any] = json.loads(data)
+        documents = [
+            BatchDocument(**(document | {"pages": [BatchPage(**page) for page in document["pages"]]}))
+            for document in values.pop("documents")
+        ]
+        return cls(
+            **(
+                values
+                | {
+                    "backend": BatchInferenceBackend(values["backend"]),
+                    "provider": LlmProvider(values["provider"]),
+                    "documents": documents,
+                }
+            )
+        )
+
+
+class BatchJobBuilder:
+    """Collects the page requests of one or more documents into one batch job.
+
+    Every document of a job must use the same model.
+
+    Attributes:
+        name: Job name
+        llm_config: Config of the model the requests are sent to, set by the first document
+        documents: Documents added so far
+        requests: Page requests added so far
+    """
+
+    def __init__(self, name: str | None = None) -> None:
+        self.name = name or f"ocr-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.llm_config: LlmConfig | None = None
+        self.documents: list[BatchDocument] = []
+        self.requests: list[BatchRequest] = []
+
+    def next_id_prefix(self) -> str:
+        """Prefix that keeps the request ids of the next document unique within the job."""
+        return f"d{len(self.documents)}"
+
+    def add_document(self, document: BatchDocument, requests: list[BatchRequest], llm_config: LlmConfig) -> None:
+        """Add a document and the requests of its pages."""
+        if self.llm_config and (self.llm_config.provider, self.llm_config.model_name) != (
+            llm_config.provider,
+            llm_config.model_name,
+        ):
+            raise ValueError(
+                f"Batch job {self.name} sends requests to {self.llm_config.model_name}, not {llm_config.model_name}"
+            )
+        self.llm_config = llm_config
+        self.documents.append(document)
+        self.requests.extend(requests)
+
+
+def manifest_prefix(ocr_config: OcrConfig, state: str) -> str:
+    """Get the key prefix of the pending or done batch job manifests."""
+    return f"{ocr_config.batch_job_prefix.strip('/')}/{state}/"
+
+
+def manifest_key(ocr_config: OcrConfig, state: str, name: str) -> str:
+    """Get the key of a batch job manifest in the pending or done folder."""
+    return f"{manifest_prefix(ocr_config, state)}{name}.json"
+
+
+def build_batch_endpoint(
+    backend: BatchInferenceBackend, ocr_config: OcrConfig, llm_config: LlmConfig, *, client: Any, bucket: str
+) -> BatchEndpoint:
+    """Create the batch endpoint a job is submitted to.
+
+    Args:
+        backend: Endpoint selected for the job
+        ocr_config: Pipeline config
+        llm_config: Config of the model the requests are sent to
+        client: S3 client used to stage Bedrock job files
+        bucket: Bucket Bedrock job files are staged in
+
+    Returns:
+        BatchEndpoint: Endpoint of the job
+    """
+    if backend == BatchInferenceBackend.LOCAL:
+        return LocalBatchEndpoint(Path(ocr_config.batch_job_dir), llm_config)
+    if backend == BatchInferenceBackend.PROVIDER:
+        return provider_batch_endpoint(
+            llm_config,
+            s3_client=client,
+            bucket=bucket,
+            prefix=f"{ocr_config.batch_job_prefix.strip('/')}/jobs",
+            role_arn=ocr_config.batch_job_role_arn,
+        )
+    raise ValueError("Batch inference is disabled")
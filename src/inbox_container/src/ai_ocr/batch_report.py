@@ -0,0 +1,179 @@
+"""Compare the cost and latency of OCRing sample pdfs with different page batch sizes.
+
+Each page of each sample pdf is rendered once with the model's image policy. For
+every batch size the pages are sent in order, batch size pages per request, one
+request at a time so the latency per request is not skewed by throttling. Pages
+missing from a batched response are OCRed again one page per request and counted
+as fallbacks, like ``ai_ocr`` does. For pdfs with an embedded text layer the
+output is also scored against it.
+
+Usage:
+    python -m ai_ocr.batch_report docs/pdf-text-normal.pdf --provider Bedrock --batch-pages 1 2 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from langchain_core.messages import BaseMessage
+from pdf2image import convert_from_path
+from rich.console import Console
+from rich.table import Table
+
+from ai_ocr.__main__ import system_prompt_file_default
+from ai_ocr.image_policy_report import ocr_accuracy
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig
+from ai_ocr.lib.par_ai_core.llm_image_policy import get_image_policy
+from ai_ocr.lib.par_ai_core.llm_image_utils import image_to_base64
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider, provider_vision_models
+from ai_ocr.lib.par_ai_core.pricing_lookup import get_api_call_cost, mk_usage_metadata
+from ai_ocr.ocr_engine import OCR_USER_PROMPT
+from ai_ocr.page_batches import PageBatcher, build_batch_content, is_truncated, split_batch_response
+from ai_ocr.text_layer import extract_text_layer
+
+
+@dataclass
+class SamplePage:
+    """Rendered sample page."""
+
+    page_num: int
+    """Page number across all sample pdfs."""
+    image_url: str
+    """Base64 data url of the encoded page image."""
+    image_tokens: int
+    """Estimated input tokens of the page image."""
+    reference: str
+    """Embedded text of the page, empty for scanned pages."""
+
+
+@dataclass
+class BatchReport:
+    """Results of one batch size over the sample pages."""
+
+    batch_pages: int
+    """Max pages per request."""
+    pages: int = 0
+    """Number of pages OCRed."""
+    requests: int = 0
+    """Number of model requests including fallbacks."""
+    fallback_pages: int = 0
+    """Pages missing from a batched response and OCRed again one page per request."""
+    seconds: float = 0.0
+    """Total time spent waiting on requests."""
+    cost: float = 0.0
+    """Total cost of the requests."""
+    accuracy: float = 0.0
+    """Sum of the per page accuracy of pages with an embedded text layer."""
+    scored_pages: int = 0
+    """Number of pages with an embedded text layer."""
+
+
+def load_sample_pages(llm_config: LlmConfig, pdf_paths: list[Path]) -> list[SamplePage]:
+    """Render every page of the sample pdfs with the model's image policy."""
+    policy = get_image_policy(llm_config.provider, llm_config.model_name)
+    pages: list[SamplePage] = []
+    for pdf_path in pdf_paths:
+        references = extract_text_layer(pdf_path)
+        for index, image in enumerate(convert_from_path(pdf_path, **policy.render_kwargs())):
+            image_bytes = policy.encode(image)
+            reference = references[index] if index < len(references) else ""
+            pages.append(
+                SamplePage(
+                    page_num=len(pages) + 1,
+                    image_url=image_to_base64(image_bytes, "jpeg"),
+                    image_tokens=policy.estimate_tokens(image.width, image.height),
+                    reference=reference,
+                )
+            )
+            image.close()
+    return pages
+
+
+def evaluate_batch_size(
+    *, llm_config: LlmConfig, system_prompt_text: str, batch_pages: int, max_tokens: int, pages: list[SamplePage]
+) -> BatchReport:
+    """OCR the sample pages batch_pages pages per request and measure cost and latency."""
+    model = llm_config.build_chat_model()
+    report = BatchReport(batch_pages=batch_pages)
+
+    def invoke(content: str | list) -> BaseMessage:
+        start = time.monotonic()
+        response = model.invoke([("system", system_prompt_text), ("user", content)])
+        report.seconds += time.monotonic() - start
+        report.requests += 1
+        usage = mk_usage_metadata()
+        usage.update(getattr(response, "usage_metadata", None) or {})
+        report.cost += get_api_call_cost(llm_config, usage)
+        return response
+
+    batcher: PageBatcher[SamplePage] = PageBatcher(max_pages=batch_pages, max_tokens=max_tokens)
+    batches = [batch for page in pages for batch in batcher.add(page, page.image_tokens)]
+    batches.append(batcher.flush())
+    for batch in batches:
+        sections: dict[int, str] = {}
+        if len(batch) > 1:
+            response = invoke(build_batch_content([(page.page_num, page.image_url) for page in batch]))
+            sections = split_batch_response(str(response.content), [page.page_num for page in batch])
+            if sections and is_truncated(response):
+                sections.pop(next(reversed(sections)))
+        for page in batch:
+            if page.page_num not in sections:
+                if len(batch) > 1:
+                    report.fallback_pages += 1
+                response = invoke(
+                    [
+                        {"type": "text", "text": OCR_USER_PROMPT},
+                        {"type": "image_url", "image_url": {"url": page.image_url}},
+                    ]
+                )
+                sections[page.page_num] = str(response.content)
+            report.pages += 1
+            if page.reference.strip():
+                report.accuracy += ocr_accuracy(page.reference, sections[page.page_num])
+                report.scored_pages += 1
+    return report
+
+
+def main() -> None:
+    """Print a table comparing page batch sizes on sample pdfs."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+", type=Path, help="sample pdfs")
+    parser.add_argument("--provider", type=LlmProvider, default=LlmProvider.BEDROCK, help="AI provider")
+    parser.add_argument("--model", help="vision model, defaults to the provider's vision model")
+    parser.add_argument("--batch-pages", type=int, nargs="+", default=[1, 2, 4], help="pages per request")
+    parser.add_argument("--max-tokens", type=int, default=8000, help="max estimated input tokens per request")
+    args = parser.parse_args()
+
+    model_name = args.model or provider_vision_models[args.provider]
+    llm_config = LlmConfig(provider=args.provider, model_name=model_name, temperature=0)
+    system_prompt_text = system_prompt_file_default.read_text(encoding="utf-8")
+    pages = load_sample_pages(llm_config, args.pdfs)
+
+    table = Table(title=f"Page batching for {model_name} over {len(pages)} pages")
+    for column in ("Pages / request", "Requests", "Fallback pages", "Seconds / page", "Cost / page", "Accuracy"):
+        table.add_column(column, justify="right")
+    for batch_pages in args.batch_pages:
+        report = evaluate_batch_size(
+            llm_config=llm_config,
+            system_prompt_text=system_prompt_text,
+            batch_pages=batch_pages,
+            max_tokens=args.max_tokens,
+            pages=pages,
+        )
+        page_total = max(report.pages, 1)
+        table.add_row(
+            str(batch_pages),
+            str(report.requests),
+            str(report.fallback_pages),
+            f"{report.seconds / page_total:.2f}",
+            f"${report.cost / page_total:.5f}",
+            f"{report.accuracy / report.scored_pages:.3f}" if report.scored_pages else "-",
+        )
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Detection of blank pages during rasterization.
+
+Blank backs of double-sided scans cost a full page of image tokens for no text.
+``BlankPageDetector`` classifies each rendered page from pixel statistics of a
+downsampled grayscale copy so blank pages can be skipped without a model call:
+
+- ink ratio: fraction of pixels darker than ``ink_threshold``. Scanner noise and
+  show-through from the other side of the sheet are lighter than printed text.
+- standard deviation: catches pages with faint content that has no dark pixels.
+
+A page is blank only if both are under their limits.
+"""
+
+from __future__ import annotations
+
+import threading
+
+from PIL import Image, ImageStat
+
+BLANK_PAGE_PLACEHOLDER = "_(blank page)_"
+"""Content written for a page skipped as blank."""
+
+
+class BlankPageDetector:
+    """Classifies rendered pages as blank and records which pages were.
+
+    Safe to use from several render threads.
+
+    Attributes:
+        ink_threshold: Grayscale value below which a pixel counts as ink
+        max_ink_ratio: Max fraction of ink pixels for a blank page
+        max_stddev: Max grayscale standard deviation for a blank page
+        sample_size: Long edge in pixels of the downsampled copy the statistics are computed on
+    """
+
+    def __init__(
+        self,
+        *,
+        ink_threshold: int = 128,
+        max_ink_ratio: float = 0.00005,
+        max_stddev: float = 12.0,
+        sample_size: int = 512,
+    ) -> None:
+        self.ink_threshold = ink_threshold
+        self.max_ink_ratio = max_ink_ratio
+        self.max_stddev = max_stddev
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._blank_pages: set[int] = set()
+
+    def is_blank(self, image: Image.Image) -> bool:
+        """Check if an image is blank."""
+        sample = image.convert("L")
+        sample.thumbnail((self.sample_size, self.sample_size), Image.Resampling.BILINEAR)
+        histogram = sample.histogram()
+        ink_ratio = sum(histogram[: self.ink_threshold]) / (sample.width * sample.height)
+        if ink_ratio > self.max_ink_ratio:
+            return False
+        return ImageStat.Stat(sample).stddev[0] <= self.max_stddev
+
+    def check_page(self, image: Image.Image, page_num: int) -> bool:
+        """Classify a rendered page and remember it if it is blank.
+
+        Args:
+            image: Rendered page
+            page_num: Page number
+
+        Returns:
+            bool: True if the page is blank
+        """
+        if not self.is_blank(image):
+            return False
+        with self._lock:
+            self._blank_pages.add(page_num)
+        return True
+
+    def is_blank_page(self, page_num: int) -> bool:
+        """Check if a page already passed to ``check_page`` was blank."""
+        with self._lock:
+            return page_num in self._blank_pages
+
+    @property
+    def blank_pages(self) -> list[int]:
+        """Sorted page numbers of the blank pages found so far."""
+        with self._lock:
+            return sorted(self._blank_pages)
@@ -0,0 +1,148 @@
+"""Measure the token, size and accuracy trade-off of image policies on sample pdfs.
+
+Each page of each sample pdf is rendered and encoded with every policy variant,
+OCRed with the vision model and compared with the page's embedded text layer, so
+the samples must be born-digital pdfs such as docs/pdf-text-normal.pdf. Accuracy
+is the word level similarity between the OCR output and the embedded text.
+
+Usage:
+    python -m ai_ocr.image_policy_report docs/pdf-text-normal.pdf --provider Bedrock --target-tokens 0 1200 800
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from pathlib import Path
+
+from pdf2image import convert_from_path
+from rich.console import Console
+from rich.table import Table
+
+from ai_ocr.__main__ import system_prompt_file_default
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig
+from ai_ocr.lib.par_ai_core.llm_image_policy import ImagePolicy, get_image_policy
+from ai_ocr.lib.par_ai_core.llm_image_utils import image_to_base64
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider, provider_vision_models
+from ai_ocr.ocr_engine import OCR_USER_PROMPT
+from ai_ocr.text_layer import extract_text_layer
+
+MARKDOWN_SYNTAX_PATTERN = re.compile(r"[#*_`|>\-]+")
+
+
+def normalize_words(text: str) -> list[str]:
+    """Lower case words of a text with markdown syntax removed."""
+    return MARKDOWN_SYNTAX_PATTERN.sub(" ", text).lower().split()
+
+
+def ocr_accuracy(reference: str, ocr_text: str) -> float:
+    """Word level similarity (0-1) between reference text and OCR output."""
+    return SequenceMatcher(None, normalize_words(reference), normalize_words(ocr_text), autojunk=False).ratio()
+
+
+@dataclass
+class PolicyReport:
+    """Results of one image policy over the sample pages."""
+
+    name: str
+    """Policy variant name."""
+    pages: int = 0
+    """Number of pages evaluated."""
+    image_bytes: int = 0
+    """Total size of the encoded page images."""
+    input_tokens: int = 0
+    """Total input tokens reported by the provider, including the prompt."""
+    accuracy: float = 0.0
+    """Sum of the per page accuracy."""
+
+
+def evaluate_policy(
+    *, llm_config: LlmConfig, system_prompt_text: str, name: str, policy: ImagePolicy, pdf_paths: list[Path]
+) -> PolicyReport:
+    """OCR every page of the sample pdfs with an image policy and score the results."""
+    model = llm_config.build_chat_model()
+    report = PolicyReport(name=name)
+    for pdf_path in pdf_paths:
+        for page_num, reference in enumerate(extract_text_layer(pdf_path), start=1):
+            if not reference.strip():
+                continue
+            images = convert_from_path(pdf_path, first_page=page_num, last_page=page_num, **policy.render_kwargs())
+            image_bytes = policy.encode(images[0])
+            images[0].close()
+            messages = [
+                ("system", system_prompt_text),
+                (
+                    "user",
+                    [
+                        {"type": "text", "text": OCR_USER_PROMPT},
+                        {"type": "image_url", "image_url": {"url": image_to_base64(image_bytes, "jpeg")}},
+                    ],
+                ),
+            ]
+            response = model.invoke(messages)
+            usage = getattr(response, "usage_metadata", None) or {}
+            report.pages += 1
+            report.image_bytes += len(image_bytes)
+            report.input_tokens += usage.get("input_tokens", 0)
+            report.accuracy += ocr_accuracy(reference, str(response.content))
+    return report
+
+
+def main() -> None:
+    """Print a table comparing image policy variants on sample pdfs."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+", type=Path, help="born-digital sample pdfs")
+    parser.add_argument("--provider", type=LlmProvider, default=LlmProvider.BEDROCK, help="AI provider")
+    parser.add_argument("--model", help="vision model, defaults to the provider's vision model")
+    parser.add_argument(
+        "--target-tokens", type=int, nargs="+", default=[0, 1200, 800, 500], help="token targets, 0 for none"
+    )
+    parser.add_argument("--jpeg-quality", type=int, nargs="+", default=[80], help="JPEG qualities")
+    parser.add_argument("--grayscale", action="store_true", help="also evaluate grayscale variants")
+    args = parser.parse_args()
+
+    model_name = args.model or provider_vision_models[args.provider]
+    llm_config = LlmConfig(provider=args.provider, model_name=model_name, temperature=0)
+    system_prompt_text = system_prompt_file_default.read_text(encoding="utf-8")
+    base_policy = get_image_policy(args.provider, model_name)
+
+    variants: list[tuple[str, ImagePolicy]] = []
+    for target_tokens in args.target_tokens:
+        for jpeg_quality in args.jpeg_quality:
+            for grayscale in (False, True) if args.grayscale else (base_policy.grayscale,):
+                name = f"tokens={target_tokens or 'max'} q={jpeg_quality}{' gray' if grayscale else ''}"
+                policy = get_image_policy(
+                    args.provider,
+                    model_name,
+                    target_tokens=target_tokens or None,
+                    grayscale=grayscale,
+                    jpeg_quality=jpeg_quality,
+                )
+                variants.append((name, policy))
+
+    table = Table(title=f"Image policies for {model_name}")
+    for column in ("Policy", "Pages", "Tokens / page", "KB / page", "Accuracy"):
+        table.add_column(column, justify="left" if column == "Policy" else "right")
+    for name, policy in variants:
+        report = evaluate_policy(
+            llm_config=llm_config,
+            system_prompt_text=system_prompt_text,
+            name=name,
+            policy=policy,
+            pdf_paths=args.pdfs,
+        )
+        pages = max(report.pages, 1)
+        table.add_row(
+            name,
+            str(report.pages),
+            f"{report.input_tokens / pages:.0f}",
+            f"{report.image_bytes / pages / 1024:.0f}",
+            f"{report.accuracy / pages:.3f}",
+        )
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
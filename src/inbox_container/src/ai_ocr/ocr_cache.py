@@ -0,0 +1,151 @@
+"""Content addressed cache of OCR results.
+
+Pages are keyed by a hash of the rendered page bytes, the model name and the
+prompt text, so re-ingesting a document, or a page that appears in several
+documents such as standard terms and conditions, reuses the stored markdown
+instead of paying for another model call.
+
+Two backends are provided:
+
+- LocalOcrCache: files in a local directory with least recently used eviction
+  once a size limit is reached. Also a stand-in for the S3 backend when testing.
+- S3OcrCache: objects under a prefix in an S3 bucket, shared by every container.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any
+
+import orjson as json
+from botocore.exceptions import ClientError
+
+from ai_ocr.ocr_config import OcrCacheBackend, OcrConfig
+
+
+def make_ocr_cache_key(image_bytes: bytes, model_name: str, prompt_text: str) -> str:
+    """Build the cache key for a page image, model and prompt."""
+    hasher = hashlib.sha256()
+    for part in (model_name.encode("utf-8"), prompt_text.encode("utf-8"), image_bytes):
+        # length prefix each part so different splits of the same bytes can not collide
+        hasher.update(len(part).to_bytes(8, "big"))
+        hasher.update(part)
+    return hasher.hexdigest()
+
+
+class OcrCache(ABC):
+    """Store of OCR results keyed by ``make_ocr_cache_key``.
+
+    Entries are dicts holding at least ``content``, the raw model response text.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> dict[str, Any] | None:
+        """Get a cached entry or None on a miss."""
+
+    @abstractmethod
+    def put(self, key: str, entry: dict[str, Any]) -> None:
+        """Store an entry."""
+
+
+class LocalOcrCache(OcrCache):
+    """OCR cache stored as files in a local directory with LRU eviction.
+
+    File modification times track recency; reads touch the file so the least
+    recently used entries are evicted first once ``max_bytes`` is exceeded.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = sum(f.stat().st_size for f in self.directory.glob("*.json"))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return json.loads(data)
+
+    def put(self, key: str, entry: dict[str, Any]) -> None:
+        path = self._path(key)
+        data = json.dumps(entry)
+        with self._lock:
+            if path.exists():
+                self._size -= path.stat().st_size
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(data)
+            tmp_path.replace(path)
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache is at 90% of max_bytes. Must hold the lock."""
+        entries = sorted(
+            ((f.stat().st_mtime, f.stat().st_size, f) for f in self.directory.glob("*.json")), key=lambda x: x[0]
+        )
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+
+
+class S3OcrCache(OcrCache):
+    """OCR cache stored as objects under a prefix in an S3 bucket.
+
+    Eviction is left to a bucket lifecycle rule on the prefix.
+    """
+
+    def __init__(self, client: Any, bucket: str, prefix: str) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key[:2]}/{key}.json"
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def put(self, key: str, entry: dict[str, Any]) -> None:
+        self.client.put_object(
+            Bucket=self.bucket, Key=self._key(key), Body=json.dumps(entry), ContentType="application/json"
+        )
+
+
+def build_ocr_cache(ocr_config: OcrConfig, *, client: Any, default_bucket: str) -> OcrCache | None:
+    """Create the OCR cache selected by the config.
+
+    Args:
+        ocr_config: Pipeline config
+        client: S3 client used by the S3 backend
+        default_bucket: Bucket used by the S3 backend when ocr_config.cache_bucket is not set
+
+    Returns:
+        OcrCache | None: Cache or None if caching is disabled
+    """
+    if ocr_config.cache_backend == OcrCacheBackend.LOCAL:
+        return LocalOcrCache(Path(ocr_config.cache_dir), ocr_config.cache_max_mb * 1024 * 1024)
+    if ocr_config.cache_backend == OcrCacheBackend.S3:
+        return S3OcrCache(client, ocr_config.cache_bucket or default_bucket, ocr_config.cache_prefix)
+    return None
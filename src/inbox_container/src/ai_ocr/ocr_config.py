@@ -0,0 +1,429 @@
+"""Runtime options for the OCR pipeline.
+
+Options that tune how a document is rendered and OCRed live here rather than as
+individual arguments to ``main`` so the Lambda handler can build them from the
+environment in one place.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import Any
+
+import orjson as json
+from strenum import StrEnum
+
+from ai_ocr.lib.par_ai_core.llm_provider_pool import PoolStrategy
+
+OCR_CONCURRENCY_DEFAULT = 16
+
+S3_TRANSFER_CONCURRENCY = 10
+"""Threads of a boto3 managed transfer, TransferConfig's default max_concurrency."""
+
+
+class OcrEngine(StrEnum):
+    """How OCR page requests are executed."""
+
+    THREAD = "thread"
+    """One worker thread per in-flight page using the blocking model API."""
+    ASYNC = "async"
+    """A single asyncio event loop using the async model API."""
+
+
+class TextLayerMode(StrEnum):
+    """How pages with a usable embedded text layer are handled."""
+
+    OFF = "off"
+    """Ignore the text layer and OCR every page."""
+    DIRECT = "direct"
+    """Emit the extracted text as is."""
+    FORMAT = "format"
+    """Send the extracted text to the model to be formatted as markdown."""
+
+
+class OutputFormat(StrEnum):
+    """How the outputs of a document are written to S3."""
+
+    OBJECTS = "objects"
+    """An object per page image and per page markdown next to the final markdown."""
+    BUNDLE = "bundle"
+    """Page images and markdown in a single bundle object with a JSON manifest of their byte ranges."""
+
+
+class OcrCacheBackend(StrEnum):
+    """Where OCR results are cached."""
+
+    NONE = "none"
+    """No caching."""
+    LOCAL = "local"
+    """Files in a local directory with LRU eviction."""
+    S3 = "s3"
+    """Objects under a prefix in an S3 bucket."""
+
+
+class BatchInferenceBackend(StrEnum):
+    """Where page requests are sent in offline batch inference mode."""
+
+    NONE = "none"
+    """No batch inference, pages are OCRed while the document is processed."""
+    PROVIDER = "provider"
+    """The batch API of the AI provider."""
+    LOCAL = "local"
+    """Files in a local directory, run with the regular model when the job is collected."""
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """Read a boolean flag from an environment variable."""
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def available_cpu_count() -> int:
+    """Return the number of CPU cores this process is allowed to run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+@dataclass
+class OcrConfig:
+    """Configuration for the OCR pipeline.
+
+    Attributes:
+        render_workers: Max number of concurrent pdftoppm renders
+        render_chunk_size: Number of pages rendered per pdftoppm call in parallel mode
+        max_image_memory_mb: Max MB of encoded page images held in memory before spilling to disk
+        image_target_tokens: Max estimated input tokens per page image
+        image_grayscale: Send page images as grayscale
+        image_jpeg_quality: JPEG quality of page images
+        tile_pages: OCR oversized pages as overlapping tiles
+        tile_dpi: Render resolution of oversized pages
+        tile_min_scale: Smallest scale a page may be shrunk to before it is tiled
+        tile_overlap: Min overlap between neighbouring tiles as a fraction of the tile size
+        tile_max_tiles: Max tiles per page
+        tile_concurrency: Max in-flight tile requests per page
+        engine: Execution engine used for OCR page requests
+        ocr_concurrency: Max in-flight page requests for the async engine
+        adaptive_concurrency: Adjust in-flight page requests per provider / model with AIMD
+        min_concurrency: Lower bound for the adaptive limit
+        max_concurrency: Upper bound for the adaptive limit
+        s3_max_pool_connections: Connection pool size of the shared S3 client
+        upload_concurrency: Max page image uploads in flight
+        upload_queue_size: Max page image uploads queued before rendering waits
+        input_part_size_mb: Size of the ranged GETs the source document is downloaded with
+        input_concurrency: Max ranged GETs of the source document in flight
+        input_reserve_mb: Free ephemeral storage required next to the source document
+        input_streaming: OCR the first page of a linearized pdf while the rest of it downloads
+        output_format: How the outputs of a document are written to S3
+        cascade: OCR pages with a light model first and escalate failing pages to the heavy model
+        cascade_model: Light vision model of the cascade
+        cascade_min_chars_per_ink: Min light model output characters per percent of ink on the page
+        cascade_max_garbage_ratio: Max fraction of light model output characters that are not text
+        batch_pages: Max pages sent in one model request
+        batch_max_tokens: Max estimated input tokens of a multi page request
+        prompt_caching: Mark the static prompt prefix for caching
+        batch_inference: Submit page requests as an offline batch job instead of OCRing them
+        batch_job_bucket: Bucket batch job manifests and Bedrock job files are stored in
+        batch_job_prefix: Key prefix of batch job manifests and Bedrock job files
+        batch_job_dir: Directory used by the local batch endpoint
+        batch_job_role_arn: Service role Bedrock batch inference jobs run as
+        batch_job_max_tokens: Max output tokens per batch request
+        provider_pool: Fallback provider endpoints tried after the configured provider
+        pool_strategy: Order in which provider pool endpoints are tried
+        pool_failure_threshold: Consecutive failures that open the circuit of a provider pool endpoint
+        pool_reset_timeout: Seconds an open provider pool endpoint circuit waits before a probe request
+        hedge_requests: Send a duplicate of page requests running past a latency percentile
+        hedge_percentile: Latency percentile of recent page requests after which a duplicate is sent
+        hedge_min_samples: Min recent page requests before hedging starts
+        hedge_min_delay: Min seconds a page request runs before a duplicate is sent
+        hedge_budget_percent: Max duplicate requests as a percentage of page requests
+        stream_pages: Stream page responses into their output objects as they arrive
+        stream_part_size_mb: Size of the multipart parts streamed page output is uploaded in
+        max_attempts: Max attempts per page request including retries
+        page_timeout: Max seconds spent on a single page request including retries
+        deadline_margin: Seconds reserved at the end of the invocation for writing results
+        cache_backend: Where OCR results are cached
+        cache_dir: Directory used by the local cache
+        cache_max_mb: Size limit of the local cache in MB
+        cache_bucket: Bucket used by the S3 cache
+        cache_prefix: Key prefix used by the S3 cache
+        dedupe_pages: OCR repeated pages of a document only once
+        dedupe_max_distance: Max page hash distance for pages to be compared as duplicates
+        dedupe_max_diff_pixels: Max number of changed pixels for pages to be considered duplicates
+        skip_blank_pages: Write a placeholder for blank pages instead of OCRing them
+        blank_ink_threshold: Grayscale value below which a pixel counts as ink
+        blank_max_ink_ratio: Max fraction of ink pixels for a blank page
+        blank_max_stddev: Max grayscale standard deviation for a blank page
+        text_layer: How pages with a usable embedded text layer are handled
+        text_min_chars: Min characters of embedded text for a page to skip vision OCR
+        text_min_quality: Min embedded text quality score for a page to skip vision OCR
+    """
+
+    render_workers: int | None = 1
+    """Max number of concurrent page range renders. None or 0 uses all available cores, 1 renders serially.
+    Each extra worker is a pdftoppm process and a rendered page range held in memory at once."""
+    render_chunk_size: int = 4
+    """Number of consecutive pages rendered by each pdftoppm call when rendering in parallel."""
+    max_image_memory_mb: int = 256
+    """Max MB of encoded page images held in memory. Past it the oldest page images are spilled to disk."""
+    image_target_tokens: int | None = None
+    """Max estimated input tokens per page image. Images are shrunk until they fit. None only applies the
+    model's own image size limits."""
+    image_grayscale: bool | None = None
+    """Send page images as grayscale. None uses the model's image policy default."""
+    image_jpeg_quality: int | None = None
+    """JPEG quality (1-95) of page images. None uses the model's image policy default."""
+    tile_pages: bool = False
+    """Split pages the model would shrink below tile_min_scale into overlapping tiles and OCR each tile."""
+    tile_dpi: int = 200
+    """Render resolution of pdf pages that are tiled."""
+    tile_min_scale: float = 0.45
+    """Smallest scale the model's image policy may shrink a page to before it is tiled. Letter and A4 pages
+    rendered at 200 DPI stay untiled for Claude models, A3 and larger pages are tiled."""
+    tile_overlap: float = 0.15
+    """Min overlap between neighbouring tiles as a fraction of the tile size."""
+    tile_max_tiles: int = 16
+    """Max tiles per page. Larger pages are scaled down until they fit."""
+    tile_concurrency: int = 4
+    """Max in-flight tile requests per page."""
+    engine: OcrEngine = OcrEngine.THREAD
+    """Execution engine used for OCR page requests."""
+    ocr_concurrency: int | None = None
+    """Max in-flight page requests for the async engine. None or 0 falls back to max_workers, then 16."""
+    adaptive_concurrency: bool = False
+    """Grow in-flight page requests while the provider is healthy and cut them when it throttles.
+    The starting limit is ocr_concurrency / max_workers."""
+    min_concurrency: int = 1
+    """Lower bound for the adaptive limit."""
+    max_concurrency: int = 64
+    """Upper bound for the adaptive limit. Also sizes the worker pool when adaptive concurrency is on."""
+    s3_max_pool_connections: int = 0
+    """Connection pool size of the shared S3 client. 0 sizes it for the page workers, see s3_pool_connections."""
+    upload_concurrency: int = 8
+    """Max page image uploads in flight. Uploads run in the background, overlapped with OCR."""
+    upload_queue_size: int = 32
+    """Max page image uploads queued, rendering waits once it is full so queued images stay bounded in memory."""
+    input_part_size_mb: int = 16
+    """Size of the ranged GETs the source document is downloaded with, smaller documents take a single GET."""
+    input_concurrency: int = 10
+    """Max ranged GETs of the source document in flight."""
+    input_reserve_mb: int = 128
+    """Free ephemeral storage required next to the source document for spilled pages and the bundle, checked
+    before the download starts."""
+    input_streaming: bool = False
+    """Render the first page of a pdf linearized for fast web view as soon as its first page section is downloaded
+    and OCR it while the rest of the pdf downloads. Other pdfs, and every pdf with text_layer or tile_pages on,
+    are downloaded in full first."""
+    output_format: OutputFormat = OutputFormat.OBJECTS
+    """Write page images and page markdown as an object each, or as one bundle object with a manifest listing
+    their byte ranges. The final markdown is written either way. Batch inference always writes objects."""
+    cascade: bool = False
+    """OCR every page with a light vision model first. Pages whose output fails the quality gate (too short for
+    the ink on the page, refusal, garbage, repeated lines or broken tables) are OCRed again with the heavy model."""
+    cascade_model: str | None = None
+    """Light vision model of the cascade. None uses the provider's light model."""
+    cascade_min_chars_per_ink: float = 300
+    """Min characters of light model output per percent of ink pixels on the page. Dense text yields around 1800."""
+    cascade_max_garbage_ratio: float = 0.2
+    """Max fraction of light model output characters that are neither alphanumeric nor common symbols."""
+    batch_pages: int = 1
+    """Max page images packed into one model request. 1 sends one page per request. Pages missing from a
+    multi page response are OCRed again one page per request."""
+    batch_max_tokens: int = 8000
+    """Max estimated input tokens of a multi page request. Pages past it start a new request."""
+    prompt_caching: bool = True
+    """Mark the static system prompt and instruction text for prompt caching on models that need explicit
+    cache breakpoints (Anthropic and Claude on Bedrock). Prefixes under the model's minimum are not marked."""
+    batch_inference: BatchInferenceBackend = BatchInferenceBackend.NONE
+    """Write the page requests of documents to an offline batch job billed at half price and return without
+    OCRing them. ``collect_batch_jobs`` writes the outputs once the job has ended."""
+    batch_job_bucket: str | None = None
+    """Bucket batch job manifests and Bedrock job files are stored in. Defaults to the output bucket."""
+    batch_job_prefix: str = "ocr_batch_jobs"
+    """Key prefix of batch job manifests and Bedrock job files."""
+    batch_job_dir: str = "/tmp/ocr_batch_jobs"
+    """Directory used by the local batch endpoint."""
+    batch_job_role_arn: str | None = None
+    """Service role Bedrock batch inference jobs run as. Needs read and write access to the batch job prefix."""
+    batch_job_max_tokens: int = 4096
+    """Max output tokens per batch request. Batch APIs need an explicit limit."""
+    provider_pool: list[dict[str, Any]] = field(default_factory=list)
+    """Fallback endpoints page requests fail over to when the configured provider throttles or errors, each a
+    dict with ``provider`` and optional ``model``, ``base_url`` and ``weight``. Empty disables failover."""
+    pool_strategy: PoolStrategy = PoolStrategy.PRIORITY
+    """Order in which provider pool endpoints are tried, the configured provider being the first endpoint."""
+    pool_failure_threshold: int = 3
+    """Consecutive throttling, timeout or 5xx failures that open the circuit of a provider pool endpoint."""
+    pool_reset_timeout: float = 30
+    """Seconds an open provider pool endpoint circuit waits before letting a probe request through."""
+    hedge_requests: bool = False
+    """Send a duplicate of page and tile requests running longer than hedge_percentile of recent requests to the
+    same model and take the first answer. The duplicate goes to another provider pool endpoint if there is one."""
+    hedge_percentile: float = 95
+    """Latency percentile (0-100) of recent page requests after which a duplicate is sent."""
+    hedge_min_samples: int = 10
+    """Min recent page requests to the model before hedging starts."""
+    hedge_min_delay: float = 5
+    """Min seconds a page request runs before a duplicate is sent."""
+    hedge_budget_percent: float = 5
+    """Max duplicate requests as a percentage of page requests, caps the extra spend."""
+    stream_pages: bool = False
+    """Stream single page responses chunk by chunk into the page's output object, uploaded in multipart parts as
+    they fill. Tile, multi page and cascade light model requests are not streamed, nor are streamed requests hedged."""
+    stream_part_size_mb: int = 8
+    """Size in MB of the multipart parts streamed page output is uploaded in, at least 5."""
+    max_attempts: int = 4
+    """Max attempts per page request including retries of throttling, timeout and 5xx errors. 1 disables retries."""
+    page_timeout: float = 300
+    """Max seconds spent on a single page request including retries."""
+    deadline_margin: float = 30
+    """Seconds before the invocation deadline after which no new page request attempt is started."""
+    cache_backend: OcrCacheBackend = OcrCacheBackend.NONE
+    """Where OCR results are cached, keyed by page image hash, model and prompt."""
+    cache_dir: str = "/tmp/ocr_cache"
+    """Directory used by the local cache."""
+    cache_max_mb: int = 256
+    """Size limit of the local cache in MB. Least recently used entries are evicted past it."""
+    cache_bucket: str | None = None
+    """Bucket used by the S3 cache. Defaults to the output bucket."""
+    cache_prefix: str = "ocr_cache"
+    """Key prefix used by the S3 cache."""
+    dedupe_pages: bool = False
+    """OCR near identical pages of a document, such as repeated signature pages, only once. Unique pages are kept
+    in the image store for comparison until the document is done, spilling to disk past max_image_memory_mb, so
+    long documents hold every unique page instead of a flat working set."""
+    dedupe_max_distance: int = 10
+    """Max difference hash distance (out of 256 bits) for two pages to be compared pixel by pixel."""
+    dedupe_max_diff_pixels: int = 16
+    """Max number of changed pixels for two pages to be considered duplicates."""
+    skip_blank_pages: bool = False
+    """Classify pages as blank while rendering and write a placeholder for them instead of OCRing them."""
+    blank_ink_threshold: int = 128
+    """Grayscale value (0-255) below which a pixel counts as ink."""
+    blank_max_ink_ratio: float = 0.00005
+    """Max fraction of ink pixels for a blank page."""
+    blank_max_stddev: float = 12.0
+    """Max grayscale standard deviation for a blank page."""
+    text_layer: TextLayerMode = TextLayerMode.OFF
+    """How pdf pages with a usable embedded text layer are handled. Those pages are not rendered or vision OCRed,
+    flat extracted text loses table and layout structure the vision model keeps."""
+    text_min_chars: int = 200
+    """Min non whitespace characters of embedded text for a page to skip vision OCR."""
+    text_min_quality: float = 0.6
+    """Min embedded text quality score (0-1) for a page to skip vision OCR."""
+
+    @property
+    def effective_render_workers(self) -> int:
+        """Number of render workers bounded by the available cores."""
+        cores = available_cpu_count()
+        if not self.render_workers:
+            return cores
+        return max(1, min(self.render_workers, cores))
+
+    def s3_pool_connections(self, max_workers: int | None = None) -> int:
+        """Connection pool size of the shared S3 client.
+
+        Every page worker, and every tile thread of a worker, can make an S3 request at the
+        same time, next to the upload threads and a managed transfer running on its own threads.
+        The source document is downloaded on input_concurrency threads, before the workers start
+        unless input_streaming overlaps the download with OCR of the first page.
+
+        Args:
+            max_workers: Worker pool size of the thread engine
+
+        Returns:
+            int: s3_max_pool_connections if set, else a connection per thread
+        """
+        if self.s3_max_pool_connections:
+            return self.s3_max_pool_connections
+        workers = (
+            self.max_concurrency
+            if self.adaptive_concurrency
+            else self.ocr_concurrency or max_workers or OCR_CONCURRENCY_DEFAULT
+        )
+        page_connections = workers * max(1, self.tile_concurrency if self.tile_pages else 1)
+        return (
+            (
+                page_connections + self.input_concurrency
+                if self.input_streaming
+                else max(page_connections, self.input_concurrency)
+            )
+            + self.upload_concurrency
+            + S3_TRANSFER_CONCURRENCY
+        )
+
+    @classmethod
+    def from_env(cls) -> OcrConfig:
+        """Create an OcrConfig from environment variables."""
+        return cls(
+            render_workers=int(os.environ.get("MAX_RENDER_WORKERS", 1)),
+            render_chunk_size=int(os.environ.get("RENDER_CHUNK_SIZE", 4)),
+            max_image_memory_mb=int(os.environ.get("MAX_IMAGE_MEMORY_MB", 256)),
+            image_target_tokens=int(os.environ.get("IMAGE_TARGET_TOKENS", 0)) or None,
+            image_grayscale=env_bool("IMAGE_GRAYSCALE") if os.environ.get("IMAGE_GRAYSCALE") else None,
+            image_jpeg_quality=int(os.environ.get("IMAGE_JPEG_QUALITY", 0)) or None,
+            tile_pages=env_bool("TILE_PAGES"),
+            tile_dpi=int(os.environ.get("TILE_DPI", 200)),
+            tile_min_scale=float(os.environ.get("TILE_MIN_SCALE", 0.45)),
+            tile_overlap=float(os.environ.get("TILE_OVERLAP", 0.15)),
+            tile_max_tiles=int(os.environ.get("TILE_MAX_TILES", 16)),
+            tile_concurrency=int(os.environ.get("TILE_CONCURRENCY", 4)),
+            engine=OcrEngine(os.environ.get("OCR_ENGINE", OcrEngine.THREAD)),
+            ocr_concurrency=int(os.environ.get("OCR_CONCURRENCY", 0)),
+            adaptive_concurrency=env_bool("ADAPTIVE_CONCURRENCY"),
+            min_concurrency=int(os.environ.get("MIN_OCR_CONCURRENCY", 1)),
+            max_concurrency=int(os.environ.get("MAX_OCR_CONCURRENCY", 64)),
+            s3_max_pool_connections=int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 0)),
+            upload_concurrency=int(os.environ.get("UPLOAD_CONCURRENCY", 8)),
+            upload_queue_size=int(os.environ.get("UPLOAD_QUEUE_SIZE", 32)),
+            input_part_size_mb=int(os.environ.get("INPUT_PART_SIZE_MB", 16)),
+            input_concurrency=int(os.environ.get("INPUT_CONCURRENCY", 10)),
+            input_reserve_mb=int(os.environ.get("INPUT_RESERVE_MB", 128)),
+            input_streaming=env_bool("INPUT_STREAMING"),
+            output_format=OutputFormat(os.environ.get("OUTPUT_FORMAT", OutputFormat.OBJECTS)),
+            cascade=env_bool("OCR_CASCADE"),
+            cascade_model=os.environ.get("CASCADE_MODEL") or None,
+            cascade_min_chars_per_ink=float(os.environ.get("CASCADE_MIN_CHARS_PER_INK", 300)),
+            cascade_max_garbage_ratio=float(os.environ.get("CASCADE_MAX_GARBAGE_RATIO", 0.2)),
+            batch_pages=int(os.environ.get("OCR_BATCH_PAGES", 1)),
+            batch_max_tokens=int(os.environ.get("OCR_BATCH_MAX_TOKENS", 8000)),
+            prompt_caching=env_bool("PROMPT_CACHING", True),
+            batch_inference=BatchInferenceBackend(os.environ.get("BATCH_INFERENCE", BatchInferenceBackend.NONE)),
+            batch_job_bucket=os.environ.get("BATCH_JOB_BUCKET") or None,
+            batch_job_prefix=os.environ.get("BATCH_JOB_PREFIX", "ocr_batch_jobs"),
+            batch_job_dir=os.environ.get("BATCH_JOB_DIR", "/tmp/ocr_batch_jobs"),
+            batch_job_role_arn=os.environ.get("BATCH_JOB_ROLE_ARN") or None,
+            batch_job_max_tokens=int(os.environ.get("BATCH_JOB_MAX_TOKENS", 4096)),
+            provider_pool=json.loads(os.environ.get("PROVIDER_POOL") or "[]"),
+            pool_strategy=PoolStrategy(os.environ.get("POOL_STRATEGY", PoolStrategy.PRIORITY)),
+            pool_failure_threshold=int(os.environ.get("POOL_FAILURE_THRESHOLD", 3)),
+            pool_reset_timeout=float(os.environ.get("POOL_RESET_TIMEOUT", 30)),
+            hedge_requests=env_bool("HEDGE_REQUESTS"),
+            hedge_percentile=float(os.environ.get("HEDGE_PERCENTILE", 95)),
+            hedge_min_samples=int(os.environ.get("HEDGE_MIN_SAMPLES", 10)),
+            hedge_min_delay=float(os.environ.get("HEDGE_MIN_DELAY", 5)),
+            hedge_budget_percent=float(os.environ.get("HEDGE_BUDGET_PERCENT", 5)),
+            stream_pages=env_bool("STREAM_PAGES"),
+            stream_part_size_mb=int(os.environ.get("STREAM_PART_SIZE_MB", 8)),
+            max_attempts=int(os.environ.get("OCR_MAX_ATTEMPTS", 4)),
+            page_timeout=float(os.environ.get("OCR_PAGE_TIMEOUT", 300)),
+            deadline_margin=float(os.environ.get("OCR_DEADLINE_MARGIN", 30)),
+            cache_backend=OcrCacheBackend(os.environ.get("OCR_CACHE", OcrCacheBackend.NONE)),
+            cache_dir=os.environ.get("OCR_CACHE_DIR", "/tmp/ocr_cache"),
+            cache_max_mb=int(os.environ.get("OCR_CACHE_MAX_MB", 256)),
+            cache_bucket=os.environ.get("OCR_CACHE_BUCKET") or None,
+            cache_prefix=os.environ.get("OCR_CACHE_PREFIX", "ocr_cache"),
+            dedupe_pages=env_bool("DEDUPE_PAGES"),
+            dedupe_max_distance=int(os.environ.get("DEDUPE_MAX_DISTANCE", 10)),
+            dedupe_max_diff_pixels=int(os.environ.get("DEDUPE_MAX_DIFF_PIXELS", 16)),
+            skip_blank_pages=env_bool("SKIP_BLANK_PAGES"),
+            blank_ink_threshold=int(os.environ.get("BLANK_INK_THRESHOLD", 128)),
+            blank_max_ink_ratio=float(os.environ.get("BLANK_MAX_INK_RATIO", 0.00005)),
+            blank_max_stddev=float(os.environ.get("BLANK_MAX_STDDEV", 12.0)),
+            text_layer=TextLayerMode(os.environ.get("TEXT_LAYER", TextLayerMode.OFF)),
+            text_min_chars=int(os.environ.get("TEXT_LAYER_MIN_CHARS", 200)),
+            text_min_quality=float(os.environ.get("TEXT_LAYER_MIN_QUALITY", 0.6)),
+        )
@@ -0,0 +1,1267 @@
+"""Per page OCR request pipeline of a document.
+
+``PageOcrEngine`` holds what the pages of a document share: the model clients and
+their limiters, the OCR cache, the request hedger, the duplicate page index and
+the run summary. What a page, a tile, a batch of pages or a text layer page sends
+to the model is written once as request steps, generators that yield each
+``ModelRequest`` and are sent the model's response back:
+
+- ``run`` drives request steps with blocking model calls, for the thread engine.
+- ``arun`` drives the same steps with asyncio model calls and advances the steps
+  off the event loop, since they read images and the cache.
+
+Only sending a request differs between the two: retries, hedging, the provider
+pool and the request limiters each have a blocking and an asyncio API.
+
+Usage:
+    engine = PageOcrEngine(s3_client=s3, llm_config=llm_config, ...)
+    try:
+        results = engine.process_pages(images, text_pages)
+    finally:
+        engine.close()
+    engine.log_metrics()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextvars
+import io
+import threading
+import time
+from collections.abc import Collection, Generator, Iterable, Iterator
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, Literal, TypeVar
+
+from aws_lambda_powertools import Logger
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from PIL import Image
+
+from ai_ocr.blank_pages import BLANK_PAGE_PLACEHOLDER, BlankPageDetector
+from ai_ocr.lib.par_ai_core.llm_concurrency import AdaptiveConcurrencyLimiter, get_concurrency_limiter
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig, llm_run_manager
+from ai_ocr.lib.par_ai_core.llm_errors import LlmErrorKind
+from ai_ocr.lib.par_ai_core.llm_hedging import HedgePolicy, RequestHedger, get_latency_tracker
+from ai_ocr.lib.par_ai_core.llm_image_policy import ImagePolicy
+from ai_ocr.lib.par_ai_core.llm_image_utils import estimate_image_tokens, image_to_base64
+from ai_ocr.lib.par_ai_core.llm_prompt_caching import (
+    cached_text_content,
+    prompt_cache_min_tokens,
+    retarget_cache_breakpoints,
+)
+from ai_ocr.lib.par_ai_core.llm_provider_pool import PoolMember, ProviderPool
+from ai_ocr.lib.par_ai_core.llm_providers import provider_light_models
+from ai_ocr.lib.par_ai_core.llm_rate_limiter import ProviderRateLimiter
+from ai_ocr.lib.par_ai_core.llm_retry import RetryPolicy, acall_with_retry, call_with_retry
+from ai_ocr.lib.par_ai_core.pricing_lookup import get_api_call_cost, mk_usage_metadata
+from ai_ocr.lib.par_ai_core.provider_cb_info import parai_callback_var
+from ai_ocr.ocr_cache import build_ocr_cache, make_ocr_cache_key
+from ai_ocr.ocr_config import OCR_CONCURRENCY_DEFAULT, OcrConfig, OcrEngine, TextLayerMode
+from ai_ocr.ocr_quality import QualityIssue, check_ocr_quality, page_ink_ratio
+from ai_ocr.page_batches import (
+    BATCH_OCR_USER_PROMPT,
+    PageBatcher,
+    build_batch_content,
+    is_truncated,
+    split_batch_response,
+)
+from ai_ocr.page_bundle import PageBundleWriter
+from ai_ocr.page_dedupe import DuplicatePageIndex
+from ai_ocr.page_image import PageImage, PageImageStore
+from ai_ocr.page_stream import MarkdownStreamCleaner, PageStream, S3MultipartWriter, message_text, page_footer
+from ai_ocr.page_tiles import PageTile, needs_tiling, split_page_tiles, stitch_tile_markdown
+from ai_ocr.run_summary import OcrRunSummary
+
+logger = Logger()
+
+OCR_USER_PROMPT = "Please extract all text from the following image into markdown."
+TILE_OCR_USER_PROMPT = (
+    "Please extract all text from the following image into markdown. "
+    "The image is one tile of a larger page and overlaps its neighbouring tiles, "
+    "skip text that is cut off at the edges of the image."
+)
+
+T = TypeVar("T")
+
+PageBatchItem = tuple[PageImage, concurrent.futures.Future[str]]
+"""Page image sharing a batched request and the future its raw model output is set on."""
+
+
+@dataclass
+class OcrModelClient:
+    """Chat model OCR requests are sent to, with its run config and request limiters."""
+
+    llm_config: LlmConfig
+    """Provider and model of the requests."""
+    model: BaseChatModel
+    """Chat model built from llm_config."""
+    runnable_config: RunnableConfig
+    """Run config that attributes usage to llm_config in the callback handler."""
+    limiter: AdaptiveConcurrencyLimiter | None = None
+    """Adaptive limit of in-flight requests to the model."""
+    rate_limiter: ProviderRateLimiter | None = None
+    """Provider quota limiter of the model."""
+
+
+@dataclass
+class ModelRequest:
+    """Model request yielded by request steps."""
+
+    messages: list
+    """Chat messages of the request."""
+    input_tokens: int
+    """Estimated input tokens, charged to the rate limiter."""
+    page_num: int
+    """Page the request is for, the first page of a multi page request."""
+    client: OcrModelClient | None = None
+    """Client the request goes to, None for the heavy model through the provider pool."""
+    hedged: bool = False
+    """Hedge the request if it runs long, only single page and tile requests have comparable latencies."""
+    stream: PageStream | None = None
+    """Output object the heavy model's response is streamed to."""
+
+
+RequestSteps = Generator[ModelRequest, BaseMessage, T]
+"""Generator yielding the model requests of a unit of work and returning its result."""
+
+
+def build_ocr_model_client(llm_config: LlmConfig, ocr_config: OcrConfig, *, concurrency: int) -> OcrModelClient:
+    """Build the chat model of a config with the request limiters ``ocr_config`` asks for."""
+    model = llm_config.build_chat_model()
+    limiter: AdaptiveConcurrencyLimiter | None = None
+    if ocr_config.adaptive_concurrency:
+        limiter = get_concurrency_limiter(
+            llm_config.provider,
+            llm_config.model_name,
+            initial_limit=concurrency,
+            min_limit=ocr_config.min_concurrency,
+            max_limit=ocr_config.max_concurrency,
+        )
+    return OcrModelClient(
+        llm_config=llm_config,
+        model=model,
+        runnable_config=llm_run_manager.get_runnable_config(model.name),
+        limiter=limiter,
+        rate_limiter=llm_config.get_rate_limiter(),
+    )
+
+
+def page_suffix(page_num: int) -> str:
+    """Get the suffix used for the files of a page such as -page001.jpg"""
+    return "-page" + str(page_num).zfill(3) + ".jpg"
+
+
+def page_num_from_suffix(suffix: str) -> int:
+    """Get the page number from a page image suffix such as -page001.jpg"""
+    return int("".join([x for x in suffix if x.isdigit()]).lstrip("0") or 0)
+
+
+def clean_ocr_content(content: str, page_num: int) -> str:
+    """Strip markdown fences from a model response and append the page footer."""
+    content = content.strip().replace("```markdown", "").replace("```", "")
+    return content + page_footer(page_num)
+
+
+def advance_steps(steps: RequestSteps[T], response: BaseMessage | None) -> tuple[bool, ModelRequest | T]:
+    """Resume request steps with the response to their last request, None to start them.
+
+    StopIteration is turned into a return value since it can not be raised through a future.
+
+    Returns:
+        tuple: True and the result of the steps once they are done, else False and their next model request
+    """
+    try:
+        return False, steps.send(response)  # type: ignore[arg-type]
+    except StopIteration as stop:
+        return True, stop.value
+
+
+class PageOcrEngine:
+    """OCR pipeline of the pages of a document.
+
+    Pages are submitted to the model as soon as they are pulled from the rasterizer, either in a
+    thread pool or on a single asyncio event loop depending on ``ocr_config.engine``.
+    Transient provider errors are retried until ``ocr_config.page_timeout`` or ``deadline``
+    (a time.monotonic() timestamp) minus ``ocr_config.deadline_margin``, whichever comes first.
+    Pages ``blank_detector`` classified as blank get a placeholder instead of being OCRed.
+    Text layer pages are emitted as is or formatted by the model with ``text_format_prompt_text``
+    depending on ``ocr_config.text_layer``. Page images are released from ``image_store`` once
+    no longer needed. Images that do not fit ``image_policy`` are scaled and re-encoded before sending.
+    With ``ocr_config.tile_pages`` images the policy would shrink too far are OCRed as overlapping tiles
+    and the tile results stitched back together. With ``ocr_config.batch_pages`` above 1 up to that many
+    pages share a model request, falling back to one page per request for pages missing from the response.
+    With ``ocr_config.prompt_caching`` the static system prompt and instruction text end in cache
+    breakpoints for models that need them marked. With ``ocr_config.cascade`` page and tile requests, including
+    multi page requests, go to a light model first and pages failing the quality gate are OCRed again by the
+    heavy ``llm_config`` model. With a ``provider_pool``, whose first endpoint is ``llm_config``, heavy model
+    requests go to the healthiest pool endpoint and fail over to the next one on transient errors.
+    With ``ocr_config.hedge_requests`` page and tile requests running past a latency percentile of recent
+    requests get a duplicate request, to another pool endpoint if there is one, and the first answer wins.
+    With ``ocr_config.stream_pages`` single page responses are cleaned and written to the page's output object
+    chunk by chunk as the model streams them. With a ``bundle`` page markdown is left for the caller to add
+    to it instead of being written as an object per page.
+    What happened to each page is recorded in ``summary``.
+    """
+
+    def __init__(
+        self,
+        *,
+        s3_client: Any,
+        llm_config: LlmConfig,
+        ocr_config: OcrConfig,
+        system_prompt_text: str,
+        src_file: Path,
+        page_count: int,
+        output_bucket: str,
+        output_key: str,
+        summary: OcrRunSummary,
+        max_workers: int | None = None,
+        deadline: float | None = None,
+        blank_detector: BlankPageDetector | None = None,
+        text_format_prompt_text: str = "",
+        image_store: PageImageStore | None = None,
+        image_policy: ImagePolicy | None = None,
+        provider_pool: ProviderPool | None = None,
+        bundle: PageBundleWriter | None = None,
+    ) -> None:
+        self.s3 = s3_client
+        self.llm_config = llm_config
+        self.ocr_config = ocr_config
+        self.system_prompt_text = system_prompt_text
+        self.src_file = src_file
+        self.page_count = page_count
+        self.output_bucket = output_bucket
+        self.output_key = output_key
+        self.summary = summary
+        self.deadline = deadline
+        self.blank_detector = blank_detector
+        self.text_format_prompt_text = text_format_prompt_text
+        self.image_store = image_store
+        self.image_policy = image_policy
+        self.provider_pool = provider_pool
+        self.bundle = bundle
+
+        self.concurrency = ocr_config.ocr_concurrency or max_workers or OCR_CONCURRENCY_DEFAULT
+        self.max_workers = max_workers
+        self.pool_clients: dict[str, OcrModelClient] = {}
+        if provider_pool:
+            self.pool_clients = {
+                member.name: build_ocr_model_client(member.llm_config, ocr_config, concurrency=self.concurrency)
+                for member in provider_pool.members
+            }
+            self.heavy = self.pool_clients[provider_pool.members[0].name]
+            logger.info(f"Provider pool of {', '.join(self.pool_clients)} with {provider_pool.strategy} strategy")
+        else:
+            self.heavy = build_ocr_model_client(llm_config, ocr_config, concurrency=self.concurrency)
+        self.light: OcrModelClient | None = None
+        if ocr_config.cascade:
+            self.light = build_ocr_model_client(
+                LlmConfig(
+                    provider=llm_config.provider,
+                    model_name=ocr_config.cascade_model or provider_light_models[llm_config.provider],
+                    base_url=llm_config.base_url,
+                    temperature=llm_config.temperature,
+                ),
+                ocr_config,
+                concurrency=self.concurrency,
+            )
+            logger.info(f"Cascade OCR with {self.light.llm_config.model_name}, escalating to {llm_config.model_name}")
+        self.clients = [
+            client for client in (self.light, *(list(self.pool_clients.values()) or [self.heavy])) if client
+        ]
+        if self.heavy.limiter:
+            # the limiter gates model requests, the pool only needs to be large enough for the max limit
+            self.max_workers = self.concurrency = ocr_config.max_concurrency
+            logger.info(
+                f"Adaptive concurrency starting at {self.heavy.limiter.limit} of max {self.heavy.limiter.max_limit}"
+            )
+        for client in self.clients:
+            if client.rate_limiter:
+                logger.info(
+                    f"Rate limiting {client.llm_config.model_name} to "
+                    f"{client.rate_limiter.requests_per_minute or 'unlimited'} requests "
+                    f"and {client.rate_limiter.tokens_per_minute or 'unlimited'} tokens per minute"
+                )
+
+        self.retry_policy = RetryPolicy(max_attempts=ocr_config.max_attempts)
+        self.hedger = (
+            RequestHedger(
+                HedgePolicy(
+                    percentile=ocr_config.hedge_percentile,
+                    min_samples=ocr_config.hedge_min_samples,
+                    min_delay=ocr_config.hedge_min_delay,
+                    budget_percent=ocr_config.hedge_budget_percent,
+                ),
+                # blocking requests wait in hedge threads, one for the request and one for its hedge
+                max_workers=2 * self.concurrency * max(1, ocr_config.tile_concurrency if ocr_config.tile_pages else 1),
+            )
+            if ocr_config.hedge_requests
+            else None
+        )
+        self.callback = parai_callback_var.get()
+        self.ocr_cache = build_ocr_cache(ocr_config, client=s3_client, default_bucket=output_bucket)
+        # cascade output is cached apart from heavy model output
+        self.cache_model_name = (
+            f"{self.light.llm_config.model_name}+{llm_config.model_name}" if self.light else llm_config.model_name
+        )
+        self.page_index = (
+            DuplicatePageIndex(
+                max_distance=ocr_config.dedupe_max_distance, max_diff_pixels=ocr_config.dedupe_max_diff_pixels
+            )
+            if ocr_config.dedupe_pages
+            else None
+        )
+        self.tiling = bool(ocr_config.tile_pages and image_policy)
+        self.batch_size = max(1, ocr_config.batch_pages)
+        self.batcher: PageBatcher[PageBatchItem] = PageBatcher(
+            max_pages=self.batch_size, max_tokens=ocr_config.batch_max_tokens
+        )
+        self.stream_part_size = ocr_config.stream_part_size_mb * 1024 * 1024
+        self.summary_lock = threading.Lock()
+        # raw model output of each OCRed page, awaited by pages that duplicate it
+        self.raw_results: dict[int, concurrent.futures.Future[str]] = {}
+
+        self.cache_min_tokens = (
+            prompt_cache_min_tokens(llm_config.provider, llm_config.model_name) if ocr_config.prompt_caching else None
+        )
+        if self.cache_min_tokens and (len(system_prompt_text) + len(OCR_USER_PROMPT)) // 4 < self.cache_min_tokens:
+            logger.info(
+                f"Prompt caching skipped for page requests, the system prompt is under the {self.cache_min_tokens} "
+                f"token minimum of {llm_config.model_name}"
+            )
+        self.system_prompt = self._system_message(system_prompt_text)
+
+    def _prompt_content(self, text: str, prefix_chars: int = 0) -> list[dict[str, Any]]:
+        """Content blocks of a static prompt text, ending in a cache breakpoint if the prefix can be cached."""
+        # roughly 4 characters per token
+        if self.cache_min_tokens and (prefix_chars + len(text)) // 4 >= self.cache_min_tokens:
+            return cached_text_content(self.llm_config.provider, text)
+        return [{"type": "text", "text": text}]
+
+    def _system_message(self, text: str) -> tuple[str, str | list[dict[str, Any]]]:
+        # plain text unless cached, not every provider accepts content blocks in the system message
+        if self.cache_min_tokens and len(text) // 4 >= self.cache_min_tokens:
+            return "system", cached_text_content(self.llm_config.provider, text)
+        return "system", text
+
+    def _build_messages(self, image_bytes: bytes, image_type: Literal["jpeg", "png", "gif"], prompt: str) -> list:
+        image_base_64 = image_to_base64(image_bytes, image_type, policy=self.image_policy)
+        chat = [
+            *self._prompt_content(prompt, len(self.system_prompt_text)),
+            {
+                "type": "image_url",
+                "image_url": {"url": image_base_64},
+            },
+        ]
+        return [self.system_prompt, ("user", chat)]
+
+    def _count_image_tokens(self, width: int, height: int) -> int:
+        if self.image_policy:
+            return self.image_policy.estimate_tokens(width, height)
+        return estimate_image_tokens(self.llm_config.provider, width, height)
+
+    def _record_image_tokens(self, image_bytes: bytes, page_num: int) -> int:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            image_tokens = self._count_image_tokens(img.width, img.height)
+        # tiles of a page add up
+        with self.summary_lock:
+            self.summary.image_bytes[page_num] = self.summary.image_bytes.get(page_num, 0) + len(image_bytes)
+            self.summary.image_tokens[page_num] = self.summary.image_tokens.get(page_num, 0) + image_tokens
+        return image_tokens
+
+    def _estimate_input_tokens(self, image_bytes: bytes, page_num: int) -> int:
+        # roughly 4 characters per token for the prompt text
+        return self._record_image_tokens(image_bytes, page_num) + len(self.system_prompt_text) // 4
+
+    def _page_key(self, suffix: str) -> str:
+        return f"{self.output_key}/{self.src_file.stem}{suffix.split('.')[0]}.md"
+
+    def _save_page(self, suffix: str, content: str) -> None:
+        if self.bundle:
+            # added to the bundle in page order once every page is done
+            return
+        key = self._page_key(suffix)
+        logger.info(f"Uploading {key} to {self.output_bucket}")
+        self.s3.put_object(Bucket=self.output_bucket, Key=key, Body=content.encode("utf-8"))
+
+    def _save_page_error(self, page_num: int, suffix: str, e: Exception) -> tuple[int, str]:
+        logger.error(f"Error extracting text from image: {page_num}: {e}")
+        logger.exception(e)
+        error_text = f"Error extracting text from image {page_num}: {e}"
+        with self.summary_lock:
+            self.summary.error_pages.append(page_num)
+        if self.bundle:
+            return page_num, error_text
+        try:
+            self.s3.put_object(
+                Bucket=self.output_bucket,
+                Key=self._page_key(suffix),
+                Body=error_text.encode("utf-8"),
+            )
+        except Exception as upload_error:  # pylint: disable=broad-except
+            logger.error(f"Error uploading error text for page {page_num}: {upload_error}")
+        return page_num, error_text
+
+    def _finish_page(self, page_num: int, suffix: str, raw_content: str, *, saved: bool = False) -> tuple[int, str]:
+        """Clean the raw content of a page and save it unless its streamed response already did."""
+        try:
+            content = clean_ocr_content(raw_content, page_num)
+            if not saved:
+                self._save_page(suffix, content)
+            return page_num, content
+        except Exception as e:  # pylint: disable=broad-except
+            return self._save_page_error(page_num, suffix, e)
+
+    def _page_stream(self, image: PageImage, page_num: int) -> PageStream | None:
+        """Output object a page's response is streamed to, None unless streaming."""
+        if not self.ocr_config.stream_pages or self.bundle:
+            return None
+        return PageStream(key=self._page_key(image.suffix), page_num=page_num)
+
+    def _record_retry(
+        self, page_num: int, model_name: str, kind: LlmErrorKind, attempt: int, delay: float, e: BaseException
+    ) -> None:
+        logger.warning(f"Retrying page {page_num} in {delay:.1f}s after {kind} error on attempt {attempt}: {e}")
+        if self.callback:
+            self.callback.add_usage(model_name, retries=1, **{f"{kind}_retries": 1})
+
+    def _record_failure(self, page_num: int, member: PoolMember, kind: LlmErrorKind, e: BaseException) -> None:
+        logger.warning(f"Request for page {page_num} to {member.name} failed with {kind} error: {e}")
+        if self.callback:
+            self.callback.add_usage(
+                member.llm_config.model_name, provider=member.llm_config.provider.value, failovers=1
+            )
+
+    def _record_hedge(self, page_num: int, client: OcrModelClient) -> None:
+        logger.info(f"Hedging slow request for page {page_num} to {client.llm_config.model_name}")
+        with self.summary_lock:
+            if page_num not in self.summary.hedged_pages:
+                self.summary.hedged_pages.append(page_num)
+
+    def _record_page_usage(self, page_num: int, usage: dict) -> None:
+        with self.summary_lock:
+            page_usage = self.summary.page_usage.setdefault(page_num, {"input_tokens": 0, "output_tokens": 0})
+            for key in page_usage:
+                page_usage[key] += usage.get(key, 0)
+
+    def _record_page_seconds(self, page_num: int, seconds: float) -> None:
+        with self.summary_lock:
+            self.summary.page_seconds[page_num] = self.summary.page_seconds.get(page_num, 0.0) + seconds
+
+    def _record_streamed(self, page_num: int) -> None:
+        with self.summary_lock:
+            self.summary.streamed_pages.append(page_num)
+
+    def _is_streamed(self, page_num: int) -> bool:
+        """Check if a page's output object was already written by its streamed response."""
+        with self.summary_lock:
+            return page_num in self.summary.streamed_pages
+
+    def _usage_cost(self, config: LlmConfig, usage: dict) -> float:
+        cost_usage = mk_usage_metadata()
+        cost_usage["input_tokens"] = usage.get("input_tokens", 0)
+        cost_usage["output_tokens"] = usage.get("output_tokens", 0)
+        return get_api_call_cost(config, cost_usage)
+
+    def _escalate(self, page_num: int, image_bytes: bytes, content: str, usage: dict) -> bool:
+        """Check light model output against the quality gate and record the outcome.
+
+        Returns:
+            bool: True if the page has to be OCRed again by the heavy model
+        """
+        if not self.light:
+            return False
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            ink_ratio = page_ink_ratio(img, ink_threshold=self.ocr_config.blank_ink_threshold)
+        issues: list[QualityIssue] = check_ocr_quality(
+            content,
+            ink_ratio,
+            min_chars_per_ink=self.ocr_config.cascade_min_chars_per_ink,
+            max_garbage_ratio=self.ocr_config.cascade_max_garbage_ratio,
+        )
+        light_cost = self._usage_cost(self.light.llm_config, usage)
+        with self.summary_lock:
+            if page_num not in self.summary.cascade_pages:
+                self.summary.cascade_pages.append(page_num)
+            if issues:
+                # tiles of a page add up
+                page_issues = self.summary.escalated_pages.setdefault(page_num, [])
+                page_issues.extend(issue for issue in issues if issue not in page_issues)
+                self.summary.cascade_saved_cost -= light_cost
+            else:
+                self.summary.cascade_saved_cost += self._usage_cost(self.llm_config, usage) - light_cost
+        if issues:
+            logger.info(f"Escalating page {page_num} to {self.llm_config.model_name}: {', '.join(issues)}")
+        return bool(issues)
+
+    def _use_light(self, page_num: int) -> bool:
+        """Check if a page request goes to the light model first, pages already escalated skip it."""
+        with self.summary_lock:
+            return bool(self.light) and page_num not in self.summary.escalated_pages
+
+    def _cache_key(self, image_bytes: bytes, prompt: str) -> str | None:
+        if not self.ocr_cache:
+            return None
+        return make_ocr_cache_key(image_bytes, self.cache_model_name, self.system_prompt_text + prompt)
+
+    def _cache_get(self, key: str | None, page_num: int) -> str | None:
+        if not self.ocr_cache or not key:
+            return None
+        try:
+            entry = self.ocr_cache.get(key)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning(f"OCR cache lookup failed for page {page_num}: {e}")
+            entry = None
+        if not entry:
+            if self.callback:
+                self.callback.add_usage(self.llm_config.model_name, ocr_cache_misses=1)
+            return None
+        logger.info(f"OCR cache hit for page {page_num}")
+        if self.callback:
+            saved_usage = mk_usage_metadata()
+            saved_usage["input_tokens"] = entry.get("input_tokens", 0)
+            saved_usage["output_tokens"] = entry.get("output_tokens", 0)
+            self.callback.add_usage(
+                self.llm_config.model_name,
+                ocr_cache_hits=1,
+                ocr_cache_saved_cost=get_api_call_cost(self.llm_config, saved_usage),
+            )
+        return entry["content"]
+
+    def _cache_put(self, key: str | None, content: str, usage: dict) -> None:
+        if not self.ocr_cache or not key:
+            return
+        try:
+            self.ocr_cache.put(
+                key,
+                {
+                    "content": content,
+                    "model_name": self.llm_config.model_name,
+                    "input_tokens": usage.get("input_tokens", 0),
+                    "output_tokens": usage.get("output_tokens", 0),
+                },
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning(f"OCR cache store failed: {e}")
+
+    def _page_deadline(self) -> float:
+        page_deadline = time.monotonic() + self.ocr_config.page_timeout
+        if self.deadline is not None:
+            page_deadline = min(page_deadline, self.deadline - self.ocr_config.deadline_margin)
+        return page_deadline
+
+    def _member_messages(self, messages: list, member: PoolMember) -> list:
+        """Messages built for llm_config with their cache breakpoints converted for a pool endpoint."""
+        if member.llm_config.provider == self.llm_config.provider:
+            return messages
+        return retarget_cache_breakpoints(messages, member.llm_config.provider, member.llm_config.model_name)
+
+    def _stream_model(self, messages: list, client: OcrModelClient, stream: PageStream) -> BaseMessage:
+        """Stream a response into the page's output object, which is aborted if the request fails."""
+        logger.info(f"Streaming {stream.key} to {self.output_bucket}")
+        cleaner = MarkdownStreamCleaner(stream.page_num)
+        response: BaseMessage | None = None
+        with S3MultipartWriter(self.s3, self.output_bucket, stream.key, part_size=self.stream_part_size) as writer:
+            for chunk in client.model.stream(messages, config=client.runnable_config):
+                response = chunk if response is None else response + chunk
+                writer.write(cleaner.feed(message_text(chunk)))
+            if response is None:
+                raise ValueError(f"Empty response streamed for page {stream.page_num}")
+            writer.write(cleaner.finish())
+        return response
+
+    async def _astream_model(self, messages: list, client: OcrModelClient, stream: PageStream) -> BaseMessage:
+        logger.info(f"Streaming {stream.key} to {self.output_bucket}")
+        cleaner = MarkdownStreamCleaner(stream.page_num)
+        response: BaseMessage | None = None
+        writer = S3MultipartWriter(self.s3, self.output_bucket, stream.key, part_size=self.stream_part_size)
+        try:
+            async for chunk in client.model.astream(messages, config=client.runnable_config):
+                response = chunk if response is None else response + chunk
+                writer.append(cleaner.feed(message_text(chunk)))
+                if writer.part_ready:
+                    await asyncio.to_thread(writer.upload_parts)
+            if response is None:
+                raise ValueError(f"Empty response streamed for page {stream.page_num}")
+            writer.append(cleaner.finish())
+            await asyncio.to_thread(writer.close)
+        except BaseException:
+            writer.abort()
+            raise
+        return response
+
+    def _invoke_client(
+        self, messages: list, input_tokens: int, client: OcrModelClient, stream: PageStream | None = None
+    ) -> BaseMessage:
+        """Send a single request to client, streaming the response into stream's object if given."""
+        if client.rate_limiter:
+            client.rate_limiter.acquire(input_tokens)
+        if not client.limiter:
+            if stream:
+                return self._stream_model(messages, client, stream)
+            return client.model.invoke(messages, config=client.runnable_config)
+        with client.limiter.limit_slot():
+            if stream:
+                return self._stream_model(messages, client, stream)
+            return client.model.invoke(messages, config=client.runnable_config)
+
+    async def _ainvoke_client(
+        self, messages: list, input_tokens: int, client: OcrModelClient, stream: PageStream | None = None
+    ) -> BaseMessage:
+        if client.rate_limiter:
+            await client.rate_limiter.aacquire(input_tokens)
+        if not client.limiter:
+            if stream:
+                return await self._astream_model(messages, client, stream)
+            return await client.model.ainvoke(messages, config=client.runnable_config)
+        async with client.limiter.alimit_slot():
+            if stream:
+                return await self._astream_model(messages, client, stream)
+            return await client.model.ainvoke(messages, config=client.runnable_config)
+
+    def _invoke_heavy(self, request: ModelRequest, used: list[str], avoid: Collection[str] = ()) -> BaseMessage:
+        """Send a single request to the heavy model, adding the pool endpoints it goes to to used."""
+        if not self.provider_pool:
+            return self._invoke_client(request.messages, request.input_tokens, self.heavy, request.stream)
+
+        def invoke_member(member: PoolMember) -> BaseMessage:
+            used.append(member.name)
+            return self._invoke_client(
+                self._member_messages(request.messages, member),
+                request.input_tokens,
+                self.pool_clients[member.name],
+                request.stream,
+            )
+
+        return self.provider_pool.call(
+            invoke_member, on_failure=partial(self._record_failure, request.page_num), avoid=avoid
+        )
+
+    async def _ainvoke_heavy(self, request: ModelRequest, used: list[str], avoid: Collection[str] = ()) -> BaseMessage:
+        if not self.provider_pool:
+            return await self._ainvoke_client(request.messages, request.input_tokens, self.heavy, request.stream)
+
+        async def ainvoke_member(member: PoolMember) -> BaseMessage:
+            used.append(member.name)
+            return await self._ainvoke_client(
+                self._member_messages(request.messages, member),
+                request.input_tokens,
+                self.pool_clients[member.name],
+                request.stream,
+            )
+
+        return await self.provider_pool.acall(
+            ainvoke_member, on_failure=partial(self._record_failure, request.page_num), avoid=avoid
+        )
+
+    def _invoke_once(self, request: ModelRequest) -> BaseMessage:
+        """Send a single request to its client or the heavy model, hedged if it runs long."""
+        used: list[str] = []
+        client = request.client
+        if client:
+            attempt = partial(self._invoke_client, request.messages, request.input_tokens, client, request.stream)
+        else:
+            attempt = partial(self._invoke_heavy, request, used)
+        # a hedge would stream into the same object as the request it duplicates
+        if not self.hedger or not request.hedged or request.stream:
+            return attempt()
+
+        def hedge_attempt() -> BaseMessage:
+            self._record_hedge(request.page_num, client or self.heavy)
+            if client:
+                return self._invoke_client(request.messages, request.input_tokens, client)
+            # prefer a pool endpoint other than the one the request is waiting on
+            return self._invoke_heavy(request, [], avoid=list(used))
+
+        config = (client or self.heavy).llm_config
+        return self.hedger.call(attempt, hedge_attempt, tracker=get_latency_tracker(config.provider, config.model_name))
+
+    async def _ainvoke_once(self, request: ModelRequest) -> BaseMessage:
+        used: list[str] = []
+        client = request.client
+        if client:
+            attempt = partial(self._ainvoke_client, request.messages, request.input_tokens, client, request.stream)
+        else:
+            attempt = partial(self._ainvoke_heavy, request, used)
+        if not self.hedger or not request.hedged or request.stream:
+            return await attempt()
+
+        async def hedge_attempt() -> BaseMessage:
+            self._record_hedge(request.page_num, client or self.heavy)
+            if client:
+                return await self._ainvoke_client(request.messages, request.input_tokens, client)
+            return await self._ainvoke_heavy(request, [], avoid=list(used))
+
+        config = (client or self.heavy).llm_config
+        return await self.hedger.acall(
+            attempt, hedge_attempt, tracker=get_latency_tracker(config.provider, config.model_name)
+        )
+
+    def send(self, request: ModelRequest) -> BaseMessage:
+        """Send a request with retries to its client, or to the heavy model through the provider pool.
+
+        With a ``stream`` every attempt streams the response into its object afresh.
+        """
+        return call_with_retry(
+            lambda: self._invoke_once(request),
+            policy=self.retry_policy,
+            deadline=self._page_deadline(),
+            on_retry=partial(
+                self._record_retry, request.page_num, (request.client or self.heavy).llm_config.model_name
+            ),
+        )
+
+    async def asend(self, request: ModelRequest) -> BaseMessage:
+        """Async version of ``send``."""
+        return await acall_with_retry(
+            lambda: self._ainvoke_once(request),
+            policy=self.retry_policy,
+            deadline=self._page_deadline(),
+            on_retry=partial(
+                self._record_retry, request.page_num, (request.client or self.heavy).llm_config.model_name
+            ),
+        )
+
+    def run(self, steps: RequestSteps[T]) -> T:
+        """Drive request steps, sending each model request they yield and blocking on its response."""
+        done, value = advance_steps(steps, None)
+        while not done:
+            done, value = advance_steps(steps, self.send(value))  # type: ignore[arg-type]
+        return value  # type: ignore[return-value]
+
+    async def arun(self, steps: RequestSteps[T]) -> T:
+        """Async version of ``run``, the steps are advanced in a worker thread to keep the event loop free."""
+        done, value = await asyncio.to_thread(advance_steps, steps, None)
+        while not done:
+            response = await self.asend(value)  # type: ignore[arg-type]
+            done, value = await asyncio.to_thread(advance_steps, steps, response)
+        return value  # type: ignore[return-value]
+
+    def page_steps(
+        self,
+        image_bytes: bytes,
+        image_type: Literal["jpeg", "png", "gif"],
+        page_num: int,
+        prompt: str = OCR_USER_PROMPT,
+        stream: PageStream | None = None,
+    ) -> RequestSteps[str]:
+        """Request steps OCRing a page or tile image, the heavy model's answer is streamed into stream's object."""
+        key = self._cache_key(image_bytes, prompt)
+        content = self._cache_get(key, page_num)
+        if content is not None:
+            return content
+        messages = self._build_messages(image_bytes, image_type, prompt)
+        input_tokens = self._estimate_input_tokens(image_bytes, page_num)
+        response: BaseMessage | None = None
+        if self.light and self._use_light(page_num):
+            response = yield ModelRequest(messages, input_tokens, page_num, self.light, hedged=True)
+            usage = getattr(response, "usage_metadata", None) or {}
+            self._record_page_usage(page_num, usage)
+            if self._escalate(page_num, image_bytes, str(response.content), usage):
+                response = None
+        if response is None:
+            response = yield ModelRequest(messages, input_tokens, page_num, hedged=True, stream=stream)
+            self._record_page_usage(page_num, getattr(response, "usage_metadata", None) or {})
+            if stream:
+                self._record_streamed(page_num)
+        content = str(response.content)
+        self._cache_put(key, content, getattr(response, "usage_metadata", None) or {})
+        return content
+
+    def _prepare_batch(self, batch: list[PageBatchItem]) -> tuple[dict[int, str], list[tuple[int, bytes]], list, int]:
+        """Answer what the cache can and build the request for the rest of a batch.
+
+        Returns:
+            tuple: raw content of cached pages, page number and image of the pages to request,
+                request messages and estimated input tokens
+        """
+        raw: dict[int, str] = {}
+        pending: list[tuple[int, bytes]] = []
+        for image, _ in batch:
+            page_num = page_num_from_suffix(image.suffix)
+            image_bytes = image.read_bytes()
+            content = self._cache_get(self._cache_key(image_bytes, BATCH_OCR_USER_PROMPT), page_num)
+            if content is None:
+                pending.append((page_num, image_bytes))
+            else:
+                raw[page_num] = content
+        if len(pending) <= 1:
+            # a lone page goes through the single page path
+            return raw, [], [], 0
+        image_types = {page_num_from_suffix(image.suffix): image.image_type for image, _ in batch}
+        content_parts = build_batch_content(
+            [
+                (page_num, image_to_base64(image_bytes, image_types[page_num], policy=self.image_policy))
+                for page_num, image_bytes in pending
+            ],
+            self._prompt_content(BATCH_OCR_USER_PROMPT, len(self.system_prompt_text)),
+        )
+        input_tokens = sum(self._record_image_tokens(image_bytes, page_num) for page_num, image_bytes in pending)
+        return (
+            raw,
+            pending,
+            [self.system_prompt, ("user", content_parts)],
+            input_tokens + len(self.system_prompt_text) // 4,
+        )
+
+    def _parse_batch(
+        self, response: BaseMessage, pending: list[tuple[int, bytes]], raw: dict[int, str]
+    ) -> dict[int, str]:
+        """Split a batched response into the raw content of each page and cache it."""
+        page_nums = [page_num for page_num, _ in pending]
+        sections = split_batch_response(str(response.content), page_nums)
+        if sections and is_truncated(response):
+            # the last page in the response may have been cut off
+            sections.pop(next(reversed(sections)))
+        usage = getattr(response, "usage_metadata", None) or {}
+        page_usage = {key: usage.get(key, 0) // len(pending) for key in ("input_tokens", "output_tokens")}
+        for page_num, _ in pending:
+            self._record_page_usage(page_num, page_usage)
+        for page_num, image_bytes in pending:
+            # pages failing the cascade quality gate are OCRed again one page per request by the heavy model
+            if page_num in sections and self._escalate(page_num, image_bytes, sections[page_num], page_usage):
+                del sections[page_num]
+        for page_num, image_bytes in pending:
+            if page_num in sections:
+                self._cache_put(self._cache_key(image_bytes, BATCH_OCR_USER_PROMPT), sections[page_num], page_usage)
+        with self.summary_lock:
+            self.summary.batch_requests += 1
+            self.summary.batched_pages.extend(sections)
+        missing = [page_num for page_num in page_nums if page_num not in sections]
+        if missing:
+            logger.warning(
+                f"Batched response for pages {page_nums} is missing pages {missing}, OCRing them one page per request"
+            )
+        return raw | sections
+
+    def batch_steps(self, batch: list[PageBatchItem]) -> RequestSteps[dict[int, str]]:
+        """Request steps OCRing a batch of pages in one request, returning the raw content of each page it got."""
+        raw, pending, messages, input_tokens = self._prepare_batch(batch)
+        if not pending:
+            return raw
+        page_nums = [page_num for page_num, _ in pending]
+        logger.info(f"Extracting text from images {page_nums} of {self.page_count} in one request")
+        start_time = time.monotonic()
+        response = yield ModelRequest(messages, input_tokens, page_nums[0], self.light)
+        for page_num in page_nums:
+            self._record_page_seconds(page_num, time.monotonic() - start_time)
+        return self._parse_batch(response, pending, raw)
+
+    def text_steps(self, page_num: int, text: str) -> RequestSteps[str]:
+        """Request steps of a text layer page, formatted by the model if ``ocr_config.text_layer`` asks for it."""
+        if self.ocr_config.text_layer != TextLayerMode.FORMAT:
+            return text
+        logger.info(f"Formatting text layer of page {page_num} of {self.page_count}")
+        messages = [self._system_message(self.text_format_prompt_text), ("user", text)]
+        start_time = time.monotonic()
+        # roughly 4 characters per token
+        response = yield ModelRequest(messages, (len(self.text_format_prompt_text) + len(text)) // 4, page_num)
+        self._record_page_seconds(page_num, time.monotonic() - start_time)
+        self._record_page_usage(page_num, getattr(response, "usage_metadata", None) or {})
+        return str(response.content)
+
+    def _page_tiles(self, image_bytes: bytes, page_num: int) -> list[PageTile] | None:
+        """Split a page into tiles if it is too large for the model's image resolution, else None."""
+        if not self.tiling or not self.image_policy:
+            return None
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            if not needs_tiling(img.width, img.height, self.image_policy, min_scale=self.ocr_config.tile_min_scale):
+                return None
+            tiles = split_page_tiles(
+                img, self.image_policy, overlap=self.ocr_config.tile_overlap, max_tiles=self.ocr_config.tile_max_tiles
+            )
+        logger.info(f"Page {page_num} is too large for the model's image resolution, OCRing {len(tiles)} tiles")
+        with self.summary_lock:
+            self.summary.tiled_pages[page_num] = len(tiles)
+        return tiles
+
+    def _batch_tokens(self, image: PageImage) -> int | None:
+        """Estimate the image tokens of a page that can share a request, None if it needs its own."""
+        if self.batch_size <= 1:
+            return None
+        with image.open() as img:
+            if (
+                self.tiling
+                and self.image_policy
+                and needs_tiling(img.width, img.height, self.image_policy, min_scale=self.ocr_config.tile_min_scale)
+            ):
+                return None
+            return self._count_image_tokens(img.width, img.height)
+
+    def _find_duplicate(self, image: PageImage) -> int | None:
+        if not self.page_index:
+            return None
+        page_num = page_num_from_suffix(image.suffix)
+        try:
+            duplicate_of = self.page_index.find_duplicate(image, page_num)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning(f"Duplicate check failed for page {page_num}: {e}")
+            return None
+        if duplicate_of is not None:
+            logger.info(f"Page {page_num} duplicates page {duplicate_of}, reusing its OCR result")
+        return duplicate_of
+
+    def _release(self, image: PageImage) -> None:
+        if self.image_store:
+            self.image_store.release(image)
+
+    def ocr_image(self, image: PageImage, image_bytes: bytes, page_num: int) -> str:
+        """OCR a page image, as tiles in a thread pool if it is too large for the model's image resolution."""
+        tiles = self._page_tiles(image_bytes, page_num)
+        if not tiles:
+            return self.run(
+                self.page_steps(image_bytes, image.image_type, page_num, stream=self._page_stream(image, page_num))
+            )
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, min(len(tiles), self.ocr_config.tile_concurrency))
+        ) as executor:
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self.run,
+                    self.page_steps(tile.data, "jpeg", page_num, TILE_OCR_USER_PROMPT),
+                )
+                for tile in tiles
+            ]
+            return stitch_tile_markdown([(tile.row, tile.col, future.result()) for tile, future in zip(tiles, futures)])
+
+    async def aocr_image(self, image: PageImage, image_bytes: bytes, page_num: int) -> str:
+        """Async version of ``ocr_image``, tiles share the event loop."""
+        tiles = await asyncio.to_thread(self._page_tiles, image_bytes, page_num)
+        if not tiles:
+            return await self.arun(
+                self.page_steps(image_bytes, image.image_type, page_num, stream=self._page_stream(image, page_num))
+            )
+        tile_semaphore = asyncio.Semaphore(max(1, self.ocr_config.tile_concurrency))
+
+        async def aocr_tile(tile: PageTile) -> tuple[int, int, str]:
+            async with tile_semaphore:
+                return (
+                    tile.row,
+                    tile.col,
+                    await self.arun(self.page_steps(tile.data, "jpeg", page_num, TILE_OCR_USER_PROMPT)),
+                )
+
+        return stitch_tile_markdown(list(await asyncio.gather(*(aocr_tile(tile) for tile in tiles))))
+
+    def _finish_image(
+        self,
+        image: PageImage,
+        raw_result: concurrent.futures.Future[str],
+        seconds: float,
+        result: str | Exception,
+    ) -> tuple[int, str]:
+        """Record the OCR result of a page image, pass it on to the pages duplicating it and save it."""
+        page_num = page_num_from_suffix(image.suffix)
+        self._record_page_seconds(page_num, seconds)
+        # unique pages stay available for comparison with later pages
+        if not self.page_index:
+            self._release(image)
+        if isinstance(result, Exception):
+            raw_result.set_exception(result)
+            return self._save_page_error(page_num, image.suffix, result)
+        raw_result.set_result(result)
+        return self._finish_page(page_num, image.suffix, result, saved=self._is_streamed(page_num))
+
+    def process_image(self, image: PageImage, raw_result: concurrent.futures.Future[str]) -> tuple[int, str]:
+        """OCR and save a page image, its raw model output is set on raw_result for pages duplicating it."""
+        page_num = page_num_from_suffix(image.suffix)
+        logger.info(f"Extracting text from image {page_num} of {self.page_count}")
+        start_time = time.monotonic()
+        result: str | Exception
+        try:
+            result = self.ocr_image(image, image.read_bytes(), page_num)
+        except Exception as e:  # pylint: disable=broad-except
+            result = e
+        return self._finish_image(image, raw_result, time.monotonic() - start_time, result)
+
+    async def aprocess_image(
+        self, image: PageImage, semaphore: asyncio.Semaphore, raw_result: concurrent.futures.Future[str]
+    ) -> tuple[int, str]:
+        """Async version of ``process_image``, the model requests of a page hold a semaphore slot."""
+        page_num = page_num_from_suffix(image.suffix)
+        result: str | Exception
+        async with semaphore:
+            logger.info(f"Extracting text from image {page_num} of {self.page_count}")
+            start_time = time.monotonic()
+            try:
+                image_bytes = image.read_bytes() if image.in_memory else await asyncio.to_thread(image.read_bytes)
+                result = await self.aocr_image(image, image_bytes, page_num)
+            except Exception as e:  # pylint: disable=broad-except
+                result = e
+            seconds = time.monotonic() - start_time
+        return await asyncio.to_thread(self._finish_image, image, raw_result, seconds, result)
+
+    def _finish_batched_page(
+        self, image: PageImage, raw_result: concurrent.futures.Future[str], raw_content: str
+    ) -> tuple[int, str]:
+        # unique pages stay available for comparison with later pages
+        if not self.page_index:
+            self._release(image)
+        raw_result.set_result(raw_content)
+        return self._finish_page(page_num_from_suffix(image.suffix), image.suffix, raw_content)
+
+    def process_batch(self, batch: list[PageBatchItem]) -> list[tuple[int, str]]:
+        """OCR and save a batch of pages, OCRing pages missing from the response one page per request."""
+        try:
+            raw = self.run(self.batch_steps(batch))
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning(f"Batched request failed, OCRing its pages one page per request: {e}")
+            raw = {}
+        results: list[tuple[int, str]] = []
+        for image, raw_result in batch:
+            raw_content = raw.get(page_num_from_suffix(image.suffix))
+            if raw_content is None:
+                results.append(self.process_image(image, raw_result))
+            else:
+                results.append(self._finish_batched_page(image, raw_result, raw_content))
+        return results
+
+    async def aprocess_batch(self, batch: list[PageBatchItem], semaphore: asyncio.Semaphore) -> list[tuple[int, str]]:
+        """Async version of ``process_batch``."""
+        try:
+            async with semaphore:
+                raw = await self.arun(self.batch_steps(batch))
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning(f"Batched request failed, OCRing its pages one page per request: {e}")
+            raw = {}
+        singles = []
+        results: list[tuple[int, str]] = []
+        for image, raw_result in batch:
+            raw_content = raw.get(page_num_from_suffix(image.suffix))
+            if raw_content is None:
+                singles.append(self.aprocess_image(image, semaphore, raw_result))
+            else:
+                results.append(await asyncio.to_thread(self._finish_batched_page, image, raw_result, raw_content))
+        return results + list(await asyncio.gather(*singles))
+
+    def process_text_page(self, page_num: int, text: str) -> tuple[int, str]:
+        """Save a text layer page, formatted by the model if ``ocr_config.text_layer`` asks for it."""
+        suffix = page_suffix(page_num)
+        try:
+            text = self.run(self.text_steps(page_num, text))
+        except Exception as e:  # pylint: disable=broad-except
+            return self._save_page_error(page_num, suffix, e)
+        return self._finish_page(page_num, suffix, text)
+
+    async def aprocess_text_page(self, page_num: int, text: str, semaphore: asyncio.Semaphore) -> tuple[int, str]:
+        """Async version of ``process_text_page``."""
+        suffix = page_suffix(page_num)
+        try:
+            async with semaphore:
+                text = await self.arun(self.text_steps(page_num, text))
+        except Exception as e:  # pylint: disable=broad-except
+            return await asyncio.to_thread(self._save_page_error, page_num, suffix, e)
+        return await asyncio.to_thread(self._finish_page, page_num, suffix, text)
+
+    def process_blank(self, image: PageImage) -> tuple[int, str]:
+        """Save the placeholder of a blank page."""
+        self._release(image)
+        return self._finish_page(page_num_from_suffix(image.suffix), image.suffix, BLANK_PAGE_PLACEHOLDER)
+
+    def process_duplicate(self, image: PageImage, raw_result: concurrent.futures.Future[str]) -> tuple[int, str]:
+        """Save a repeated page with the raw model output of the page it duplicates."""
+        self._release(image)
+        page_num = page_num_from_suffix(image.suffix)
+        try:
+            raw_content = raw_result.result()
+        except Exception as e:  # pylint: disable=broad-except
+            return self._save_page_error(page_num, image.suffix, e)
+        return self._finish_page(page_num, image.suffix, raw_content)
+
+    async def aprocess_duplicate(self, image: PageImage, raw_result: concurrent.futures.Future[str]) -> tuple[int, str]:
+        """Async version of ``process_duplicate``."""
+        self._release(image)
+        page_num = page_num_from_suffix(image.suffix)
+        try:
+            raw_content = await asyncio.wrap_future(raw_result)
+        except Exception as e:  # pylint: disable=broad-except
+            return await asyncio.to_thread(self._save_page_error, page_num, image.suffix, e)
+        return await asyncio.to_thread(self._finish_page, page_num, image.suffix, raw_content)
+
+    def next_page(self, image_iter: Iterator[PageImage]) -> tuple[PageImage, bool, int | None] | None:
+        """Pull the next page from the rasterizer and check if it is blank or repeats an earlier page.
+
+        Returns:
+            tuple | None: page image, blank flag and the page it duplicates, or None when there are no more pages
+        """
+        image = next(image_iter, None)
+        if image is None:
+            return None
+        page_num = page_num_from_suffix(image.suffix)
+        if self.blank_detector and self.blank_detector.is_blank_page(page_num):
+            logger.info(f"Page {page_num} is blank, skipping OCR")
+            with self.summary_lock:
+                self.summary.blank_pages.append(page_num)
+            return image, True, None
+        duplicate_of = self._find_duplicate(image)
+        with self.summary_lock:
+            if duplicate_of is not None:
+                self.summary.duplicate_pages[page_num] = duplicate_of
+            else:
+                self.summary.ocr_pages.append(page_num)
+        return image, False, duplicate_of
+
+    async def run_async(self, images: Iterable[PageImage], text_pages: dict[int, str]) -> list[tuple[int, str]]:
+        """Process every page on the running event loop."""
+        logger.info(f"Running async OCR engine with concurrency {self.concurrency}")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks: list[asyncio.Task[tuple[int, str]]] = [
+            asyncio.create_task(self.aprocess_text_page(page_num, text, semaphore))
+            for page_num, text in text_pages.items()
+        ]
+        batch_tasks: list[asyncio.Task[list[tuple[int, str]]]] = []
+
+        def submit_batch(batch: list[PageBatchItem]) -> None:
+            if len(batch) == 1:
+                image, raw_result = batch[0]
+                tasks.append(asyncio.create_task(self.aprocess_image(image, semaphore, raw_result)))
+            elif batch:
+                batch_tasks.append(asyncio.create_task(self.aprocess_batch(batch, semaphore)))
+
+        image_iter = iter(images)
+        # pull pages from the (possibly blocking) rasterizer off the event loop
+        while (page := await asyncio.to_thread(self.next_page, image_iter)) is not None:
+            image, blank, duplicate_of = page
+            if blank:
+                tasks.append(asyncio.create_task(asyncio.to_thread(self.process_blank, image)))
+                continue
+            if duplicate_of is not None:
+                # the page it duplicates may be waiting for its batch to fill up
+                submit_batch(self.batcher.flush())
+                tasks.append(asyncio.create_task(self.aprocess_duplicate(image, self.raw_results[duplicate_of])))
+                continue
+            raw_result = self.raw_results[page_num_from_suffix(image.suffix)] = concurrent.futures.Future()
+            tokens = await asyncio.to_thread(self._batch_tokens, image)
+            if tokens is None:
+                tasks.append(asyncio.create_task(self.aprocess_image(image, semaphore, raw_result)))
+                continue
+            for batch in self.batcher.add((image, raw_result), tokens):
+                submit_batch(batch)
+        submit_batch(self.batcher.flush())
+        results = list(await asyncio.gather(*tasks))
+        for batch_results in await asyncio.gather(*batch_tasks):
+            results.extend(batch_results)
+        return results
+
+    def run_threaded(self, images: Iterable[PageImage], text_pages: dict[int, str]) -> list[tuple[int, str]]:
+        """Process every page in a thread pool."""
+        futures: list[concurrent.futures.Future[tuple[int, str]]] = []
+        batch_futures: list[concurrent.futures.Future[list[tuple[int, str]]]] = []
+        image_iter = iter(images)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+            def submit_batch(batch: list[PageBatchItem]) -> None:
+                context = contextvars.copy_context()
+                if len(batch) == 1:
+                    futures.append(executor.submit(context.run, self.process_image, *batch[0]))
+                elif batch:
+                    batch_futures.append(executor.submit(context.run, self.process_batch, batch))
+
+            for page_num, text in text_pages.items():
+                futures.append(executor.submit(contextvars.copy_context().run, self.process_text_page, page_num, text))
+            while (page := self.next_page(image_iter)) is not None:
+                image, blank, duplicate_of = page
+                # copy the context so worker threads report usage to the active callback handler
+                context = contextvars.copy_context()
+                if blank:
+                    futures.append(executor.submit(context.run, self.process_blank, image))
+                    continue
+                if duplicate_of is not None:
+                    # the page it duplicates was submitted first, so it is running or done before this waits on it
+                    submit_batch(self.batcher.flush())
+                    futures.append(
+                        executor.submit(context.run, self.process_duplicate, image, self.raw_results[duplicate_of])
+                    )
+                    continue
+                raw_result = self.raw_results[page_num_from_suffix(image.suffix)] = concurrent.futures.Future()
+                tokens = self._batch_tokens(image)
+                if tokens is None:
+                    futures.append(executor.submit(context.run, self.process_image, image, raw_result))
+                    continue
+                for batch in self.batcher.add((image, raw_result), tokens):
+                    submit_batch(batch)
+            submit_batch(self.batcher.flush())
+            results = [future.result() for future in futures]
+            for future in batch_futures:
+                results.extend(future.result())
+            return results
+
+    def process_pages(self, images: Iterable[PageImage], text_pages: dict[int, str]) -> list[tuple[int, str]]:
+        """Process rendered pages and text layer pages with the engine ``ocr_config.engine`` selects.
+
+        Returns:
+            list: page number and cleaned markdown of every page, in no particular order
+        """
+        if self.ocr_config.engine == OcrEngine.ASYNC:
+            return asyncio.run(self.run_async(images, text_pages))
+        return self.run_threaded(images, text_pages)
+
+    def close(self) -> None:
+        """Stop the hedge threads."""
+        if self.hedger:
+            self.hedger.close()
+
+    def log_metrics(self) -> None:
+        """Log the limiter, prompt cache, hedging, provider pool and cascade metrics of the run."""
+        for client in self.clients:
+            model_name = client.llm_config.model_name
+            if client.limiter:
+                logger.info(
+                    f"Adaptive concurrency limit for {model_name} is now {client.limiter.limit}",
+                    extra={"concurrency_metrics": client.limiter.snapshot()},
+                )
+            if client.rate_limiter:
+                logger.info(
+                    f"Rate limiter usage for {model_name}",
+                    extra={"rate_limit_metrics": client.rate_limiter.snapshot()},
+                )
+            usage = self.callback.usage_metadata.get(model_name, {}) if self.callback else {}
+            if usage.get("cache_read") or usage.get("cache_write"):
+                logger.info(
+                    f"Prompt cache for {model_name}: {usage.get('prompt_cache_hits', 0)} hits, "
+                    f"saved ${usage.get('prompt_cache_saved_cost', 0.0):.4f}",
+                    extra={
+                        "prompt_cache_metrics": {
+                            key: usage.get(key, 0)
+                            for key in ("cache_read", "cache_write", "prompt_cache_hits", "prompt_cache_saved_cost")
+                        }
+                    },
+                )
+        if self.hedger:
+            hedge_metrics = self.hedger.snapshot()
+            logger.info(
+                f"Hedged {hedge_metrics['hedges']} of {hedge_metrics['requests']} page requests "
+                f"({hedge_metrics['hedge_percent']}% of a {hedge_metrics['budget_percent']}% budget), "
+                f"{hedge_metrics['hedge_wins']} hedges finished first",
+                extra={"hedge_metrics": hedge_metrics},
+            )
+        if self.provider_pool:
+            provider_usage = self.callback.provider_usage_metadata if self.callback else {}
+            failovers = sum(
+                usage.get("failovers", 0) for models in provider_usage.values() for usage in models.values()
+            )
+            logger.info(
+                f"Provider pool failed over {failovers} times",
+                extra={"provider_pool_metrics": {"endpoints": self.provider_pool.snapshot(), "usage": provider_usage}},
+            )
+        if self.light:
+            summary = self.summary
+            logger.info(
+                f"Cascade escalated {len(summary.escalated_pages)} of {len(summary.cascade_pages)} pages "
+                f"({summary.escalation_rate:.0%}) from {self.light.llm_config.model_name} to "
+                f"{self.llm_config.model_name}, saved ${summary.cascade_saved_cost:.4f} compared with "
+                f"{self.llm_config.model_name} only",
+                extra={
+                    "cascade_metrics": {
+                        "escalated_pages": summary.escalated_pages,
+                        "escalation_rate": round(summary.escalation_rate, 3),
+                        "saved_cost": round(summary.cascade_saved_cost, 6),
+                    }
+                },
+            )
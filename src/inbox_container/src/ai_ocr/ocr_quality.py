@@ -0,0 +1,125 @@
+"""Quality gate for OCR output of a light model.
+
+In cascade mode every page is OCRed by a light vision model first and only pages
+whose output fails this gate are OCRed again by the heavy model. The checks are
+cheap heuristics on the output text and the page image:
+
+- too short: far fewer characters than the ink on the page suggests. A page of
+  dense text is around 2 percent ink and yields well over a thousand characters
+  per percent of ink.
+- refusal: the model apologised or declined instead of transcribing.
+- garbage: a large share of characters that are neither text nor punctuation.
+- repetition: the same line over and over, a model stuck in a loop.
+- table structure: markdown table rows with differing column counts or without a
+  separator row, a sign the model lost track of the layout.
+"""
+
+from __future__ import annotations
+
+import re
+import string
+from collections import Counter
+
+from PIL import Image
+from strenum import StrEnum
+
+REFUSAL_PATTERN = re.compile(
+    r"^\W*(i'?m sorry|i am sorry|sorry,|i can(no|')t|i am unable|i'?m unable|unable to|as an ai)", re.IGNORECASE
+)
+"""Start of a response that declines to transcribe the image."""
+
+TEXT_SYMBOLS = set(string.punctuation) | set("–—•·…‘’“”°€£¥§©®™±×÷¶☐☑☒✓✔")
+"""Non alphanumeric characters expected in transcribed text."""
+
+TABLE_SEPARATOR_PATTERN = re.compile(r"^\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?$")
+"""Separator row below a markdown table header."""
+
+MIN_REPEATED_LINES = 5
+"""Min occurrences of one line for a response to count as stuck in a loop."""
+
+
+class QualityIssue(StrEnum):
+    """Reason OCR output failed the quality gate."""
+
+    TOO_SHORT = "too_short"
+    """Output is short for the amount of ink on the page."""
+    REFUSAL = "refusal"
+    """Model declined to transcribe the page."""
+    GARBAGE = "garbage"
+    """Output is mostly characters that are not text."""
+    REPETITION = "repetition"
+    """Output repeats the same line many times."""
+    TABLE_STRUCTURE = "table_structure"
+    """Markdown table rows are inconsistent."""
+
+
+def page_ink_ratio(image: Image.Image, *, ink_threshold: int = 128, sample_size: int = 512) -> float:
+    """Get the fraction of pixels of an image darker than ink_threshold on a downsampled grayscale copy."""
+    sample = image.convert("L")
+    sample.thumbnail((sample_size, sample_size), Image.Resampling.BILINEAR)
+    return sum(sample.histogram()[:ink_threshold]) / (sample.width * sample.height)
+
+
+def garbage_ratio(text: str) -> float:
+    """Get the fraction of non whitespace characters that are neither alphanumeric nor expected symbols."""
+    chars = [char for char in text if not char.isspace()]
+    if not chars:
+        return 0.0
+    return sum(1 for char in chars if not char.isalnum() and char not in TEXT_SYMBOLS) / len(chars)
+
+
+def has_repetition(lines: list[str]) -> bool:
+    """Check if a line of some length repeats often enough to suggest a generation loop."""
+    counts = Counter(line for line in lines if len(line) >= 8)
+    return bool(counts) and max(counts.values()) >= MIN_REPEATED_LINES and max(counts.values()) * 2 > len(lines)
+
+
+def table_cells(line: str) -> int:
+    """Count the cells of a markdown table row."""
+    return len(line.strip().strip("|").split("|"))
+
+
+def has_broken_table(lines: list[str]) -> bool:
+    """Check the markdown tables of some lines for a missing separator or differing column counts."""
+    table: list[str] = []
+    for line in [*lines, ""]:
+        if line.startswith("|"):
+            table.append(line)
+            continue
+        if len(table) >= 2:
+            if not TABLE_SEPARATOR_PATTERN.match(table[1]):
+                return True
+            if len({table_cells(row) for row in table}) > 1:
+                return True
+        table = []
+    return False
+
+
+def check_ocr_quality(
+    content: str, ink_ratio: float, *, min_chars_per_ink: float, max_garbage_ratio: float
+) -> list[QualityIssue]:
+    """Check OCR output for signs the model failed to transcribe the page.
+
+    Args:
+        content: Markdown returned by the model
+        ink_ratio: Fraction of ink pixels of the page image, see ``page_ink_ratio``
+        min_chars_per_ink: Min characters of output per percent of ink on the page
+        max_garbage_ratio: Max fraction of characters that are not text
+
+    Returns:
+        list[QualityIssue]: Issues found, empty if the output passes
+    """
+    text = content.strip().replace("```markdown", "").replace("```", "").strip()
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    issues: list[QualityIssue] = []
+    if len(text) < ink_ratio * 100 * min_chars_per_ink:
+        issues.append(QualityIssue.TOO_SHORT)
+    if REFUSAL_PATTERN.match(text[:200]):
+        issues.append(QualityIssue.REFUSAL)
+    if garbage_ratio(text) > max_garbage_ratio:
+        issues.append(QualityIssue.GARBAGE)
+    if has_repetition(lines):
+        issues.append(QualityIssue.REPETITION)
+    if has_broken_table(lines):
+        issues.append(QualityIssue.TABLE_STRUCTURE)
+    return issues
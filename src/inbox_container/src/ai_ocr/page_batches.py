@@ -0,0 +1,124 @@
+"""Packing several page images into a single model request.
+
+Every page request repeats the system prompt and pays a full round trip. In
+batching mode up to ``OcrConfig.batch_pages`` page images go into one user message,
+each preceded by its page number, and the model is asked to start the output of
+each page with a delimiter line. ``split_batch_response`` splits the response back
+into per page markdown. Pages missing from the response, and the last page of a
+response cut off by the output token limit, are OCRed again one page per request.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Generic, TypeVar
+
+from langchain_core.messages import BaseMessage
+
+BATCH_OCR_USER_PROMPT = (
+    "Please extract all text from each of the following page images into markdown. "
+    "Each image is preceded by its page number. Start the output of each page with a line containing only "
+    "<<<PAGE n>>> where n is the page number, and output the pages in the order given."
+)
+
+PAGE_DELIMITER_PATTERN = re.compile(r"^[ \t]*<<<PAGE (\d+)>>>[ \t]*$", re.MULTILINE)
+"""Delimiter line the model starts the output of each page with."""
+
+TRUNCATED_STOP_REASONS = {"max_tokens", "length"}
+"""Stop / finish reasons providers report when the output token limit was hit."""
+
+T = TypeVar("T")
+
+
+class PageBatcher(Generic[T]):
+    """Groups pages into batches of at most max_pages pages and max_tokens estimated input tokens.
+
+    Attributes:
+        max_pages: Max pages per batch
+        max_tokens: Max estimated input tokens per batch, a single page over it still forms a batch of its own
+    """
+
+    def __init__(self, *, max_pages: int, max_tokens: int) -> None:
+        self.max_pages = max_pages
+        self.max_tokens = max_tokens
+        self._pending: list[T] = []
+        self._pending_tokens = 0
+
+    def add(self, page: T, tokens: int) -> list[list[T]]:
+        """Add a page to the pending batch.
+
+        Args:
+            page: Page to add
+            tokens: Estimated input tokens of the page
+
+        Returns:
+            list[list[T]]: Batches that are complete and should be sent, empty if the pending batch still has room
+        """
+        ready: list[list[T]] = []
+        if self._pending and self._pending_tokens + tokens > self.max_tokens:
+            ready.append(self.flush())
+        self._pending.append(page)
+        self._pending_tokens += tokens
+        if len(self._pending) >= self.max_pages:
+            ready.append(self.flush())
+        return ready
+
+    def flush(self) -> list[T]:
+        """Take the pending batch, which may be empty."""
+        ready, self._pending, self._pending_tokens = self._pending, [], 0
+        return ready
+
+
+def build_batch_content(
+    pages: list[tuple[int, str]], prompt_content: list[dict[str, Any]] | None = None
+) -> list[dict[str, Any]]:
+    """Build the user message content of a batched request.
+
+    Args:
+        pages: Page number and base64 data url of each page image
+        prompt_content: Content blocks of the batch prompt, such as the prompt followed by a cache breakpoint
+
+    Returns:
+        list: Message content parts with the prompt and a label before each image
+    """
+    content: list[dict[str, Any]] = list(prompt_content or [{"type": "text", "text": BATCH_OCR_USER_PROMPT}])
+    for page_num, image_url in pages:
+        content.append({"type": "text", "text": f"Page {page_num}:"})
+        content.append({"type": "image_url", "image_url": {"url": image_url}})
+    return content
+
+
+def split_batch_response(content: str, page_nums: list[int]) -> dict[int, str]:
+    """Split a batched response into the markdown of each page.
+
+    Sections for unexpected page numbers and empty sections are ignored. If a page number
+    appears more than once the response is ambiguous and nothing is returned.
+
+    Args:
+        content: Response text
+        page_nums: Page numbers sent in the request
+
+    Returns:
+        dict[int, str]: Markdown of each page found in the response, in response order
+    """
+    matches = list(PAGE_DELIMITER_PATTERN.finditer(content))
+    found = [int(match.group(1)) for match in matches]
+    if len(found) != len(set(found)):
+        return {}
+    sections: dict[int, str] = {}
+    for index, match in enumerate(matches):
+        page_num = int(match.group(1))
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(content)
+        text = content[match.end() : end].strip()
+        if page_num in page_nums and text:
+            sections[page_num] = text
+    return sections
+
+
+def is_truncated(response: BaseMessage) -> bool:
+    """Check if a response was cut off by the output token limit."""
+    metadata = getattr(response, "response_metadata", None) or {}
+    return any(
+        str(metadata.get(key, "")).lower() in TRUNCATED_STOP_REASONS
+        for key in ("stop_reason", "stopReason", "finish_reason")
+    )
@@ -0,0 +1,139 @@
+"""Bundle output of a document: one object holding every page plus a JSON manifest.
+
+By default a document produces an S3 object per page image and per page markdown
+next to the source and the final markdown, each costing a PUT and an outbox event.
+In bundle mode the page images and page markdown are appended to a single bundle
+object instead, and a small manifest lists the byte range of every record. Markdown
+records are independent gzip members, images are stored as they are since JPEG does
+not compress further, so a reader fetches a single page with one ranged GET:
+
+    manifest = json.loads(s3.get_object(Bucket=bucket, Key=manifest_key)["Body"].read())
+    record = manifest["pages"][0]["markdown"]
+    byte_range = f"bytes={record['offset']}-{record['offset'] + record['length'] - 1}"
+    body = s3.get_object(Bucket=bucket, Key=manifest["bundle"], Range=byte_range)["Body"].read()
+    markdown = gzip.decompress(body).decode("utf-8")
+
+Records are appended to a local file as pages are rendered and OCRed, the bundle is
+uploaded once when the document is done.
+"""
+
+from __future__ import annotations
+
+import gzip
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from strenum import StrEnum
+
+BUNDLE_VERSION = 1
+"""Version of the bundle and manifest layout, bumped on incompatible changes."""
+
+
+class BundleRecordKind(StrEnum):
+    """Kind of a page record in the bundle."""
+
+    IMAGE = "image"
+    """Page image sent to the model."""
+    MARKDOWN = "markdown"
+    """Page markdown including the page footer."""
+
+
+@dataclass
+class BundleRecord:
+    """Location of a record in the bundle."""
+
+    offset: int
+    """Byte offset of the record in the bundle."""
+    length: int
+    """Length of the record in bytes."""
+    content_type: str
+    """Media type of the record once decoded."""
+    encoding: str | None = None
+    """Content encoding of the stored bytes, gzip or None if stored as is."""
+
+
+class PageBundleWriter:
+    """Appends page records to a local bundle file and builds its manifest.
+
+    Attributes:
+        path: Local bundle file
+    """
+
+    def __init__(self, path: Path, *, compress_level: int = 6) -> None:
+        self.path = path
+        self._compress_level = compress_level
+        self._lock = threading.Lock()
+        self._file = path.open("wb")
+        self._offset = 0
+        self._records: dict[int, dict[BundleRecordKind, BundleRecord]] = {}
+
+    @property
+    def size(self) -> int:
+        """Bytes written to the bundle so far."""
+        with self._lock:
+            return self._offset
+
+    def add(
+        self, page_num: int, kind: BundleRecordKind, data: bytes, *, content_type: str, compress: bool = False
+    ) -> BundleRecord:
+        """Append a page record, replacing an earlier record of the same page and kind in the manifest.
+
+        Args:
+            page_num: Page number of the record
+            kind: Kind of record
+            data: Record content
+            content_type: Media type of the content
+            compress: Store the content as a gzip member
+
+        Returns:
+            BundleRecord: Location of the record in the bundle
+        """
+        if compress:
+            data = gzip.compress(data, compresslevel=self._compress_level, mtime=0)
+        with self._lock:
+            self._file.write(data)
+            record = BundleRecord(
+                offset=self._offset, length=len(data), content_type=content_type, encoding="gzip" if compress else None
+            )
+            self._offset += len(data)
+            self._records.setdefault(page_num, {})[kind] = record
+        return record
+
+    def close(self) -> None:
+        """Flush and close the bundle file."""
+        with self._lock:
+            self._file.close()
+
+    def manifest(self, *, bundle_key: str, pages: dict[int, dict[str, Any]], **fields: Any) -> dict[str, Any]:
+        """Build the manifest of the bundle.
+
+        Args:
+            bundle_key: S3 key the bundle is uploaded to
+            pages: Extra fields of each page such as its status, tokens and timings
+            **fields: Document level fields such as the source key and model
+
+        Returns:
+            dict: Json serializable manifest with a record per page in page order
+        """
+        with self._lock:
+            records = {page_num: dict(page_records) for page_num, page_records in self._records.items()}
+            size = self._offset
+        return {
+            "version": BUNDLE_VERSION,
+            "bundle": bundle_key,
+            "bundle_bytes": size,
+            **fields,
+            "pages": [
+                {
+                    "page": page_num,
+                    **pages.get(page_num, {}),
+                    **{
+                        str(kind): {key: value for key, value in asdict(record).items() if value is not None}
+                        for kind, record in records.get(page_num, {}).items()
+                    },
+                }
+                for page_num in sorted(records.keys() | pages.keys())
+            ],
+        }
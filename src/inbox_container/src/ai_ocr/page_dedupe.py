@@ -0,0 +1,118 @@
+"""Detection of repeated pages within a document.
+
+Scanned contracts often repeat pages such as signature pages or blank separator
+pages. ``DuplicatePageIndex`` groups near identical pages so each group is only
+OCRed once and the result is fanned out to every page in the group.
+
+Pages are matched in two steps:
+
+- A difference hash (dHash) of a small grayscale thumbnail finds candidate pages
+  cheaply. Only the hashes of previously seen pages are kept in memory.
+- Candidates are confirmed by comparing the full size grayscale pages pixel by
+  pixel, since pages of body text with the same layout can share a thumbnail hash
+  while differing in a few words. Confirmation is strict on purpose: missing a
+  duplicate costs one model call, a false match puts the wrong text on a page.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from PIL import Image, ImageChops
+
+from ai_ocr.page_image import PageImage
+
+DHASH_SIZE = 16
+
+
+def dhash(image: Image.Image, hash_size: int = DHASH_SIZE) -> int:
+    """Compute the difference hash of an image.
+
+    Args:
+        image: Image to hash
+        hash_size: Width and height of the hash grid, the hash has hash_size * hash_size bits
+
+    Returns:
+        int: Hash where each bit is set if a thumbnail pixel is brighter than its right neighbour
+    """
+    thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = list(thumbnail.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return (a ^ b).bit_count()
+
+
+def count_differing_pixels(a: Image.Image, b: Image.Image, threshold: int) -> int:
+    """Count pixels whose grayscale values differ by more than threshold.
+
+    Images of different sizes are treated as completely different.
+    """
+    if a.size != b.size:
+        return a.width * a.height
+    diff = ImageChops.difference(a.convert("L"), b.convert("L"))
+    return sum(diff.histogram()[threshold + 1 :])
+
+
+@dataclass
+class PageHash:
+    """Hash of a page that was sent to OCR."""
+
+    page_num: int
+    """Page number."""
+    image: PageImage
+    """Rendered page image, decoded again to confirm a candidate match."""
+    hash: int
+    """Difference hash of the page."""
+
+
+class DuplicatePageIndex:
+    """Groups near identical pages of a document.
+
+    Pages must be added in page order from a single thread at a time. The images of
+    unique pages are kept for comparison with later pages.
+
+    Attributes:
+        max_distance: Max hash distance for a page to be considered a candidate duplicate
+        pixel_threshold: Grayscale difference above which a pixel counts as changed
+        max_diff_pixels: Max number of changed pixels for a candidate to be confirmed as duplicate
+        duplicates: Map of duplicate page number to the page number whose OCR result it reuses
+    """
+
+    def __init__(self, *, max_distance: int = 10, pixel_threshold: int = 48, max_diff_pixels: int = 16) -> None:
+        self.max_distance = max_distance
+        self.pixel_threshold = pixel_threshold
+        self.max_diff_pixels = max_diff_pixels
+        self.duplicates: dict[int, int] = {}
+        self._pages: list[PageHash] = []
+
+    def find_duplicate(self, page_image: PageImage, page_num: int) -> int | None:
+        """Match a page against the pages added so far.
+
+        Args:
+            page_image: Rendered page image
+            page_num: Page number
+
+        Returns:
+            int | None: Page number of the earlier page this page duplicates, or None if the page is unique.
+                Unique pages are remembered so later pages can match them.
+        """
+        with page_image.open() as image:
+            page_hash = dhash(image)
+            for candidate in self._pages:
+                if hamming_distance(page_hash, candidate.hash) > self.max_distance:
+                    continue
+                with candidate.image.open() as candidate_image:
+                    diff_pixels = count_differing_pixels(image, candidate_image, self.pixel_threshold)
+                if diff_pixels <= self.max_diff_pixels:
+                    self.duplicates[page_num] = candidate.page_num
+                    return candidate.page_num
+        self._pages.append(PageHash(page_num=page_num, image=page_image, hash=page_hash))
+        return None
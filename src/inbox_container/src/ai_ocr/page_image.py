@@ -0,0 +1,156 @@
+"""Encoded page images held in memory with spill to disk under memory pressure.
+
+Each rendered page is encoded once. The same bytes are then used for the s3
+page upload, duplicate detection and the base64 model payload, so a page never
+round trips through Lambda's slow ephemeral storage unless memory runs short.
+
+``PageImageStore`` keeps track of the encoded bytes held in memory. When adding
+a page would take it over ``max_memory_bytes``, the oldest pages still in memory
+are written to ``spill_dir`` until it fits again.
+"""
+
+from __future__ import annotations
+
+import io
+import shutil
+import threading
+from pathlib import Path
+from typing import Literal
+
+from PIL import Image
+
+from ai_ocr.lib.par_ai_core.llm_image_utils import try_get_image_type
+
+
+class PageImage:
+    """Encoded image of a single page, held in memory or in a file.
+
+    Attributes:
+        name: File name of the page without extension such as doc-page001
+        suffix: Page suffix such as -page001.jpg, used to name the page's output files
+        path: File holding the image if it is not in memory
+    """
+
+    def __init__(self, *, name: str, suffix: str, data: bytes | None = None, path: Path | None = None) -> None:
+        if data is None and path is None:
+            raise ValueError("PageImage needs either data or a path")
+        self.name = name
+        self.suffix = suffix
+        self.path = path
+        self._data = data
+
+    @property
+    def in_memory(self) -> bool:
+        """True if the image bytes are held in memory."""
+        return self._data is not None
+
+    @property
+    def image_type(self) -> Literal["jpeg", "png", "gif"]:
+        """Image type based on the suffix."""
+        return try_get_image_type(self.suffix)
+
+    def read_bytes(self) -> bytes:
+        """Get the encoded image."""
+        data = self._data
+        if data is not None:
+            return data
+        if self.path is None:
+            raise ValueError(f"Image of {self.name} has been released")
+        return self.path.read_bytes()
+
+    def open(self) -> Image.Image:
+        """Decode the image."""
+        return Image.open(io.BytesIO(self.read_bytes()))
+
+    def __repr__(self) -> str:
+        return f"PageImage({self.name!r}, in_memory={self.in_memory})"
+
+
+class PageImageStore:
+    """Tracks the page images of a document and spills them to disk under memory pressure.
+
+    Safe to use from several threads.
+
+    Attributes:
+        spill_dir: Directory spilled images are written to, only used by this store
+        max_memory_bytes: Max total size of the encoded images held in memory
+    """
+
+    def __init__(self, *, spill_dir: Path, max_memory_bytes: int) -> None:
+        self.spill_dir = spill_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # pages in memory in the order they were added, oldest first
+        self._in_memory: dict[str, PageImage] = {}
+        self._memory_bytes = 0
+        self._spilled = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        """Total size of the encoded images held in memory."""
+        with self._lock:
+            return self._memory_bytes
+
+    @property
+    def spilled(self) -> int:
+        """Number of pages spilled to disk so far."""
+        with self._lock:
+            return self._spilled
+
+    def add_image(self, *, name: str, suffix: str, image: Image.Image, **save_kwargs) -> PageImage:
+        """Encode an image once and add it to the store.
+
+        Args:
+            name: File name of the page without extension
+            suffix: Page suffix, its extension selects the encoding
+            image: Decoded page image
+            **save_kwargs: Extra arguments for PIL's Image.save such as quality
+
+        Returns:
+            PageImage: Encoded page
+        """
+        buffer = io.BytesIO()
+        image.save(buffer, try_get_image_type(suffix).upper(), **save_kwargs)
+        return self.add(name=name, suffix=suffix, data=buffer.getvalue())
+
+    def add(self, *, name: str, suffix: str, data: bytes) -> PageImage:
+        """Add encoded page bytes to the store, spilling older pages or this one if memory is short."""
+        page = PageImage(name=name, suffix=suffix, data=data)
+        with self._lock:
+            self._in_memory[page.name] = page
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes and self._in_memory:
+                self._spill(next(iter(self._in_memory.values())))
+        return page
+
+    def _spill(self, page: PageImage) -> None:
+        """Write a page to disk and drop its bytes. Must hold the lock."""
+        data = page.read_bytes()
+        path = self.spill_dir / (page.name + Path(page.suffix).suffix)
+        path.write_bytes(data)
+        page.path = path
+        page._data = None  # pylint: disable=protected-access
+        del self._in_memory[page.name]
+        self._memory_bytes -= len(data)
+        self._spilled += 1
+
+    def release(self, page: PageImage) -> None:
+        """Drop a page that is no longer needed from memory and disk."""
+        with self._lock:
+            data = page._data  # pylint: disable=protected-access
+            if data is not None and self._in_memory.pop(page.name, None) is page:
+                self._memory_bytes -= len(data)
+            page._data = None  # pylint: disable=protected-access
+            if page.path and page.path.parent == self.spill_dir:
+                page.path.unlink(missing_ok=True)
+            page.path = None
+
+    def clear(self) -> None:
+        """Drop every page held in memory and remove the spill directory."""
+        with self._lock:
+            for page in self._in_memory.values():
+                page._data = None  # pylint: disable=protected-access
+            self._in_memory.clear()
+            self._memory_bytes = 0
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
@@ -0,0 +1,188 @@
+"""Streaming of page responses into their output objects on S3.
+
+In streaming mode a page request consumes the model's response chunk by chunk
+instead of waiting for the whole message. Each chunk is cleaned as it arrives, the
+same way ``clean_ocr_content`` cleans a whole response, and written to an
+``S3MultipartWriter`` for the page's output object. The writer buffers the text and
+uploads a multipart part whenever a part's worth has arrived, so a long response is
+on S3 before the model finishes and its parts can be listed while the upload is in
+progress. S3 parts are at least 5 MiB, a response shorter than a part is written
+with a single put when it completes. A failed or cancelled request aborts its upload
+so a retry or failover starts from an empty object.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+from aws_lambda_powertools import Logger
+from langchain_core.messages import BaseMessage
+
+logger = Logger()
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+"""Min size of every multipart part but the last."""
+
+MARKDOWN_FENCE = "```markdown"
+"""Fence models wrap their markdown output in, stripped from the page output."""
+
+
+def page_footer(page_num: int) -> str:
+    """Footer appended to the markdown of a page."""
+    return "\n\nPage # " + str(page_num) + "\n"
+
+
+def message_text(message: BaseMessage) -> str:
+    """Get the text of a message or message chunk whose content may be a list of content blocks."""
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        block if isinstance(block, str) else str(block.get("text", ""))
+        for block in message.content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
+
+
+@dataclass
+class PageStream:
+    """Output object a page response is streamed to."""
+
+    key: str
+    """Key of the page's markdown object in the output bucket."""
+    page_num: int
+    """Page number, used for the page footer."""
+
+
+class MarkdownStreamCleaner:
+    """Incremental version of ``clean_ocr_content`` for a response arriving in chunks.
+
+    Leading whitespace is dropped and trailing whitespace is held back until more text
+    follows it. Fences are stripped a line at a time, a fence never spans a line break
+    so the text after the last line break is held back until the line is complete.
+
+    Attributes:
+        page_num: Page number used for the footer
+    """
+
+    def __init__(self, page_num: int) -> None:
+        self.page_num = page_num
+        self._started = False
+        self._whitespace = ""
+        self._pending = ""
+
+    def feed(self, text: str) -> str:
+        """Add a chunk of the response and get the cleaned text that is final."""
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        stripped = text.rstrip()
+        if not stripped:
+            self._whitespace += text
+            return ""
+        text, self._whitespace = self._whitespace + stripped, text[len(stripped) :]
+        return self._strip_fences(text)
+
+    def _strip_fences(self, text: str) -> str:
+        text = self._pending + text
+        split = text.rfind("\n") + 1
+        self._pending = text[split:]
+        return text[:split].replace(MARKDOWN_FENCE, "").replace("```", "")
+
+    def finish(self) -> str:
+        """Get the remaining cleaned text and the page footer once the response is complete."""
+        tail, self._pending, self._whitespace = self._pending, "", ""
+        return tail.replace(MARKDOWN_FENCE, "").replace("```", "") + page_footer(self.page_num)
+
+
+class S3MultipartWriter:
+    """Writes an S3 object in multipart parts as its data arrives.
+
+    Data is buffered until a part is full. ``close`` completes the upload, or puts the
+    object with a single request if it never filled a part. Used as a context manager
+    the upload is aborted if the block raises.
+
+    Attributes:
+        bucket: Bucket of the object
+        key: Key of the object
+        part_size: Size of the parts uploaded, at least MIN_PART_SIZE
+        bytes_written: Bytes written so far
+    """
+
+    def __init__(self, client: Any, bucket: str, key: str, *, part_size: int = 2 * MIN_PART_SIZE) -> None:
+        self._client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._upload_id: str | None = None
+        self._parts: list[dict[str, Any]] = []
+
+    def __enter__(self) -> S3MultipartWriter:
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def part_ready(self) -> bool:
+        """True if the buffer holds a full part waiting for upload_parts."""
+        return len(self._buffer) >= self.part_size
+
+    def append(self, data: str | bytes) -> None:
+        """Add data to the buffer without uploading, for callers that upload parts off the event loop."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buffer += data
+        self.bytes_written += len(data)
+
+    def write(self, data: str | bytes) -> None:
+        """Add data, uploading a part for every full part buffered."""
+        self.append(data)
+        self.upload_parts()
+
+    def upload_parts(self) -> None:
+        """Upload the full parts in the buffer."""
+        while self.part_ready:
+            self._upload_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+
+    def _upload_part(self, body: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(Bucket=self.bucket, Key=self.key)["UploadId"]
+        part_number = len(self._parts) + 1
+        response = self._client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=body
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        logger.info(f"Uploaded part {part_number} of {self.key}, {self.bytes_written} bytes so far")
+
+    def close(self) -> None:
+        """Upload the rest of the buffer and complete the object."""
+        if self._upload_id is None:
+            self._client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self._client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts}
+            )
+        self._buffer.clear()
+        self._upload_id = None
+
+    def abort(self) -> None:
+        """Drop the buffer and abort the multipart upload if one was started, nothing is written."""
+        self._buffer.clear()
+        if self._upload_id is None:
+            return
+        upload_id, self._upload_id = self._upload_id, None
+        try:
+            self._client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=upload_id)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning(f"Aborting multipart upload of {self.key} failed: {e}")
@@ -0,0 +1,158 @@
+"""Tiled OCR of pages too large for the model's image resolution.
+
+Providers scale images down to a fixed resolution, so on large format pages such
+as engineering drawings and A3 scans small print ends up a few pixels high and the
+model drops or invents text. Pages the image policy would shrink below
+``min_scale`` of their size are instead split into overlapping tiles that each fit
+the policy without scaling. The tiles are OCRed separately and their markdown is
+stitched back together in reading order (rows top to bottom, tiles left to right).
+
+Text in the overlap between two tiles is usually returned by both, so lines of a
+tile that also appear in the tile to its left, above it or above left are dropped
+while stitching. Only lines with enough characters to be distinctive are dropped,
+so short repeated cells such as table separators are kept.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass
+
+from PIL import Image
+
+from ai_ocr.lib.par_ai_core.llm_image_policy import DEFAULT_MAX_LONG_EDGE, ImagePolicy
+
+MIN_DEDUPE_LINE_CHARS = 8
+"""Min characters of a normalized line for it to be dropped as overlap."""
+
+LINE_PREFIX_PATTERN = re.compile(r"^[#>*\-\s]+")
+"""Markdown heading, quote and list markers the model may add to a cut off line."""
+
+
+@dataclass
+class PageTile:
+    """Encoded tile of a page."""
+
+    row: int
+    """Row of the tile in the grid, 0 is the top row."""
+    col: int
+    """Column of the tile in the grid, 0 is the left column."""
+    data: bytes
+    """Tile encoded as JPEG."""
+
+
+def needs_tiling(width: int, height: int, policy: ImagePolicy, *, min_scale: float) -> bool:
+    """Check if an image is too large for the model to read at its own resolution.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        policy: Image policy of the model the image is sent to
+        min_scale: Smallest scale the policy may shrink the image to before it is tiled
+
+    Returns:
+        bool: True if the policy would scale the image down below min_scale
+    """
+    fit_width, _ = policy.fit_size(width, height)
+    return fit_width / width < min_scale
+
+
+def tile_size(policy: ImagePolicy) -> tuple[int, int]:
+    """Get the largest square tile the policy sends without scaling it down."""
+    edge = policy.max_long_edge or DEFAULT_MAX_LONG_EDGE
+    return policy.fit_size(edge, edge)
+
+
+def axis_tile_starts(length: int, tile: int, overlap: int) -> list[int]:
+    """Get the start offsets of tiles covering an axis with at least overlap pixels between neighbours."""
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    # spread the tiles evenly so the last tile ends at the edge
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+
+def tile_boxes(
+    width: int, height: int, tile_width: int, tile_height: int, *, overlap: float
+) -> list[tuple[int, int, tuple[int, int, int, int]]]:
+    """Split an image into a grid of overlapping tiles.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        tile_width: Max tile width in pixels
+        tile_height: Max tile height in pixels
+        overlap: Min overlap between neighbouring tiles as a fraction of the tile size
+
+    Returns:
+        list: Row, column and (left, top, right, bottom) crop box of each tile in reading order
+    """
+    xs = axis_tile_starts(width, tile_width, int(tile_width * overlap))
+    ys = axis_tile_starts(height, tile_height, int(tile_height * overlap))
+    return [
+        (row, col, (x, y, min(x + tile_width, width), min(y + tile_height, height)))
+        for row, y in enumerate(ys)
+        for col, x in enumerate(xs)
+    ]
+
+
+def split_page_tiles(image: Image.Image, policy: ImagePolicy, *, overlap: float, max_tiles: int) -> list[PageTile]:
+    """Split a page into overlapping tiles that each fit the image policy.
+
+    Args:
+        image: Decoded page image
+        policy: Image policy of the model the tiles are sent to
+        overlap: Min overlap between neighbouring tiles as a fraction of the tile size
+        max_tiles: Max number of tiles, larger pages are scaled down until they fit
+
+    Returns:
+        list[PageTile]: Encoded tiles in reading order
+    """
+    tile_width, tile_height = tile_size(policy)
+    scale = 1.0
+    while True:
+        width, height = max(1, round(image.width * scale)), max(1, round(image.height * scale))
+        boxes = tile_boxes(width, height, tile_width, tile_height, overlap=overlap)
+        if len(boxes) <= max_tiles:
+            break
+        scale *= 0.9
+    if scale < 1.0:
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    return [PageTile(row=row, col=col, data=policy.encode(image.crop(box))) for row, col, box in boxes]
+
+
+def normalize_line(line: str) -> str:
+    """Normalize a markdown line for overlap comparison."""
+    return LINE_PREFIX_PATTERN.sub("", " ".join(line.split())).lower()
+
+
+def stitch_tile_markdown(tiles: list[tuple[int, int, str]]) -> str:
+    """Join the markdown of a page's tiles, dropping lines repeated from overlapping neighbours.
+
+    Args:
+        tiles: Row, column and markdown of each tile
+
+    Returns:
+        str: Markdown of the page in reading order
+    """
+    lines_by_tile: dict[tuple[int, int], set[str]] = {}
+    parts: list[str] = []
+    for row, col, text in sorted(tiles, key=lambda tile: (tile[0], tile[1])):
+        text = text.strip().replace("```markdown", "").replace("```", "")
+        neighbour_lines: set[str] = set()
+        for neighbour in ((row, col - 1), (row - 1, col), (row - 1, col - 1)):
+            neighbour_lines |= lines_by_tile.get(neighbour, set())
+        kept: list[str] = []
+        seen: set[str] = set()
+        for line in text.splitlines():
+            normalized = normalize_line(line)
+            seen.add(normalized)
+            if len(normalized) >= MIN_DEDUPE_LINE_CHARS and normalized in neighbour_lines:
+                continue
+            kept.append(line)
+        lines_by_tile[(row, col)] = seen
+        part = "\n".join(kept).strip()
+        if part:
+            parts.append(part)
+    return "\n\n".join(parts)
@@ -0,0 +1,120 @@
+"""Summary of what happened to each page of an OCR run."""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+
+@dataclass
+class OcrRunSummary:
+    """Page counts and page numbers for an OCR run, logged when the run finishes."""
+
+    pages: int = 0
+    """Number of pages in the document."""
+    ocr_pages: list[int] = field(default_factory=list)
+    """Pages sent to the model or answered from the OCR cache."""
+    text_pages: list[int] = field(default_factory=list)
+    """Pages taken from the embedded text layer instead of vision OCR."""
+    blank_pages: list[int] = field(default_factory=list)
+    """Pages skipped as blank."""
+    duplicate_pages: dict[int, int] = field(default_factory=dict)
+    """Pages that reused the OCR result of an earlier identical page, mapped to that page."""
+    error_pages: list[int] = field(default_factory=list)
+    """Pages whose OCR failed."""
+    tiled_pages: dict[int, int] = field(default_factory=dict)
+    """Oversized pages OCRed as tiles, mapped to their number of tiles."""
+    cascade_pages: list[int] = field(default_factory=list)
+    """Pages OCRed by the light model of the cascade."""
+    escalated_pages: dict[int, list[str]] = field(default_factory=dict)
+    """Cascade pages whose light model output failed the quality gate, mapped to the issues found."""
+    cascade_saved_cost: float = 0.0
+    """Cost saved by the cascade compared with OCRing the cascade pages with the heavy model only."""
+    hedged_pages: list[int] = field(default_factory=list)
+    """Pages with a slow request that got a duplicate hedge request."""
+    streamed_pages: list[int] = field(default_factory=list)
+    """Pages whose response was streamed into their output object."""
+    batched_pages: list[int] = field(default_factory=list)
+    """Pages OCRed in multi page requests."""
+    batch_requests: int = 0
+    """Number of multi page requests sent."""
+    image_bytes: dict[int, int] = field(default_factory=dict)
+    """Size of the image sent to the model per page."""
+    image_tokens: dict[int, int] = field(default_factory=dict)
+    """Estimated input tokens of the image sent to the model per page."""
+    page_usage: dict[int, dict[str, int]] = field(default_factory=dict)
+    """Model input and output tokens per page, split evenly across the pages of a multi page request."""
+    page_seconds: dict[int, float] = field(default_factory=dict)
+    """Wall clock time spent on the model requests of each page."""
+    seconds: float = 0.0
+    """Wall clock time spent on OCR."""
+    input_bytes: int = 0
+    """Size of the source document."""
+    input_seconds: float = 0.0
+    """Wall clock time spent downloading the source document."""
+    first_page_seconds: float = 0.0
+    """Wall clock time from the start of the run until the first page image was ready."""
+    peak_disk_bytes: int = 0
+    """Most ephemeral storage the run used at once."""
+
+    @property
+    def escalation_rate(self) -> float:
+        """Fraction of cascade pages escalated to the heavy model."""
+        return len(self.escalated_pages) / len(self.cascade_pages) if self.cascade_pages else 0.0
+
+    def page_status(self, page_num: int) -> str:
+        """Get what happened to a page: error, blank, duplicate, text or ocr."""
+        if page_num in self.error_pages:
+            return "error"
+        if page_num in self.blank_pages:
+            return "blank"
+        if page_num in self.duplicate_pages:
+            return "duplicate"
+        if page_num in self.text_pages:
+            return "text"
+        return "ocr"
+
+    def page_details(self) -> dict[int, dict[str, Any]]:
+        """Get the status, tokens and timing of each page."""
+        details: dict[int, dict[str, Any]] = {}
+        for page_num in range(1, self.pages + 1):
+            page: dict[str, Any] = {"status": self.page_status(page_num)}
+            if page_num in self.duplicate_pages:
+                page["duplicate_of"] = self.duplicate_pages[page_num]
+            if page_num in self.tiled_pages:
+                page["tiles"] = self.tiled_pages[page_num]
+            if page_num in self.image_tokens:
+                page["image_tokens"] = self.image_tokens[page_num]
+            page.update(self.page_usage.get(page_num, {}))
+            if page_num in self.page_seconds:
+                page["seconds"] = round(self.page_seconds[page_num], 3)
+            details[page_num] = page
+        return details
+
+    def to_json(self) -> dict[str, Any]:
+        """Convert the summary to a json serializable dict."""
+        ret = asdict(self)
+        for key in (
+            "ocr_pages",
+            "text_pages",
+            "blank_pages",
+            "error_pages",
+            "cascade_pages",
+            "hedged_pages",
+            "streamed_pages",
+            "batched_pages",
+        ):
+            ret[key] = sorted(ret[key])
+        # per page sizes are reported as totals and averages to keep the log record small
+        for key in ("image_bytes", "image_tokens"):
+            values = ret.pop(key)
+            ret[f"{key}_total"] = sum(values.values())
+            ret[f"{key}_per_page"] = round(sum(values.values()) / len(values)) if values else 0
+        # per page usage and timings are in the bundle manifest
+        ret.pop("page_usage")
+        ret.pop("page_seconds")
+        ret["escalation_rate"] = round(self.escalation_rate, 3)
+        ret["cascade_saved_cost"] = round(self.cascade_saved_cost, 6)
+        for key in ("seconds", "input_seconds", "first_page_seconds"):
+            ret[key] = round(ret[key], 3)
+        return ret
@@ -0,0 +1,343 @@
+"""Download of the source document and the disk footprint of a run.
+
+The source is fetched with concurrent ranged GETs of ``part_size`` bytes, each
+written at its offset of a local file created at the object's full size, so a
+large scan downloads at the bandwidth of several connections instead of one.
+Parts are requested in file order and ``ProgressiveDownload.wait_for`` blocks
+until a prefix of the file is downloaded, so the start of the file can be read
+while the rest is still downloading.
+
+Poppler reads the cross reference table at the end of a pdf before any page, so
+a partially filled file can usually not be rendered. A pdf linearized for fast
+web view (PDF 1.7 annex F) is the exception: it starts with a linearization
+dictionary and the cross reference table, hint tables and every object of its
+first page, up to the ``/E`` offset of the dictionary. ``parse_linearization``
+reads that dictionary from the first bytes of the file so the first page can be
+rendered as soon as the download passes ``/E``.
+
+Lambda's ephemeral storage holds the source next to spilled page images and the
+bundle, so the free space is checked against the object size before the
+download starts, failing fast with ENOSPC instead of part way through.
+``DiskUsageTracker`` samples the storage used as the run progresses and reports
+its peak.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import errno
+import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+LINEARIZATION_HEAD_BYTES = 1024
+"""The linearization dictionary must be within the first 1024 bytes of a pdf."""
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+"""Size of the chunks a ranged GET response is written to the file in."""
+
+LINEARIZATION_DICT_RE = re.compile(
+    rb"%PDF-\d\.\d[^\r\n]*[\r\n]+(?:%[^\r\n]*[\r\n]+)*\s*\d+\s+\d+\s+obj\s*<<(.*?)>>", re.DOTALL
+)
+LINEARIZATION_ENTRY_RE = re.compile(rb"/([A-Za-z]+)\s+(\d+(?:\.\d+)?)")
+
+
+@dataclass
+class Linearization:
+    """Parameters of a pdf linearized for fast web view, from its linearization dictionary."""
+
+    length: int
+    """Length of the file the pdf was linearized as (/L). A different length means it was updated since."""
+    first_page_end: int
+    """Offset of the end of the first page section (/E)."""
+    page_count: int
+    """Number of pages in the document (/N)."""
+    first_page: int = 1
+    """Page number of the page in the first page section (/P plus one)."""
+
+
+def parse_linearization(head: bytes) -> Linearization | None:
+    """Parse the linearization dictionary of a pdf from its first bytes.
+
+    Args:
+        head: First LINEARIZATION_HEAD_BYTES bytes of the file
+
+    Returns:
+        Linearization | None: Linearization parameters, None unless the first object of the file is a
+            linearization dictionary
+    """
+    match = LINEARIZATION_DICT_RE.match(head)
+    if not match:
+        return None
+    entries = {key.decode(): value for key, value in LINEARIZATION_ENTRY_RE.findall(match.group(1))}
+    if "Linearized" not in entries or not {"L", "E", "N"} <= entries.keys():
+        return None
+    try:
+        return Linearization(
+            length=int(entries["L"]),
+            first_page_end=int(entries["E"]),
+            page_count=int(entries["N"]),
+            first_page=int(entries.get("P", 0)) + 1,
+        )
+    except ValueError:
+        return None
+
+
+@dataclass
+class InputDownload:
+    """Size and timing of a source download."""
+
+    bytes: int
+    """Size of the source object."""
+    parts: int
+    """Number of ranged GETs the object was downloaded with."""
+    seconds: float
+    """Wall clock time of the download."""
+
+    @property
+    def bytes_per_second(self) -> int:
+        """Download throughput."""
+        return round(self.bytes / self.seconds) if self.seconds > 0 else 0
+
+    def to_json(self) -> dict[str, Any]:
+        """Convert the download stats to a json serializable dict."""
+        return {
+            "input_bytes": self.bytes,
+            "input_parts": self.parts,
+            "input_seconds": round(self.seconds, 3),
+            "input_bytes_per_second": self.bytes_per_second,
+        }
+
+
+class ProgressiveDownload:
+    """Downloads an object with concurrent ranged GETs into a file that can be read as its prefix fills.
+
+    ``start`` checks the object fits on disk, creates the file at the object's size and queues a
+    ranged GET per part in file order on ``max_concurrency`` threads. Each part is written at its
+    offset as it arrives. ``wait_for`` blocks until the file is downloaded up to an offset and
+    ``wait`` until it is complete. ``close`` stops the download of a failed run.
+
+    Attributes:
+        bucket: Bucket of the object
+        key: Key of the object
+        path: Local file the object is downloaded to
+        size: Size of the object, set by start
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        bucket: str,
+        key: str,
+        path: Path,
+        *,
+        part_size: int,
+        max_concurrency: int,
+        reserve_bytes: int = 0,
+    ) -> None:
+        """Create a download, start it with start.
+
+        Args:
+            client: S3 client
+            bucket: Bucket of the object
+            key: Key of the object
+            path: Local file to download to
+            part_size: Size of each ranged GET
+            max_concurrency: Max ranged GETs in flight
+            reserve_bytes: Free space to leave on the file system for the rest of the run
+        """
+        self.bucket = bucket
+        self.key = key
+        self.path = path
+        self.size = 0
+        self._client = client
+        self._part_size = max(1, part_size)
+        self._max_concurrency = max(1, max_concurrency)
+        self._reserve_bytes = reserve_bytes
+        self._etag: str | None = None
+        self._fd = -1
+        self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._parts_done: list[bool] = []
+        self._filled = 0
+        self._error: BaseException | None = None
+        self._closed = False
+        self._start_time = 0.0
+        self._result: InputDownload | None = None
+        self._cond = threading.Condition()
+
+    @property
+    def filled_bytes(self) -> int:
+        """Length of the downloaded prefix of the file."""
+        with self._cond:
+            return self._filled
+
+    def start(self) -> None:
+        """Check the object fits on disk and start downloading it.
+
+        Raises:
+            OSError: ENOSPC if the object and reserve_bytes do not fit on the file system of path
+        """
+        self._start_time = time.monotonic()
+        head = self._client.head_object(Bucket=self.bucket, Key=self.key)
+        self.size = head["ContentLength"]
+        self._etag = head.get("ETag")
+        free = shutil.disk_usage(self.path.parent).free
+        if self.size + self._reserve_bytes > free:
+            raise OSError(
+                errno.ENOSPC,
+                f"s3://{self.bucket}/{self.key} is {self.size / 1024 / 1024:.1f} MB and "
+                f"{self._reserve_bytes / 1024 / 1024:.1f} MB are reserved for the run, "
+                f"only {free / 1024 / 1024:.1f} MB of storage are free at {self.path.parent}",
+            )
+        # sparse until written, the file only takes the disk space of the parts downloaded so far
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        os.ftruncate(self._fd, self.size)
+        parts = [(start, min(start + self._part_size, self.size)) for start in range(0, self.size, self._part_size)]
+        self._parts_done = [False] * len(parts)
+        logger.info(
+            f"Downloading s3://{self.bucket}/{self.key}, {self.size / 1024 / 1024:.1f} MB in {len(parts)} parts"
+        )
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(self._max_concurrency, max(1, len(parts))), thread_name_prefix="s3-input"
+        )
+        # the executor starts queued parts in submission order, so the file fills from the start
+        for index, (start, end) in enumerate(parts):
+            self._executor.submit(self._download_part, index, start, end)
+
+    def _download_part(self, index: int, start: int, end: int) -> None:
+        """Download the bytes [start, end) of the object and write them at their offset."""
+        if self._closed or self._error:
+            return
+        try:
+            kwargs = {"IfMatch": self._etag} if self._etag else {}
+            response = self._client.get_object(
+                Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end - 1}", **kwargs
+            )
+            offset = start
+            for chunk in response["Body"].iter_chunks(DOWNLOAD_CHUNK_SIZE):
+                if self._closed:
+                    return
+                os.pwrite(self._fd, chunk, offset)
+                offset += len(chunk)
+            if offset != end:
+                raise OSError(
+                    f"Ranged GET of bytes {start}-{end - 1} of s3://{self.bucket}/{self.key} ended at {offset}"
+                )
+        except BaseException as e:
+            with self._cond:
+                self._error = self._error or e
+                self._cond.notify_all()
+            return
+        with self._cond:
+            self._parts_done[index] = True
+            while self._filled < self.size and self._parts_done[self._filled // self._part_size]:
+                self._filled = min(self._filled + self._part_size, self.size)
+            self._cond.notify_all()
+
+    def wait_for(self, offset: int) -> None:
+        """Wait until the file is downloaded up to offset.
+
+        Raises:
+            BaseException: The error a ranged GET failed with
+        """
+        offset = min(offset, self.size)
+        with self._cond:
+            while self._filled < offset and self._error is None and not self._closed:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            if self._filled < offset:
+                raise RuntimeError(f"Download of s3://{self.bucket}/{self.key} was closed")
+
+    def read_head(self, length: int) -> bytes:
+        """Wait for and read the first length bytes of the file."""
+        self.wait_for(length)
+        return os.pread(self._fd, min(length, self.size), 0)
+
+    def wait(self) -> InputDownload:
+        """Wait until the download is complete.
+
+        Returns:
+            InputDownload: Size and timing of the download
+
+        Raises:
+            BaseException: The error a ranged GET failed with
+        """
+        if self._result:
+            return self._result
+        try:
+            self.wait_for(self.size)
+        except BaseException:
+            self.close()
+            raise
+        self._result = InputDownload(
+            bytes=self.size, parts=len(self._parts_done), seconds=time.monotonic() - self._start_time
+        )
+        self.close()
+        logger.info(
+            f"Downloaded s3://{self.bucket}/{self.key}, {self.size / 1024 / 1024:.1f} MB in {self._result.parts} "
+            f"parts in {self._result.seconds:.2f}s at {self._result.bytes_per_second / 1024 / 1024:.2f} MB/s",
+            extra={"s3_input": self._result.to_json()},
+        )
+        return self._result
+
+    def close(self) -> None:
+        """Stop the download, parts not started yet are dropped. Safe to call more than once."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class DiskUsageTracker:
+    """Tracks the peak storage used on a file system during a run.
+
+    Usage is relative to the storage used when the tracker is created, so the peak is
+    the most the run had on disk at once: the source, spilled page images and the
+    bundle. The run samples after the download and as each page image is produced,
+    the points its disk usage grows at.
+
+    Attributes:
+        path: Path on the file system to track
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._baseline = shutil.disk_usage(path).used
+        self._peak = 0
+        self._lock = threading.Lock()
+
+    @property
+    def peak_bytes(self) -> int:
+        """Most storage used at once since the tracker was created."""
+        with self._lock:
+            return self._peak
+
+    def sample(self) -> int:
+        """Sample the storage used now.
+
+        Returns:
+            int: Storage used now relative to when the tracker was created
+        """
+        try:
+            used = max(shutil.disk_usage(self.path).used - self._baseline, 0)
+        except OSError:
+            return 0
+        with self._lock:
+            self._peak = max(self._peak, used)
+        return used
@@ -0,0 +1,185 @@
+"""Background S3 transfers of a document run.
+
+The source document is archived next to the outputs with a server side copy, so
+its bytes never pass through the container. boto3's managed copy sends a single
+CopyObject request for small objects and copies parts in parallel with
+UploadPartCopy above ``TransferConfig.multipart_threshold``.
+
+Page images and other artifacts are uploaded from memory. They are small, so
+each goes up as a single PUT without the thread pool boto3 starts for every
+managed upload; uploads run in parallel on the ``S3Transfers`` threads instead.
+At most ``max_pending`` uploads are queued, ``upload`` blocks when the queue is
+full so a fast producer can not buffer a whole document in memory.
+
+Transfers run in a thread pool so they overlap with downloading, rendering and
+OCR; ``wait`` blocks until they are done and raises the first failure, so a
+caller that waits before writing the final output knows every artifact is on S3.
+A run that fails calls ``abort`` instead, which drops the queued transfers, waits
+for the running ones and logs their failures so the threads do not outlive it.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import io
+import threading
+import time
+from typing import Any
+
+from aws_lambda_powertools import Logger
+from boto3.s3.transfer import TransferConfig
+
+logger = Logger()
+
+SMALL_OBJECT_CONFIG = TransferConfig(multipart_threshold=64 * 1024 * 1024, use_threads=False)
+"""Transfer settings of artifact uploads, a single PUT each without a thread pool per upload."""
+
+
+class S3Transfers:
+    """Runs S3 transfers in background threads.
+
+    Attributes:
+        config: Transfer settings of copies, boto3 defaults if None
+        upload_config: Transfer settings of uploads
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        *,
+        max_workers: int = 4,
+        max_pending: int = 16,
+        config: TransferConfig | None = None,
+        upload_config: TransferConfig = SMALL_OBJECT_CONFIG,
+    ) -> None:
+        self._client = client
+        self.config = config
+        self.upload_config = upload_config
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3")
+        self._pending = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._futures: list[concurrent.futures.Future[None]] = []
+        self._uploads = 0
+        self._upload_bytes = 0
+        self._upload_start: float | None = None
+        self._upload_end = 0.0
+        self._closed = False
+
+    def _submit(self, fn: Any, *args: Any) -> concurrent.futures.Future[None]:
+        future = self._executor.submit(fn, *args)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def copy(self, source_bucket: str, source_key: str, bucket: str, key: str) -> concurrent.futures.Future[None]:
+        """Start a server side copy of an object.
+
+        Args:
+            source_bucket: Bucket of the object to copy
+            source_key: Key of the object to copy
+            bucket: Bucket to copy to
+            key: Key to copy to
+
+        Returns:
+            Future done when the copy is complete
+        """
+        return self._submit(self._copy, source_bucket, source_key, bucket, key)
+
+    def _copy(self, source_bucket: str, source_key: str, bucket: str, key: str) -> None:
+        start_time = time.monotonic()
+        self._client.copy({"Bucket": source_bucket, "Key": source_key}, bucket, key, Config=self.config)
+        logger.info(
+            f"Copied s3://{source_bucket}/{source_key} to s3://{bucket}/{key} in {time.monotonic() - start_time:.2f}s"
+        )
+
+    def upload(self, data: bytes, bucket: str, key: str) -> concurrent.futures.Future[None]:
+        """Queue an upload of data, blocking while max_pending uploads are queued.
+
+        Args:
+            data: Object content
+            bucket: Bucket to upload to
+            key: Key to upload to
+
+        Returns:
+            Future done when the object is on S3
+        """
+        self._pending.acquire()
+        try:
+            future = self._submit(self._upload, data, bucket, key)
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def _upload(self, data: bytes, bucket: str, key: str) -> None:
+        start_time = time.monotonic()
+        with self._lock:
+            if self._upload_start is None:
+                self._upload_start = start_time
+        self._client.upload_fileobj(io.BytesIO(data), bucket, key, Config=self.upload_config)
+        with self._lock:
+            self._uploads += 1
+            self._upload_bytes += len(data)
+            self._upload_end = max(self._upload_end, time.monotonic())
+
+    def snapshot(self) -> dict[str, Any]:
+        """Get the upload count, bytes and throughput as a metrics dict."""
+        with self._lock:
+            seconds = self._upload_end - self._upload_start if self._upload_start is not None else 0.0
+            return {
+                "uploads": self._uploads,
+                "upload_bytes": self._upload_bytes,
+                "upload_seconds": round(max(seconds, 0.0), 3),
+                "upload_bytes_per_second": round(self._upload_bytes / seconds) if seconds > 0 else 0,
+            }
+
+    def wait(self) -> None:
+        """Wait for the transfers started so far and raise the first failure."""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        error: BaseException | None = None
+        for future in futures:
+            if future.exception() is not None:
+                error = error or future.exception()
+        if error:
+            raise error
+
+    def close(self) -> None:
+        """Wait for the transfers, stop the threads, log the upload throughput and raise the first failure.
+
+        Does nothing if already closed or aborted.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
+            metrics = self.snapshot()
+            if metrics["uploads"]:
+                logger.info(
+                    f"Uploaded {metrics['uploads']} objects, {metrics['upload_bytes'] / 1024 / 1024:.1f} MB "
+                    f"in {metrics['upload_seconds']:.2f}s at "
+                    f"{metrics['upload_bytes_per_second'] / 1024 / 1024:.2f} MB/s",
+                    extra={"s3_uploads": metrics},
+                )
+
+    def abort(self) -> None:
+        """Drop the queued transfers, wait for the running ones and stop the threads without raising.
+
+        Used when the run fails, failures of the transfers that ran are logged. Does nothing if
+        already closed or aborted.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            futures, self._futures = self._futures, []
+        cancelled = sum(future.cancelled() for future in futures)
+        errors = [future.exception() for future in futures if not future.cancelled() and future.exception()]
+        for error in errors:
+            logger.warning(f"S3 transfer failed: {error}")
+        logger.info(f"Aborted S3 transfers, {cancelled} cancelled and {len(errors)} failed of {len(futures)}")
@@ -0,0 +1,99 @@
+"""Extraction and scoring of the embedded text layer of a pdf.
+
+Born-digital pdfs already carry their text, so rendering those pages and sending
+them to a vision model wastes both time and money. ``find_text_pages`` extracts
+every page's text with poppler's ``pdftotext`` and keeps the pages whose text
+looks complete; only the remaining pages need rasterizing and vision OCR.
+
+Text quality is scored from the share of printable characters and word-like
+tokens, with a penalty for glyphs pdftotext could not map to unicode. Scanned
+pages have no text or a sparse, garbled OCR layer and score low.
+"""
+
+from __future__ import annotations
+
+import re
+import subprocess
+from pathlib import Path
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+WORD_PATTERN = re.compile(r"[^\W\d_]{2,}")
+"""A run of at least two letters."""
+
+UNMAPPED_GLYPH_PATTERN = re.compile(r"�|\(cid:\d+\)")
+"""Replacement characters and (cid:N) markers emitted for glyphs with no unicode mapping."""
+
+
+def extract_text_layer(pdf_path: Path, *, timeout: float = 60) -> list[str]:
+    """Extract the text of every page of a pdf with pdftotext.
+
+    Args:
+        pdf_path: Pdf to extract
+        timeout: Max seconds pdftotext may run
+
+    Returns:
+        list[str]: Text of each page in page order
+    """
+    result = subprocess.run(
+        ["pdftotext", "-enc", "UTF-8", str(pdf_path), "-"],
+        capture_output=True,
+        check=True,
+        timeout=timeout,
+    )
+    # pages are separated by form feeds with one after the last page
+    pages = result.stdout.decode("utf-8", errors="replace").split("\f")
+    if pages and not pages[-1].strip():
+        pages.pop()
+    return pages
+
+
+def score_text_quality(text: str) -> float:
+    """Score how complete and readable extracted page text looks.
+
+    Args:
+        text: Extracted page text
+
+    Returns:
+        float: 0.0 for no or garbled text up to 1.0 for clean text
+    """
+    tokens = text.split()
+    if not tokens:
+        return 0.0
+    chars = "".join(tokens)
+    printable_ratio = sum(c.isprintable() for c in chars) / len(chars)
+    word_ratio = sum(1 for token in tokens if WORD_PATTERN.search(token)) / len(tokens)
+    unmapped_ratio = min(1.0, len(UNMAPPED_GLYPH_PATTERN.findall(text)) * 4 / len(chars))
+    return printable_ratio * word_ratio * (1.0 - unmapped_ratio)
+
+
+def find_text_pages(pdf_path: Path, *, min_chars: int = 200, min_quality: float = 0.6) -> dict[int, str]:
+    """Find the pages of a pdf whose embedded text can be used instead of vision OCR.
+
+    Extraction failures are logged and treated as a pdf without a text layer.
+
+    Args:
+        pdf_path: Pdf to check
+        min_chars: Min number of non whitespace characters for a page to be a text page
+        min_quality: Min ``score_text_quality`` for a page to be a text page
+
+    Returns:
+        dict[int, str]: Text of each usable page keyed by page number
+    """
+    try:
+        page_texts = extract_text_layer(pdf_path)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not extract text layer from {pdf_path}: {e}")
+        return {}
+
+    text_pages: dict[int, str] = {}
+    for page_num, text in enumerate(page_texts, start=1):
+        char_count = len("".join(text.split()))
+        if char_count < min_chars:
+            continue
+        if score_text_quality(text) >= min_quality:
+            text_pages[page_num] = text.strip()
+    logger.info(f"Found {len(text_pages)} of {len(page_texts)} pages with a usable text layer")
+    return text_pages
@@ -1,22 +1,32 @@
 """Start ocr from S3 events."""
 
 import os
+import time
 from typing import Any
 from urllib.parse import unquote_plus
 
-import boto3
 import orjson as json
-from ai_ocr import main
+from ai_ocr import collect_batch_jobs, main, submit_batch_job
+from ai_ocr.batch_jobs import BatchJobBuilder
 from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+from ai_ocr.ocr_config import BatchInferenceBackend, OcrConfig
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
 logger = Logger()
 
-s3 = boto3.client("s3")
+COLLECT_BATCH_JOBS_ACTION = "collect_batch_jobs"
+"""Action of the scheduled event that collects ended batch jobs, see iac/lambda_inbox_container.tf."""
 
 
-def process_document(request_id: str, bucket: str, key: str) -> None:
+def process_document(
+    request_id: str,
+    bucket: str,
+    key: str,
+    deadline: float | None = None,
+    ocr_config: OcrConfig | None = None,
+    batch_job: BatchJobBuilder | None = None,
+) -> None:
     """
     Process a document using Amazon Bedrock vision.
 
@@ -24,6 +34,9 @@ def process_document(request_id: str, bucket: str, key: str) -> None:
         request_id (str): The ID of the request.
         bucket (str): The S3 bucket name.
         key (str): The S3 object key of the document to process.
+        deadline (float | None): time.monotonic() timestamp the Lambda invocation times out at.
+        ocr_config (OcrConfig | None): Pipeline config, read from the environment if not given.
+        batch_job (BatchJobBuilder | None): Batch job the page requests are added to in batch inference mode.
     """
 
     logger.info(f"Starting OCR id {request_id} for object: s3://{bucket}/{key}")
@@ -38,17 +51,23 @@ def process_document(request_id: str, bucket: str, key: str) -> None:
         output_bucket=bucket,
         output_key=os.environ.get("OUTPUT_KEY", f"outbox/{request_id}"),
         request_id=request_id,
+        ocr_config=ocr_config or OcrConfig.from_env(),
+        deadline=deadline,
+        batch_job=batch_job,
     )
 
 
 @logger.inject_lambda_context
 def lambda_handler(
     event: dict[str, Any],
-    context: LambdaContext,  # pylint: disable=unused-argument
+    context: LambdaContext,
 ) -> dict[str, Any]:
     """
     Process SQS messages triggered by S3 uploads to the /inbox prefix.
 
+    The scheduled event of batch inference mode, whose action is collect_batch_jobs, collects the
+    batch jobs that have ended instead.
+
     Args:
         event (Dict[str, Any]): The event dict containing SQS messages.
         context (Any): The Lambda context object.
@@ -56,10 +75,18 @@ def lambda_handler(
     Returns:
         Dict[str, Any]: A dictionary containing the status of the operation.
     """
+    if event.get("action") == COLLECT_BATCH_JOBS_ACTION:
+        return collect_pending_batch_jobs()
+
     if "Records" not in event:
         logger.warning("No Records in event")
         return {"statusCode": 200, "body": json.dumps("Processing complete")}
 
+    deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000
+    ocr_config = OcrConfig.from_env()
+    # in batch inference mode every document of the event goes out as one batch job
+    batch_job = BatchJobBuilder() if ocr_config.batch_inference != BatchInferenceBackend.NONE else None
+
     for event_record in event["Records"]:
         body = json.loads(event_record["body"])
         if "Records" not in body:
@@ -73,6 +100,43 @@ def lambda_handler(
             bucket = record["s3"]["bucket"]["name"]
             key = unquote_plus(record["s3"]["object"]["key"])
 
-            process_document(request_id, bucket, key)
+            process_document(request_id, bucket, key, deadline, ocr_config=ocr_config, batch_job=batch_job)
+
+    if batch_job:
+        submit_batch_job(batch_job, ocr_config)
 
     return {"statusCode": 200, "body": json.dumps("Processing complete")}
+
+
+@logger.inject_lambda_context
+def batch_collect_handler(
+    event: dict[str, Any],
+    context: LambdaContext,
+) -> dict[str, Any]:
+    """
+    Write the outputs of batch jobs that have ended, run on a schedule in batch inference mode.
+
+    Args:
+        event (Dict[str, Any]): The scheduled event, unused.
+        context (Any): The Lambda context object.
+
+    Returns:
+        Dict[str, Any]: A dictionary containing the status of the operation.
+    """
+    return collect_pending_batch_jobs()
+
+
+def collect_pending_batch_jobs() -> dict[str, Any]:
+    """
+    Write the outputs of the batch jobs that have ended.
+
+    Returns:
+        Dict[str, Any]: A dictionary containing the status of the operation.
+    """
+    ocr_config = OcrConfig.from_env()
+    if not ocr_config.batch_job_bucket:
+        logger.error("BATCH_JOB_BUCKET environment variable not set")
+        return {"statusCode": 500, "body": json.dumps("BATCH_JOB_BUCKET not set")}
+
+    jobs = collect_batch_jobs(bucket=ocr_config.batch_job_bucket, ocr_config=ocr_config)
+    return {"statusCode": 200, "body": json.dumps(f"Collected {len(jobs)} batch jobs")}
@@ -3,14 +3,15 @@
 from typing import Any
 from urllib.parse import unquote_plus
 
-import boto3
 import orjson as json
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+from lib.get_client import cached_client
+
 logger = Logger()
 
-s3 = boto3.client("s3")
+s3 = cached_client("s3")
 
 
 @logger.inject_lambda_context
@@ -9,7 +9,7 @@ the AWS_REGION environment variable is not set, it uses the default region
 Example usage:
 
 import os
-from aws_utils import client, resource
+from aws_utils import cached_client, client, resource
 
 # Set the AWS_REGION environment variable to use a different region
 os.environ["AWS_REGION"] = "us-east-1"
@@ -26,14 +26,26 @@ tables = dynamodb.tables.all()
 for table in tables:
     print(table.name)
 
+# Get the shared S3 client of the process, sized for 32 threads
+s3 = cached_client("s3", max_pool_connections=32)
+
 """
 
 import os
+import threading
+from typing import Any
 
 import boto3
+from botocore.config import Config
 
 default_region = os.environ.get("AWS_REGION", "eu-west-1")
 
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+"""botocore's default connection pool size."""
+
+_clients_lock = threading.Lock()
+_clients: dict[tuple[str, str | None, int, int], Any] = {}
+
 
 def get_session():
     """
@@ -84,3 +96,65 @@ def resource(client_type: str, region: str = default_region):
     if session:
         return session.resource(client_type, region_name=region)
     return boto3.resource(client_type, region_name=region)
+
+
+def client_config(max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS, max_attempts: int = 5) -> Config:
+    """
+    Returns a botocore config for clients shared by many threads.
+
+    The connection pool holds max_pool_connections connections, one per thread
+    making requests at the same time. Retries use the adaptive mode, which adds
+    client side rate limiting to the standard retries when the service throttles,
+    and TCP keepalive stops idle pooled connections from being dropped.
+
+    Args:
+        max_pool_connections (int, optional): Max open connections of the client.
+        max_attempts (int, optional): Max attempts per request including retries.
+
+    Returns:
+        botocore.config.Config: The client config.
+    """
+    return Config(
+        max_pool_connections=max_pool_connections,
+        retries={"mode": "adaptive", "total_max_attempts": max_attempts},
+        tcp_keepalive=True,
+    )
+
+
+def cached_client(
+    client_type: str,
+    region: str | None = None,
+    *,
+    max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+    max_attempts: int = 5,
+):
+    """
+    Returns a shared boto3 client configured with client_config.
+
+    Clients are cached per client type, region and config, so modules asking for
+    the same client with the same config share it, and a warm Lambda container
+    reuses its open connections across invocations. A different
+    max_pool_connections or max_attempts builds a separate client, so a module
+    sharing another module's client should import it instead of asking for it.
+    boto3 clients are thread safe.
+
+    Args:
+        client_type (str): The type of client to return, e.g. "s3".
+        region (str, optional): The AWS region to connect to. Defaults to boto3's
+            region resolution (AWS_REGION, AWS_DEFAULT_REGION, the profile).
+        max_pool_connections (int, optional): Max open connections of the client.
+        max_attempts (int, optional): Max attempts per request including retries.
+
+    Returns:
+        boto3.client: The shared client.
+    """
+    key = (client_type, region, max_pool_connections, max_attempts)
+    with _clients_lock:
+        if key not in _clients:
+            # sessions are not thread safe, clients are created under the lock
+            _clients[key] = get_session().client(
+                client_type,
+                region_name=region,
+                config=client_config(max_pool_connections=max_pool_connections, max_attempts=max_attempts),
+            )
+        return _clients[key]
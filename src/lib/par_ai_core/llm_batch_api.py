@@ -0,0 +1,466 @@
+"""Submitting chat requests through provider batch APIs.
+
+Batch APIs run requests asynchronously, usually within a few hours and at most
+within 24, at half the on-demand price (``get_api_call_cost(batch_pricing=True)``).
+A job is submitted as a list of ``BatchRequest``, polled with ``state`` until it
+ends and its results are then read back by custom id. Requests missing from the
+results failed or did not run before the job expired.
+
+Endpoints:
+
+- OpenAiBatchEndpoint: OpenAI Batch API over /v1/chat/completions.
+- AnthropicBatchEndpoint: Anthropic Message Batches.
+- BedrockBatchEndpoint: Bedrock batch inference jobs for Claude models, staged through S3.
+  Jobs with fewer than BEDROCK_MIN_BATCH_RECORDS records are rejected before they are staged.
+- LocalBatchEndpoint: files in a local directory in the OpenAI batch format. The requests
+  are run with the regular chat model the first time the job is polled. A stand-in for
+  the provider APIs when testing.
+
+Usage:
+    from par_ai_core.llm_batch_api import BatchRequest, provider_batch_endpoint
+
+    endpoint = provider_batch_endpoint(llm_config, s3_client=s3, bucket=bucket, prefix="batch", role_arn=role_arn)
+    job_id = endpoint.submit([BatchRequest(custom_id="p1", messages=messages, max_tokens=4096)], job_name="ocr-1")
+    ...
+    if endpoint.state(job_id) == BatchJobState.COMPLETED:
+        results = {result.custom_id: result for result in endpoint.results(job_id)}
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+from strenum import StrEnum
+
+DATA_URL_PATTERN = re.compile(r"data:(?P<media_type>[\w/+.-]+);base64,(?P<data>.*)", re.DOTALL)
+"""Base64 data url of an image content block."""
+
+BEDROCK_ANTHROPIC_VERSION = "bedrock-2023-05-31"
+"""Anthropic API version of Claude model inputs on Bedrock."""
+
+BEDROCK_MIN_BATCH_RECORDS = 100
+"""Fewest records Bedrock accepts in a batch inference job."""
+
+
+class BatchJobState(StrEnum):
+    """State of a batch job."""
+
+    IN_PROGRESS = "in_progress"
+    """Job is queued or running."""
+    COMPLETED = "completed"
+    """Job ended and its results can be read, requests that did not run are missing from them."""
+    FAILED = "failed"
+    """Job failed as a whole and has no results."""
+
+
+@dataclass
+class BatchRequest:
+    """Chat request of a batch job."""
+
+    custom_id: str
+    """Id the result is returned under, letters, digits, _ and - only."""
+    messages: list[tuple[str, str | list[dict[str, Any]]]]
+    """Role and content of each message, content blocks in the OpenAI format."""
+    max_tokens: int
+    """Max output tokens."""
+
+
+@dataclass
+class BatchResult:
+    """Result of one request of a batch job."""
+
+    custom_id: str
+    """Id of the request."""
+    content: str | None = None
+    """Response text, None if the request failed."""
+    error: str | None = None
+    """Error message if the request failed."""
+    stop_reason: str | None = None
+    """Stop / finish reason reported by the provider."""
+    input_tokens: int = 0
+    """Input tokens billed."""
+    output_tokens: int = 0
+    """Output tokens billed."""
+
+
+class BatchEndpoint(ABC):
+    """Provider batch API."""
+
+    @abstractmethod
+    def submit(self, requests: list[BatchRequest], *, job_name: str) -> str:
+        """Submit requests as one batch job and return the job id."""
+
+    @abstractmethod
+    def state(self, job_id: str) -> BatchJobState:
+        """Get the state of a batch job."""
+
+    @abstractmethod
+    def results(self, job_id: str) -> Iterator[BatchResult]:
+        """Read the results of a batch job that ended."""
+
+
+def message_text(content: str | list[dict[str, Any]]) -> str:
+    """Join the text of message content."""
+    if isinstance(content, str):
+        return content
+    return "\n\n".join(part["text"] for part in content if part.get("type") == "text")
+
+
+def anthropic_content(content: str | list[dict[str, Any]]) -> str | list[dict[str, Any]]:
+    """Convert OpenAI format message content to the Anthropic format."""
+    if isinstance(content, str):
+        return content
+    blocks: list[dict[str, Any]] = []
+    for part in content:
+        if part.get("type") == "image_url":
+            match = DATA_URL_PATTERN.fullmatch(part["image_url"]["url"])
+            if not match:
+                raise ValueError("Batch requests only support base64 data url images")
+            blocks.append(
+                {
+                    "type": "image",
+                    "source": {"type": "base64", "media_type": match["media_type"], "data": match["data"]},
+                }
+            )
+        elif "cachePoint" not in part:
+            # cachePoint blocks are specific to Bedrock Converse, cache_control passes through
+            blocks.append(part)
+    return blocks
+
+
+def anthropic_params(request: BatchRequest, temperature: float) -> dict[str, Any]:
+    """Build the Anthropic messages API params of a request, without the model."""
+    params: dict[str, Any] = {
+        "max_tokens": request.max_tokens,
+        "temperature": temperature,
+        "messages": [
+            {"role": "assistant" if role == "ai" else role, "content": anthropic_content(content)}
+            for role, content in request.messages
+            if role != "system"
+        ],
+    }
+    system = "\n\n".join(message_text(content) for role, content in request.messages if role == "system")
+    if system:
+        params["system"] = system
+    return params
+
+
+def openai_request_line(request: BatchRequest, model_name: str, temperature: float) -> dict[str, Any]:
+    """Build the OpenAI batch input line of a request."""
+    return {
+        "custom_id": request.custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model_name,
+            "temperature": temperature,
+            "max_tokens": request.max_tokens,
+            "messages": [
+                {"role": "assistant" if role == "ai" else role, "content": content}
+                for role, content in request.messages
+            ],
+        },
+    }
+
+
+def openai_result(record: dict[str, Any]) -> BatchResult:
+    """Parse an OpenAI batch output or error line."""
+    response = record.get("response") or {}
+    body = response.get("body") or {}
+    if record.get("error") or response.get("status_code") != 200:
+        error = record.get("error") or body.get("error") or f"status {response.get('status_code')}"
+        return BatchResult(custom_id=record["custom_id"], error=str(error))
+    choice = body["choices"][0]
+    usage = body.get("usage") or {}
+    return BatchResult(
+        custom_id=record["custom_id"],
+        content=choice["message"].get("content") or "",
+        stop_reason=choice.get("finish_reason"),
+        input_tokens=usage.get("prompt_tokens", 0),
+        output_tokens=usage.get("completion_tokens", 0),
+    )
+
+
+def anthropic_message_result(custom_id: str, message: dict[str, Any]) -> BatchResult:
+    """Parse an Anthropic messages API response."""
+    usage = message.get("usage") or {}
+    return BatchResult(
+        custom_id=custom_id,
+        content="".join(block.get("text", "") for block in message.get("content", []) if block.get("type") == "text"),
+        stop_reason=message.get("stop_reason"),
+        input_tokens=usage.get("input_tokens", 0),
+        output_tokens=usage.get("output_tokens", 0),
+    )
+
+
+class OpenAiBatchEndpoint(BatchEndpoint):
+    """OpenAI Batch API over /v1/chat/completions."""
+
+    def __init__(self, llm_config: LlmConfig) -> None:
+        from openai import OpenAI
+
+        self.llm_config = llm_config
+        self.client = OpenAI(base_url=llm_config.base_url)
+
+    def submit(self, requests: list[BatchRequest], *, job_name: str) -> str:
+        lines = [
+            json.dumps(openai_request_line(request, self.llm_config.model_name, self.llm_config.temperature))
+            for request in requests
+        ]
+        input_file = self.client.files.create(
+            file=(f"{job_name}.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+            metadata={"job_name": job_name},
+        )
+        return batch.id
+
+    def state(self, job_id: str) -> BatchJobState:
+        status = self.client.batches.retrieve(job_id).status
+        # expired and cancelled batches keep the results of the requests that ran
+        if status in ("completed", "expired", "cancelled"):
+            return BatchJobState.COMPLETED
+        if status == "failed":
+            return BatchJobState.FAILED
+        return BatchJobState.IN_PROGRESS
+
+    def results(self, job_id: str) -> Iterator[BatchResult]:
+        batch = self.client.batches.retrieve(job_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    yield openai_result(json.loads(line))
+
+
+class AnthropicBatchEndpoint(BatchEndpoint):
+    """Anthropic Message Batches."""
+
+    def __init__(self, llm_config: LlmConfig) -> None:
+        from anthropic import Anthropic
+
+        self.llm_config = llm_config
+        self.client = Anthropic(base_url=llm_config.base_url)
+
+    def submit(self, requests: list[BatchRequest], *, job_name: str) -> str:
+        batch = self.client.messages.batches.create(
+            requests=[
+                {
+                    "custom_id": request.custom_id,
+                    "params": {
+                        "model": self.llm_config.model_name,
+                        **anthropic_params(request, self.llm_config.temperature),
+                    },
+                }
+                for request in requests
+            ]  # type: ignore
+        )
+        return batch.id
+
+    def state(self, job_id: str) -> BatchJobState:
+        if self.client.messages.batches.retrieve(job_id).processing_status == "ended":
+            return BatchJobState.COMPLETED
+        return BatchJobState.IN_PROGRESS
+
+    def results(self, job_id: str) -> Iterator[BatchResult]:
+        for entry in self.client.messages.batches.results(job_id):
+            result = entry.result
+            if result.type == "succeeded":
+                yield anthropic_message_result(entry.custom_id, result.message.model_dump())
+            else:
+                error = getattr(result, "error", None)
+                yield BatchResult(custom_id=entry.custom_id, error=str(error) if error else result.type)
+
+
+class BedrockBatchEndpoint(BatchEndpoint):
+    """Bedrock batch inference jobs for Claude models.
+
+    Inputs and outputs are staged as JSONL under ``prefix`` in ``bucket``, which the
+    service role ``role_arn`` must be able to read and write.
+    """
+
+    def __init__(self, llm_config: LlmConfig, *, s3_client: Any, bucket: str, prefix: str, role_arn: str) -> None:
+        if "claude" not in llm_config.model_name.lower():
+            raise ValueError(
+                f"Bedrock batch inference is only supported for Claude models, not {llm_config.model_name}"
+            )
+        import boto3
+
+        self.llm_config = llm_config
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.role_arn = role_arn
+        self.client = boto3.client("bedrock", region_name=os.environ.get("AWS_REGION", "us-east-1"))
+
+    def submit(self, requests: list[BatchRequest], *, job_name: str) -> str:
+        # create_model_invocation_job rejects smaller jobs, fail before staging the input
+        if len(requests) < BEDROCK_MIN_BATCH_RECORDS:
+            raise ValueError(
+                f"Bedrock batch inference jobs need at least {BEDROCK_MIN_BATCH_RECORDS} records, "
+                f"{job_name} has {len(requests)}"
+            )
+        key = f"{self.prefix}/{job_name}/input.jsonl"
+        lines = [
+            json.dumps(
+                {
+                    "recordId": request.custom_id,
+                    "modelInput": {
+                        "anthropic_version": BEDROCK_ANTHROPIC_VERSION,
+                        **anthropic_params(request, self.llm_config.temperature),
+                    },
+                }
+            )
+            for request in requests
+        ]
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body="\n".join(lines).encode("utf-8"))
+        response = self.client.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self.role_arn,
+            modelId=self.llm_config.model_name,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{self.bucket}/{key}", "s3InputFormat": "JSONL"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{self.bucket}/{self.prefix}/{job_name}/output/"}},
+        )
+        return response["jobArn"]
+
+    def state(self, job_id: str) -> BatchJobState:
+        status = self.client.get_model_invocation_job(jobIdentifier=job_id)["status"]
+        # stopped, expired and partially completed jobs keep the results of the records that ran
+        if status in ("Completed", "PartiallyCompleted", "Stopped", "Expired"):
+            return BatchJobState.COMPLETED
+        if status == "Failed":
+            return BatchJobState.FAILED
+        return BatchJobState.IN_PROGRESS
+
+    def results(self, job_id: str) -> Iterator[BatchResult]:
+        job = self.client.get_model_invocation_job(jobIdentifier=job_id)
+        input_name = job["inputDataConfig"]["s3InputDataConfig"]["s3Uri"].rsplit("/", 1)[-1]
+        output_uri = job["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"]
+        bucket, _, prefix = output_uri.removeprefix("s3://").partition("/")
+        # outputs are written under the id at the end of the job arn
+        key = f"{prefix.rstrip('/')}/{job_id.rsplit('/', 1)[-1]}/{input_name}.out"
+        body = self.s3_client.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("modelOutput"):
+                yield anthropic_message_result(record["recordId"], record["modelOutput"])
+            else:
+                yield BatchResult(custom_id=record["recordId"], error=str(record.get("error") or "no output"))
+
+
+class LocalBatchEndpoint(BatchEndpoint):
+    """Batch jobs stored as files in a local directory.
+
+    Each job is a directory holding ``input.jsonl`` in the OpenAI batch input format.
+    The first time the job is polled its requests are run one at a time with the
+    regular chat model and ``output.jsonl`` is written in the OpenAI batch output format.
+    """
+
+    def __init__(self, directory: Path, llm_config: LlmConfig) -> None:
+        self.directory = directory
+        self.llm_config = llm_config
+
+    def submit(self, requests: list[BatchRequest], *, job_name: str) -> str:
+        job_dir = self.directory / job_name
+        job_dir.mkdir(parents=True, exist_ok=True)
+        lines = [
+            json.dumps(openai_request_line(request, self.llm_config.model_name, self.llm_config.temperature))
+            for request in requests
+        ]
+        (job_dir / "input.jsonl").write_text("\n".join(lines), encoding="utf-8")
+        return job_name
+
+    def state(self, job_id: str) -> BatchJobState:
+        job_dir = self.directory / job_id
+        if not (job_dir / "input.jsonl").exists():
+            return BatchJobState.FAILED
+        if not (job_dir / "output.jsonl").exists():
+            self._run(job_dir)
+        return BatchJobState.COMPLETED
+
+    def _run(self, job_dir: Path) -> None:
+        """Run the requests of a job and write its output."""
+        model = self.llm_config.build_chat_model()
+        lines: list[str] = []
+        for line in (job_dir / "input.jsonl").read_text(encoding="utf-8").splitlines():
+            record = json.loads(line)
+            body = record["body"]
+            try:
+                response = model.invoke([(message["role"], message["content"]) for message in body["messages"]])
+            except Exception as e:  # pylint: disable=broad-except
+                lines.append(
+                    json.dumps({"custom_id": record["custom_id"], "response": None, "error": {"message": str(e)}})
+                )
+                continue
+            usage = getattr(response, "usage_metadata", None) or {}
+            metadata = response.response_metadata or {}
+            output_body = {
+                "choices": [
+                    {
+                        "message": {"role": "assistant", "content": str(response.content)},
+                        "finish_reason": metadata.get("finish_reason") or metadata.get("stop_reason"),
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": usage.get("input_tokens", 0),
+                    "completion_tokens": usage.get("output_tokens", 0),
+                },
+            }
+            lines.append(
+                json.dumps(
+                    {
+                        "custom_id": record["custom_id"],
+                        "response": {"status_code": 200, "body": output_body},
+                        "error": None,
+                    }
+                )
+            )
+        tmp_path = job_dir / "output.jsonl.tmp"
+        tmp_path.write_text("\n".join(lines), encoding="utf-8")
+        tmp_path.replace(job_dir / "output.jsonl")
+
+    def results(self, job_id: str) -> Iterator[BatchResult]:
+        for line in (self.directory / job_id / "output.jsonl").read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                yield openai_result(json.loads(line))
+
+
+def provider_batch_endpoint(
+    llm_config: LlmConfig, *, s3_client: Any = None, bucket: str = "", prefix: str = "", role_arn: str | None = None
+) -> BatchEndpoint:
+    """Create the batch endpoint of the config's provider.
+
+    Args:
+        llm_config: Provider, model and temperature of the requests
+        s3_client: S3 client used to stage Bedrock job inputs and read its outputs
+        bucket: Bucket Bedrock job inputs and outputs are staged in
+        prefix: Key prefix Bedrock job inputs and outputs are staged under
+        role_arn: Service role Bedrock runs the job as
+
+    Returns:
+        BatchEndpoint: Endpoint of the provider
+    """
+    if llm_config.provider == LlmProvider.OPENAI:
+        return OpenAiBatchEndpoint(llm_config)
+    if llm_config.provider == LlmProvider.ANTHROPIC:
+        return AnthropicBatchEndpoint(llm_config)
+    if llm_config.provider == LlmProvider.BEDROCK:
+        if not s3_client or not bucket or not role_arn:
+            raise ValueError("Bedrock batch inference needs an S3 client, a staging bucket and a service role arn")
+        return BedrockBatchEndpoint(llm_config, s3_client=s3_client, bucket=bucket, prefix=prefix, role_arn=role_arn)
+    raise ValueError(f"{llm_config.provider.value} does not have a supported batch API")
@@ -0,0 +1,284 @@
+"""Adaptive concurrency control for LLM requests.
+
+This module provides an AIMD (additive increase, multiplicative decrease)
+limiter that finds the number of in-flight requests a provider / model can
+sustain without hand tuning:
+
+- While requests succeed with healthy latency the limit grows by roughly
+  ``increase`` per round of requests.
+- When the provider throttles the limit is multiplied by ``decrease_factor``,
+  at most once per cooldown so a burst of throttles only counts once.
+- Latency well above the observed baseline or a high error rate holds the
+  limit steady instead of growing it.
+
+Limiters are shared per (provider, model) through ``get_concurrency_limiter``
+so a warm container keeps the limit it has learned across documents. Both
+blocking and asyncio callers are supported.
+
+Usage:
+    from par_ai_core.llm_concurrency import get_concurrency_limiter
+
+    limiter = get_concurrency_limiter(LlmProvider.BEDROCK, model_name)
+    with limiter.limit_slot():
+        response = model.invoke(messages)
+
+    async with limiter.alimit_slot():
+        response = await model.ainvoke(messages)
+
+    logger.info(limiter.snapshot())
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncGenerator, Generator
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any
+
+from ai_ocr.lib.par_ai_core.llm_errors import is_throttling_error
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limiter for in-flight LLM requests.
+
+    Attributes:
+        min_limit: Lowest limit the controller will cut down to
+        max_limit: Highest limit the controller will grow to
+        increase: Amount the limit grows per round of healthy requests
+        decrease_factor: Multiplier applied to the limit when throttled
+        latency_tolerance: Latency above baseline * tolerance is treated as unhealthy
+        max_error_rate: Recent error rate above which the limit stops growing
+        cooldown: Min seconds between two multiplicative decreases
+    """
+
+    def __init__(
+        self,
+        *,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        max_error_rate: float = 0.2,
+        cooldown: float = 5.0,
+        history_size: int = 100,
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._async_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future[None]]] = []
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._baseline_latency: float | None = None
+        self._recent_outcomes: deque[bool] = deque(maxlen=20)
+        self._last_decrease = 0.0
+        self._increases = 0
+        self._decreases = 0
+        self._throttles = 0
+        self._errors = 0
+        self._successes = 0
+        self._history: deque[tuple[float, int]] = deque(maxlen=history_size)
+        self._history.append((time.time(), self.limit))
+
+    @property
+    def limit(self) -> int:
+        """Current max number of in-flight requests."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests currently in flight."""
+        with self._lock:
+            return self._in_flight
+
+    def _has_capacity(self) -> bool:
+        return self._in_flight < int(self._limit)
+
+    def _take(self) -> None:
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+
+    def acquire(self) -> None:
+        """Block until a request slot is available and take it."""
+        with self._cond:
+            while not self._has_capacity():
+                self._cond.wait()
+            self._take()
+
+    async def aacquire(self) -> None:
+        """Wait on the running event loop until a request slot is available and take it."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._has_capacity():
+                    self._take()
+                    return
+                waiter: asyncio.Future[None] = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            finally:
+                # a cancelled or timed out waiter must not stay registered with a loop that may close
+                with self._lock:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def _wake_waiters(self) -> None:
+        """Wake every waiter so they re-check capacity, skipping waiters whose loop is gone. Must hold the lock."""
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            if loop.is_closed() or waiter.done():
+                continue
+            try:
+                loop.call_soon_threadsafe(_resolve_waiter, waiter)
+            except RuntimeError:
+                # the loop closed after the check
+                continue
+
+    def _set_limit(self, limit: float) -> None:
+        """Set the limit and record it in the history if the whole number part changed. Must hold the lock."""
+        old_limit = int(self._limit)
+        self._limit = min(max(limit, float(self.min_limit)), float(self.max_limit))
+        if int(self._limit) != old_limit:
+            self._history.append((time.time(), int(self._limit)))
+
+    def release(self, *, latency: float | None = None, throttled: bool = False, error: bool = False) -> None:
+        """Release a request slot and feed the request outcome into the controller.
+
+        Args:
+            latency: Request duration in seconds for successful requests
+            throttled: The provider rejected the request due to rate limiting
+            error: The request failed for another reason
+        """
+        with self._lock:
+            self._in_flight -= 1
+            if throttled:
+                self._throttles += 1
+                self._recent_outcomes.append(False)
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self._decreases += 1
+                    self._set_limit(self._limit * self.decrease_factor)
+            elif error:
+                self._errors += 1
+                self._recent_outcomes.append(False)
+            else:
+                self._successes += 1
+                self._recent_outcomes.append(True)
+                if self._is_healthy(latency):
+                    self._increases += 1
+                    self._set_limit(self._limit + self.increase / max(self._limit, 1.0))
+            self._wake_waiters()
+
+    def release_cancelled(self) -> None:
+        """Release a request slot without recording an outcome, for requests that were cancelled or interrupted."""
+        with self._lock:
+            self._in_flight -= 1
+            self._wake_waiters()
+
+    def _is_healthy(self, latency: float | None) -> bool:
+        """Update the latency baseline and check if latency and error rate allow growth. Must hold the lock."""
+        failures = self._recent_outcomes.count(False)
+        if failures / len(self._recent_outcomes) > self.max_error_rate:
+            return False
+        if latency is None:
+            return True
+        if self._baseline_latency is None:
+            self._baseline_latency = latency
+            return True
+        healthy = latency <= self._baseline_latency * self.latency_tolerance
+        # slow moving average so the baseline tracks the provider without chasing spikes
+        self._baseline_latency = self._baseline_latency * 0.9 + latency * 0.1
+        return healthy
+
+    @contextmanager
+    def limit_slot(self) -> Generator[None, None, None]:
+        """Hold a request slot for the duration of the block and record its outcome."""
+        self.acquire()
+        start_time = time.monotonic()
+        try:
+            yield
+        except Exception as e:  # pylint: disable=broad-except
+            self.release(throttled=is_throttling_error(e), error=True)
+            raise
+        except BaseException:
+            # cancellation, a closed generator or an interrupt say nothing about the provider
+            self.release_cancelled()
+            raise
+        self.release(latency=time.monotonic() - start_time)
+
+    @asynccontextmanager
+    async def alimit_slot(self) -> AsyncGenerator[None, None]:
+        """Async version of ``limit_slot``."""
+        await self.aacquire()
+        start_time = time.monotonic()
+        try:
+            yield
+        except Exception as e:  # pylint: disable=broad-except
+            self.release(throttled=is_throttling_error(e), error=True)
+            raise
+        except BaseException:
+            # cancellation, a closed generator or an interrupt say nothing about the provider
+            self.release_cancelled()
+            raise
+        self.release(latency=time.monotonic() - start_time)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Get the current limit, counters and limit history as a metrics dict."""
+        with self._lock:
+            return {
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "max_in_flight": self._max_in_flight,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "baseline_latency": round(self._baseline_latency or 0.0, 3),
+                "successes": self._successes,
+                "errors": self._errors,
+                "throttles": self._throttles,
+                "increases": self._increases,
+                "decreases": self._decreases,
+                "history": list(self._history),
+            }
+
+
+def _resolve_waiter(waiter: asyncio.Future[None]) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_limiters_lock = threading.Lock()
+_limiters: dict[tuple[LlmProvider, str], AdaptiveConcurrencyLimiter] = {}
+
+
+def get_concurrency_limiter(provider: LlmProvider, model_name: str, **kwargs: Any) -> AdaptiveConcurrencyLimiter:
+    """Get the shared limiter for a provider / model, creating it on first use.
+
+    Args:
+        provider: LLM provider the requests go to
+        model_name: Model the requests go to
+        **kwargs: AdaptiveConcurrencyLimiter arguments used when the limiter is created
+
+    Returns:
+        AdaptiveConcurrencyLimiter: Limiter shared by all callers of this provider / model
+    """
+    with _limiters_lock:
+        key = (provider, model_name)
+        if key not in _limiters:
+            _limiters[key] = AdaptiveConcurrencyLimiter(**kwargs)
+        return _limiters[key]
@@ -27,6 +27,7 @@ from typing import Literal
 
 # from langchain_experimental import
 from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider, is_provider_api_key_set, provider_base_urls
+from ai_ocr.lib.par_ai_core.llm_rate_limiter import ProviderRateLimiter, get_rate_limiter, quota_env_var
 from langchain._api import LangChainDeprecationWarning
 from langchain_core.embeddings import Embeddings
 from langchain_core.language_models import BaseChatModel, BaseLanguageModel
@@ -84,6 +85,8 @@ class LlmConfig:
         top_p: Top-P (nucleus) sampling parameter
         seed: Random seed for reproducibility
         env_prefix: Environment variable prefix
+        requests_per_minute: Provider request quota used for rate limiting
+        tokens_per_minute: Provider token quota used for rate limiting
     """
 
     provider: LlmProvider
@@ -150,6 +153,10 @@ class LlmConfig:
     """Prefix to use for environment variables"""
     format: Literal["", "json"] = ""
     """Ollama output format. Valid options are empty string (default) and 'json'"""
+    requests_per_minute: int | None = None
+    """Requests per minute quota for this provider / model. Falls back to <PROVIDER>_REQUESTS_PER_MINUTE."""
+    tokens_per_minute: int | None = None
+    """Tokens per minute quota for this provider / model. Falls back to <PROVIDER>_TOKENS_PER_MINUTE."""
 
     def to_json(self) -> dict:
         """Converts the configuration to a JSON-serializable dictionary.
@@ -181,6 +188,8 @@ class LlmConfig:
             "seed": self.seed,
             "env_prefix": self.env_prefix,
             "format": self.format,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
         }
 
     @classmethod
@@ -234,6 +243,8 @@ class LlmConfig:
             seed=self.seed,
             env_prefix=self.env_prefix,
             format=self.format,
+            requests_per_minute=self.requests_per_minute,
+            tokens_per_minute=self.tokens_per_minute,
         )
 
     def gen_runnable_config(self) -> RunnableConfig:
@@ -413,6 +424,19 @@ class LlmConfig:
             raise ValueError(f"LLM mode '{self.mode.value}' does not support embeddings.")
         return llm
 
+    def get_rate_limiter(self) -> ProviderRateLimiter | None:
+        """Get the rate limiter shared by all requests to this provider / model.
+
+        Returns:
+            ProviderRateLimiter | None: Shared limiter or None if no quota is configured
+        """
+        return get_rate_limiter(
+            self.provider,
+            self.model_name,
+            requests_per_minute=self.requests_per_minute,
+            tokens_per_minute=self.tokens_per_minute,
+        )
+
     def is_api_key_set(self) -> bool:
         """Check if API key is set for the provider."""
         return is_provider_api_key_set(self.provider)
@@ -451,6 +475,11 @@ class LlmConfig:
             os.environ[f"{self.env_prefix}_SEED"] = str(self.seed)
         if self.timeout is not None:
             os.environ[f"{self.env_prefix}_TIMEOUT"] = str(self.timeout)
+        # quotas are per provider, under the names the rate limiter reads them from
+        if self.requests_per_minute is not None:
+            os.environ[quota_env_var(self.provider, "REQUESTS_PER_MINUTE")] = str(self.requests_per_minute)
+        if self.tokens_per_minute is not None:
+            os.environ[quota_env_var(self.provider, "TOKENS_PER_MINUTE")] = str(self.tokens_per_minute)
 
         return self
 
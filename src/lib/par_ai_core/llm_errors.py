@@ -0,0 +1,177 @@
+"""Classification of errors raised by LLM provider clients.
+
+Each provider surfaces failures differently: botocore raises a ClientError
+with a ``ThrottlingException`` code, while the OpenAI and Anthropic SDKs raise
+``RateLimitError`` / ``APITimeoutError`` / ``InternalServerError`` classes
+carrying an HTTP status. This module hides those differences so callers can
+react to provider back pressure and decide what is worth retrying without
+importing every SDK.
+
+Usage:
+    from par_ai_core.llm_errors import LlmErrorKind, classify_llm_error
+
+    try:
+        model.invoke(messages)
+    except Exception as e:
+        if classify_llm_error(e) == LlmErrorKind.THROTTLING:
+            ...
+"""
+
+from __future__ import annotations
+
+from strenum import StrEnum
+
+
+class LlmErrorKind(StrEnum):
+    """Category of an LLM request failure."""
+
+    THROTTLING = "throttling"
+    """Provider rate limited the request."""
+    TIMEOUT = "timeout"
+    """Request timed out or the connection failed."""
+    SERVER = "server"
+    """Provider side 5xx error."""
+    NON_RETRYABLE = "non_retryable"
+    """Error that will not go away by retrying, such as a bad request."""
+
+
+RETRYABLE_ERROR_KINDS: set[LlmErrorKind] = {LlmErrorKind.THROTTLING, LlmErrorKind.TIMEOUT, LlmErrorKind.SERVER}
+
+THROTTLING_ERROR_CODES: set[str] = {
+    "ThrottlingException",
+    "Throttling",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "RequestLimitExceeded",
+    "SlowDown",
+}
+"""botocore error codes that mean the provider is throttling requests."""
+
+THROTTLING_ERROR_NAMES: set[str] = {"RateLimitError"}
+"""Exception class names used by provider SDKs for rate limiting."""
+
+TIMEOUT_ERROR_NAMES: set[str] = {
+    "TimeoutError",
+    "APITimeoutError",
+    "APIConnectionError",
+    "ReadTimeout",
+    "ConnectTimeout",
+    "ReadTimeoutError",
+    "ConnectTimeoutError",
+    "EndpointConnectionError",
+    "ConnectionClosedError",
+}
+"""Exception class names used by provider SDKs and HTTP clients for timeouts and dropped connections."""
+
+SERVER_ERROR_CODES: set[str] = {
+    "InternalServerException",
+    "InternalFailure",
+    "ServiceUnavailableException",
+    "ServiceUnavailable",
+    "ModelNotReadyException",
+}
+"""botocore error codes for provider side failures."""
+
+SERVER_ERROR_NAMES: set[str] = {"InternalServerError", "OverloadedError", "ServiceUnavailableError"}
+"""Exception class names used by provider SDKs for provider side failures."""
+
+
+def get_error_status_code(error: BaseException) -> int | None:
+    """Get the HTTP status code carried by a provider error, if any.
+
+    Args:
+        error: Exception raised by a provider client
+
+    Returns:
+        int | None: HTTP status code if one could be found
+    """
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        status_code = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    else:
+        status_code = getattr(response, "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def get_error_code(error: BaseException) -> str | None:
+    """Get the botocore error code from a ClientError style exception.
+
+    Args:
+        error: Exception raised by a provider client
+
+    Returns:
+        str | None: Error code such as ``ThrottlingException`` if present
+    """
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return None
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """Check if an error means the provider is throttling requests.
+
+    Args:
+        error: Exception raised by a provider client
+
+    Returns:
+        bool: True if the error is a rate limit / throttling error
+    """
+    if type(error).__name__ in THROTTLING_ERROR_NAMES or get_error_code(error) in THROTTLING_ERROR_CODES:
+        return True
+    if get_error_status_code(error) == 429:
+        return True
+    message = str(error).lower()
+    return "throttl" in message or "too many requests" in message or "rate limit" in message
+
+
+def is_timeout_error(error: BaseException) -> bool:
+    """Check if an error is a timeout or dropped connection.
+
+    Args:
+        error: Exception raised by a provider client
+
+    Returns:
+        bool: True if the request timed out or could not connect
+    """
+    if isinstance(error, TimeoutError | ConnectionError):
+        return True
+    if get_error_code(error) == "ModelTimeoutException":
+        return True
+    return any(cls.__name__ in TIMEOUT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def is_server_error(error: BaseException) -> bool:
+    """Check if an error is a provider side failure.
+
+    Args:
+        error: Exception raised by a provider client
+
+    Returns:
+        bool: True for 5xx style errors
+    """
+    if type(error).__name__ in SERVER_ERROR_NAMES or get_error_code(error) in SERVER_ERROR_CODES:
+        return True
+    status_code = get_error_status_code(error)
+    return status_code is not None and status_code >= 500
+
+
+def classify_llm_error(error: BaseException) -> LlmErrorKind:
+    """Classify an error raised by a provider client.
+
+    Args:
+        error: Exception raised by a provider client
+
+    Returns:
+        LlmErrorKind: Category of the failure
+    """
+    if is_throttling_error(error):
+        return LlmErrorKind.THROTTLING
+    if is_timeout_error(error):
+        return LlmErrorKind.TIMEOUT
+    if is_server_error(error):
+        return LlmErrorKind.SERVER
+    return LlmErrorKind.NON_RETRYABLE
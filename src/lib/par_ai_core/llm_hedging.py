@@ -0,0 +1,272 @@
+"""Hedged LLM requests to cut tail latency.
+
+When requests run in parallel the slowest one sets the total time. A hedged
+request waits until the request has been running longer than a latency
+percentile of recent requests to the same model, then sends a duplicate and takes
+whichever answer arrives first. The duplicate can go to another endpoint, such as a
+second region or provider.
+
+Every hedge pays for a second request, so a ``RequestHedger`` only sends a hedge
+while hedges stay under ``HedgePolicy.budget_percent`` of the requests it has seen.
+The async version cancels the losing request. A blocking request can not be
+interrupted, so the thread version leaves the loser to finish in the background
+and drops its answer.
+
+Latency samples are shared per (provider, model) through ``get_latency_tracker``
+so a warm container starts hedging with the percentiles it has already learned.
+
+Usage:
+    from par_ai_core.llm_hedging import HedgePolicy, RequestHedger
+
+    hedger = RequestHedger(HedgePolicy(percentile=95, budget_percent=5))
+    tracker = get_latency_tracker(provider, model_name)
+    response = hedger.call(lambda: model.invoke(messages), lambda: other_model.invoke(messages), tracker=tracker)
+    hedger.close()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Rolling window of request latencies.
+
+    Attributes:
+        window: Number of recent latencies kept
+    """
+
+    def __init__(self, *, window: int = 200) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._latencies)
+
+    def record(self, latency: float) -> None:
+        """Add the latency of a finished request in seconds."""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, percentile: float) -> float | None:
+        """Get a latency percentile (0-100) of the recent requests, None without samples."""
+        with self._lock:
+            if not self._latencies:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, max(0, math.ceil(percentile / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+_trackers_lock = threading.Lock()
+_trackers: dict[tuple[LlmProvider, str], LatencyTracker] = {}
+
+
+def get_latency_tracker(provider: LlmProvider, model_name: str, **kwargs: Any) -> LatencyTracker:
+    """Get the shared latency tracker for a provider / model, creating it on first use.
+
+    Args:
+        provider: LLM provider the requests go to
+        model_name: Model the requests go to
+        **kwargs: LatencyTracker arguments used when the tracker is created
+
+    Returns:
+        LatencyTracker: Tracker shared by all callers of this provider / model
+    """
+    with _trackers_lock:
+        key = (provider, model_name)
+        if key not in _trackers:
+            _trackers[key] = LatencyTracker(**kwargs)
+        return _trackers[key]
+
+
+@dataclass
+class HedgePolicy:
+    """When to send a hedge request and how many may be sent.
+
+    Attributes:
+        percentile: Latency percentile of recent requests after which a hedge is sent
+        min_samples: Min recent requests before hedging starts
+        min_delay: Min seconds a request runs before a hedge is sent
+        budget_percent: Max hedges as a percentage of requests
+    """
+
+    percentile: float = 95
+    """Latency percentile (0-100) of recent requests after which a hedge is sent."""
+    min_samples: int = 10
+    """Min recent requests before hedging starts, the percentile of fewer is noise."""
+    min_delay: float = 5.0
+    """Min seconds a request runs before a hedge is sent."""
+    budget_percent: float = 5.0
+    """Max hedges as a percentage of requests, caps the extra spend."""
+
+
+class RequestHedger:
+    """Sends hedge requests for slow requests within a budget.
+
+    Attributes:
+        policy: Hedging settings
+    """
+
+    def __init__(self, policy: HedgePolicy, *, max_workers: int = 32) -> None:
+        self.policy = policy
+        self._max_workers = max_workers
+        self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._skipped = 0
+
+    def hedge_delay(self, tracker: LatencyTracker) -> float | None:
+        """Get the seconds to wait before hedging a request, None if the tracker has too few samples."""
+        if len(tracker) < max(1, self.policy.min_samples):
+            return None
+        latency = tracker.percentile(self.policy.percentile)
+        return None if latency is None else max(latency, self.policy.min_delay)
+
+    def _count_request(self) -> None:
+        with self._lock:
+            self._requests += 1
+
+    def _take_budget(self) -> bool:
+        """Count a hedge if it fits the budget."""
+        with self._lock:
+            if (self._hedges + 1) * 100 > self._requests * self.policy.budget_percent:
+                self._skipped += 1
+                return False
+            self._hedges += 1
+            return True
+
+    def _count_win(self) -> None:
+        with self._lock:
+            self._hedge_wins += 1
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._lock:
+            if not self._executor:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="hedge"
+                )
+            return self._executor
+
+    def call(self, fn: Callable[[], T], hedge_fn: Callable[[], T], *, tracker: LatencyTracker) -> T:
+        """Call fn, calling hedge_fn as well if fn is slow, and return the first successful result.
+
+        Args:
+            fn: Function performing the request
+            hedge_fn: Function performing the hedge request
+            tracker: Latency tracker of the requests, updated with the latency of this one
+
+        Returns:
+            The result of whichever request succeeded first
+        """
+        self._count_request()
+        start_time = time.monotonic()
+        delay = self.hedge_delay(tracker)
+        if delay is None:
+            result = fn()
+            tracker.record(time.monotonic() - start_time)
+            return result
+        executor = self._get_executor()
+        # copy the context so hedge threads report usage to the active callback handler
+        primary = executor.submit(contextvars.copy_context().run, fn)
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        if done or not self._take_budget():
+            result = primary.result()
+            tracker.record(time.monotonic() - start_time)
+            return result
+        hedge = executor.submit(contextvars.copy_context().run, hedge_fn)
+        pending = {primary, hedge}
+        error: BaseException | None = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for loser in pending:
+                    # a request already running can not be stopped, its result is dropped
+                    loser.cancel()
+                if future is hedge:
+                    self._count_win()
+                tracker.record(time.monotonic() - start_time)
+                return future.result()
+        assert error is not None
+        raise error
+
+    async def acall(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        hedge_fn: Callable[[], Awaitable[T]],
+        *,
+        tracker: LatencyTracker,
+    ) -> T:
+        """Async version of ``call``. The losing request is cancelled."""
+        self._count_request()
+        start_time = time.monotonic()
+        delay = self.hedge_delay(tracker)
+        if delay is None:
+            result = await fn()
+            tracker.record(time.monotonic() - start_time)
+            return result
+        primary = asyncio.ensure_future(fn())
+        pending: set[asyncio.Future[T]] = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self._take_budget():
+                result = await primary
+                tracker.record(time.monotonic() - start_time)
+                return result
+            hedge = asyncio.ensure_future(hedge_fn())
+            pending.add(hedge)
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if task is hedge:
+                        self._count_win()
+                    tracker.record(time.monotonic() - start_time)
+                    return task.result()
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def close(self) -> None:
+        """Stop the hedge threads without waiting for losing requests still running."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Get the request, hedge and budget counters as a metrics dict."""
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "hedges": self._hedges,
+                "hedge_wins": self._hedge_wins,
+                "skipped_over_budget": self._skipped,
+                "hedge_percent": round(self._hedges / self._requests * 100, 2) if self._requests else 0.0,
+                "budget_percent": self.policy.budget_percent,
+            }
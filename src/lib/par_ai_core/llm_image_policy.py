@@ -0,0 +1,189 @@
+"""Per provider / model policy for rendering and encoding images sent to vision models.
+
+Providers downscale large images server side, so pixels past a model's limit cost
+upload bandwidth (and for some providers input tokens) without improving results.
+An ``ImagePolicy`` picks the render resolution, max long and short edge, grayscale
+conversion and JPEG quality for a provider / model, and can shrink images further
+to fit a target number of input tokens per image.
+
+Usage:
+    from par_ai_core.llm_image_policy import get_image_policy
+
+    policy = get_image_policy(LlmProvider.BEDROCK, model_name, target_tokens=1200)
+    images = convert_from_path(pdf_path, **policy.render_kwargs())
+    image_bytes = policy.encode(images[0])
+"""
+
+from __future__ import annotations
+
+import io
+import math
+from dataclasses import dataclass, replace
+from typing import Any, Literal
+
+from ai_ocr.lib.par_ai_core.llm_image_utils import ANTHROPIC_MAX_IMAGE_TOKENS, estimate_image_tokens
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+from PIL import Image
+
+ANTHROPIC_MAX_LONG_EDGE = 1568
+"""Long edge Anthropic models scale images down to."""
+
+ANTHROPIC_MAX_PIXELS = 1_150_000
+"""Total pixels Anthropic models scale images down to."""
+
+OPENAI_MAX_LONG_EDGE = 2048
+"""Long edge OpenAI high detail scales images down to first."""
+
+OPENAI_MAX_SHORT_EDGE = 768
+"""Short edge OpenAI high detail scales images down to after fitting the long edge."""
+
+DEFAULT_MAX_LONG_EDGE = 2048
+"""Long edge used for providers / models without a known limit."""
+
+
+@dataclass
+class ImagePolicy:
+    """How images are rendered and encoded for a provider / model.
+
+    Attributes:
+        provider: Provider the images are sent to, used to estimate tokens
+        dpi: Render resolution used when max_long_edge is not set
+        max_long_edge: Max pixels of the long edge, pages are rendered straight to this size
+        max_short_edge: Max pixels of the short edge
+        max_pixels: Max total pixels
+        target_tokens: Max estimated input tokens per image, images are shrunk until they fit
+        grayscale: Convert images to grayscale
+        jpeg_quality: JPEG quality (1-95)
+    """
+
+    provider: LlmProvider
+    """Provider the images are sent to, used to estimate tokens."""
+    dpi: int = 200
+    """Render resolution used when max_long_edge is not set."""
+    max_long_edge: int | None = None
+    """Max pixels of the long edge. Pages are rendered straight to this size instead of at dpi."""
+    max_short_edge: int | None = None
+    """Max pixels of the short edge."""
+    max_pixels: int | None = None
+    """Max total pixels (width * height)."""
+    target_tokens: int | None = None
+    """Max estimated input tokens per image. Images are shrunk until they fit."""
+    grayscale: bool = False
+    """Convert images to grayscale, shrinking the JPEG without changing the token count."""
+    jpeg_quality: int = 80
+    """JPEG quality (1-95)."""
+
+    def render_kwargs(self) -> dict[str, Any]:
+        """Get the pdf2image convert_from_path arguments that render pages for this policy."""
+        if self.max_long_edge:
+            # scale-to sets the long edge whatever the page orientation
+            return {"size": self.max_long_edge, "grayscale": self.grayscale}
+        return {"dpi": self.dpi, "grayscale": self.grayscale}
+
+    def fit_size(self, width: int, height: int) -> tuple[int, int]:
+        """Get the size an image of the given size should be scaled down to.
+
+        Args:
+            width: Image width in pixels
+            height: Image height in pixels
+
+        Returns:
+            tuple[int, int]: Width and height, never larger than the input
+        """
+        scale = 1.0
+        if self.max_long_edge:
+            scale = min(scale, self.max_long_edge / max(width, height))
+        if self.max_short_edge:
+            scale = min(scale, self.max_short_edge / min(width, height))
+        if self.max_pixels:
+            scale = min(scale, math.sqrt(self.max_pixels / (width * height)))
+        if self.target_tokens:
+            tokens = estimate_image_tokens(self.provider, round(width * scale), round(height * scale))
+            while tokens > self.target_tokens and scale > 0.05:
+                # token cost grows with area so shrink both edges by the square root of the overshoot
+                scale *= max(0.5, min(0.95, math.sqrt(self.target_tokens / tokens)))
+                tokens = estimate_image_tokens(self.provider, round(width * scale), round(height * scale))
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def apply(self, image: Image.Image) -> Image.Image:
+        """Convert and scale an image to fit the policy. Returns the image itself if nothing changes."""
+        if self.grayscale and image.mode != "L":
+            image = image.convert("L")
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        size = self.fit_size(image.width, image.height)
+        if size != image.size:
+            image = image.resize(size, Image.Resampling.LANCZOS)
+        return image
+
+    def encode(self, image: Image.Image) -> bytes:
+        """Apply the policy to an image and encode it as JPEG."""
+        buffer = io.BytesIO()
+        self.apply(image).save(buffer, "JPEG", quality=self.jpeg_quality, optimize=True)
+        return buffer.getvalue()
+
+    def fit_image_bytes(
+        self, image_bytes: bytes, image_type: Literal["jpeg", "png", "gif"] = "jpeg"
+    ) -> tuple[bytes, Literal["jpeg", "png", "gif"]]:
+        """Re-encode an encoded image if it does not already fit the policy.
+
+        Args:
+            image_bytes: Encoded image
+            image_type: Type of the encoded image
+
+        Returns:
+            tuple: Image bytes and type, the originals if the image already fits
+        """
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            fits = image.size == self.fit_size(image.width, image.height)
+            if fits and image_type == "jpeg" and (image.mode == "L" or not self.grayscale):
+                return image_bytes, image_type
+            return self.encode(image), "jpeg"
+
+    def estimate_tokens(self, width: int, height: int) -> int:
+        """Estimate the input tokens of an image of the given size after the policy is applied."""
+        return estimate_image_tokens(self.provider, *self.fit_size(width, height))
+
+
+def get_image_policy(
+    provider: LlmProvider,
+    model_name: str,
+    *,
+    target_tokens: int | None = None,
+    grayscale: bool | None = None,
+    jpeg_quality: int | None = None,
+) -> ImagePolicy:
+    """Get the image policy for a provider / model.
+
+    Args:
+        provider: Provider the images are sent to
+        model_name: Model the images are sent to
+        target_tokens: Max estimated input tokens per image
+        grayscale: Override the policy's grayscale conversion
+        jpeg_quality: Override the policy's JPEG quality
+
+    Returns:
+        ImagePolicy: Policy matching the provider's server side image limits
+    """
+    if provider == LlmProvider.ANTHROPIC or (provider == LlmProvider.BEDROCK and "claude" in model_name.lower()):
+        # images over the token limit are scaled down server side, so scale them down before sending
+        policy = ImagePolicy(
+            provider=provider,
+            max_long_edge=ANTHROPIC_MAX_LONG_EDGE,
+            max_pixels=ANTHROPIC_MAX_PIXELS,
+            target_tokens=ANTHROPIC_MAX_IMAGE_TOKENS,
+        )
+        target_tokens = min(target_tokens or ANTHROPIC_MAX_IMAGE_TOKENS, ANTHROPIC_MAX_IMAGE_TOKENS)
+    elif provider == LlmProvider.OPENAI:
+        policy = ImagePolicy(
+            provider=provider, max_long_edge=OPENAI_MAX_LONG_EDGE, max_short_edge=OPENAI_MAX_SHORT_EDGE
+        )
+    else:
+        policy = ImagePolicy(provider=provider, max_long_edge=DEFAULT_MAX_LONG_EDGE)
+
+    overrides: dict[str, Any] = {"target_tokens": target_tokens}
+    if grayscale is not None:
+        overrides["grayscale"] = grayscale
+    if jpeg_quality:
+        overrides["jpeg_quality"] = jpeg_quality
+    return replace(policy, **overrides)
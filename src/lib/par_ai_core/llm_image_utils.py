@@ -8,6 +8,8 @@ utilities for:
 - Image type detection
 - Converting images to base64 data URLs
 - Formatting images for chat message inputs
+- Estimating the input tokens a provider charges for an image
+- Fitting images to a provider / model image policy (see llm_image_policy)
 
 These utilities are particularly useful when working with LLMs that support
 image inputs, such as GPT-4 Vision or similar models.
@@ -31,8 +33,18 @@ Note:
 from __future__ import annotations
 
 import base64
+import math
 from pathlib import Path
-from typing import Any, Literal
+from typing import TYPE_CHECKING, Any, Literal
+
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+
+if TYPE_CHECKING:
+    from ai_ocr.lib.par_ai_core.llm_image_policy import ImagePolicy
+
+
+ANTHROPIC_MAX_IMAGE_TOKENS = 1600
+"""Tokens of the largest image Anthropic models accept without scaling it down."""
 
 
 class UnsupportedImageTypeError(ValueError):
@@ -78,16 +90,21 @@ def try_get_image_type(image_path: str | Path) -> Literal["jpeg", "png", "gif"]:
     raise UnsupportedImageTypeError(f"Unsupported image type: {ext}")
 
 
-def image_to_base64(image_bytes: bytes, image_type: Literal["jpeg", "png", "gif"] = "jpeg") -> str:
+def image_to_base64(
+    image_bytes: bytes, image_type: Literal["jpeg", "png", "gif"] = "jpeg", policy: ImagePolicy | None = None
+) -> str:
     """Convert an image to a base64 data URL.
 
     Args:
         image_bytes: Raw bytes of the image
         image_type: Type of image (jpeg, png, or gif). Defaults to "jpeg".
+        policy: Image policy to scale and re-encode the image with if it does not already fit
 
     Returns:
         Base64 data URL string representation of the image
     """
+    if policy:
+        image_bytes, image_type = policy.fit_image_bytes(image_bytes, image_type)
     return f"data:image/{image_type};base64,{b64_encode_image(image_bytes)}"
 
 
@@ -104,3 +121,31 @@ def image_to_chat_message(image_url_str: str) -> dict[str, Any]:
         "type": "image_url",
         "image_url": {"url": image_url_str},
     }
+
+
+def estimate_image_tokens(provider: LlmProvider, width: int, height: int) -> int:
+    """Estimate the input tokens a provider charges for an image.
+
+    Anthropic models (including on Bedrock) scale images to fit a 1568 pixel long edge
+    and about 1.15 megapixels, and charge about one token per 750 pixels. OpenAI high detail scales the image to
+    fit 2048 pixels then to a 768 pixel short edge and charges 170 tokens per 512 pixel
+    tile plus 85 base tokens.
+
+    Args:
+        provider: LLM provider the image is sent to
+        width: Image width in pixels
+        height: Image height in pixels
+
+    Returns:
+        Estimated number of input tokens for the image
+    """
+    if width <= 0 or height <= 0:
+        return 0
+    if provider == LlmProvider.OPENAI:
+        scale = min(1.0, 2048 / max(width, height))
+        width, height = width * scale, height * scale
+        scale = min(1.0, 768 / min(width, height))
+        width, height = width * scale, height * scale
+        return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+    scale = min(1.0, 1568 / max(width, height))
+    return min(ANTHROPIC_MAX_IMAGE_TOKENS, math.ceil((width * scale) * (height * scale) / 750))
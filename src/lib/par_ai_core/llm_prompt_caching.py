@@ -0,0 +1,95 @@
+"""Prompt caching breakpoints for providers that need them marked explicitly.
+
+Anthropic models, directly and on Bedrock, only cache a prompt prefix that ends at
+a cache breakpoint. The Anthropic API marks a breakpoint with ``cache_control`` on a
+content block. Bedrock Converse uses a separate ``cachePoint`` block. Prefixes
+shorter than the model's minimum are never cached, so breakpoints on them are only
+noise. OpenAI caches long prefixes automatically and needs no breakpoints.
+``retarget_cache_breakpoints`` converts messages built for one provider when they
+are sent to another, such as on failover to a different provider.
+
+Usage:
+    from par_ai_core.llm_prompt_caching import cached_text_content, prompt_cache_min_tokens
+
+    if prompt_cache_min_tokens(provider, model_name):
+        messages = [("system", cached_text_content(provider, system_prompt)), ("user", user_content)]
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+
+ANTHROPIC_MIN_CACHE_TOKENS = 1024
+"""Min tokens of a cacheable prompt prefix for Sonnet and Opus models."""
+
+ANTHROPIC_HAIKU_MIN_CACHE_TOKENS = 2048
+"""Min tokens of a cacheable prompt prefix for Haiku models."""
+
+
+def prompt_cache_min_tokens(provider: LlmProvider, model_name: str) -> int | None:
+    """Get the min prompt prefix tokens a model caches at an explicit breakpoint.
+
+    Args:
+        provider: Provider the prompt is sent to
+        model_name: Model the prompt is sent to
+
+    Returns:
+        int | None: Min prefix tokens, None if the provider / model does not use explicit breakpoints
+    """
+    model_name = model_name.lower()
+    if provider == LlmProvider.ANTHROPIC or (provider == LlmProvider.BEDROCK and "claude" in model_name):
+        return ANTHROPIC_HAIKU_MIN_CACHE_TOKENS if "haiku" in model_name else ANTHROPIC_MIN_CACHE_TOKENS
+    return None
+
+
+def cached_text_content(provider: LlmProvider, text: str) -> list[dict[str, Any]]:
+    """Build message content blocks for a text followed by a cache breakpoint.
+
+    Args:
+        provider: Provider the prompt is sent to
+        text: Static prompt text that ends the cached prefix
+
+    Returns:
+        list: Content blocks in the provider's format
+    """
+    if provider == LlmProvider.BEDROCK:
+        return [{"type": "text", "text": text}, {"cachePoint": {"type": "default"}}]
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+def retarget_cache_breakpoints(messages: list[Any], provider: LlmProvider, model_name: str) -> list[Any]:
+    """Convert the cache breakpoints of messages built for another provider to the format of a provider / model.
+
+    Breakpoints are dropped for providers / models that do not use them, and system messages left with
+    text blocks only are joined into plain text since not every provider accepts content blocks there.
+
+    Args:
+        messages: (role, content) tuples whose content may hold cache breakpoints of any provider
+        provider: Provider the messages are sent to
+        model_name: Model the messages are sent to
+
+    Returns:
+        list: Messages with breakpoints in the format of the provider
+    """
+    marks_breakpoints = prompt_cache_min_tokens(provider, model_name) is not None
+    retargeted: list[Any] = []
+    for role, content in messages:
+        if isinstance(content, str):
+            retargeted.append((role, content))
+            continue
+        blocks: list[dict[str, Any]] = []
+        for block in content:
+            if "cachePoint" in block or "cache_control" in block:
+                if "cache_control" in block:
+                    blocks.append({key: value for key, value in block.items() if key != "cache_control"})
+                if marks_breakpoints and blocks and blocks[-1].get("type") == "text":
+                    blocks[-1:] = cached_text_content(provider, blocks[-1]["text"])
+                continue
+            blocks.append(block)
+        if role == "system" and not marks_breakpoints and all(block.get("type") == "text" for block in blocks):
+            retargeted.append((role, "\n\n".join(block["text"] for block in blocks)))
+        else:
+            retargeted.append((role, blocks))
+    return retargeted
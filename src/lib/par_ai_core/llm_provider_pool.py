@@ -0,0 +1,374 @@
+"""Failover and load spreading of LLM requests over several provider endpoints.
+
+A ``ProviderPool`` holds an ordered list of endpoints, each a provider / model /
+base url with a weight. Every request goes to the healthiest endpoint first and
+fails over to the next one on throttling, timeout and 5xx errors. Errors that will
+not go away on another endpoint, such as a bad request, are raised at once.
+
+Each endpoint has a circuit breaker. After ``failure_threshold`` consecutive
+retryable failures the circuit opens and the endpoint gets no requests until
+``reset_timeout`` seconds have passed. Then a single probe request is let through;
+if it succeeds the circuit closes again, otherwise it stays open for another
+timeout. When every circuit is open ``NoHealthyEndpointError`` is raised, a
+``ConnectionError`` so callers retry it with backoff like any other transient
+failure.
+
+The health of an endpoint is shared per process through ``get_endpoint_health``,
+so a warm container remembers an endpoint is down across documents.
+
+Usage:
+    from par_ai_core.llm_provider_pool import PoolMember, ProviderPool
+
+    pool = ProviderPool([PoolMember(bedrock_config), PoolMember(anthropic_config)])
+    response = pool.call(lambda member: models[member.name].invoke(messages))
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable, Collection
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig
+from ai_ocr.lib.par_ai_core.llm_errors import RETRYABLE_ERROR_KINDS, LlmErrorKind, classify_llm_error
+from strenum import StrEnum
+
+T = TypeVar("T")
+
+
+class PoolStrategy(StrEnum):
+    """Order in which pool endpoints are tried."""
+
+    PRIORITY = "priority"
+    """Endpoints in list order, later endpoints only get requests when earlier ones fail."""
+    WEIGHTED = "weighted"
+    """Requests spread randomly by endpoint weight times recent success rate."""
+
+
+class CircuitState(StrEnum):
+    """State of an endpoint circuit breaker."""
+
+    CLOSED = "closed"
+    """Endpoint is healthy and gets requests."""
+    OPEN = "open"
+    """Endpoint failed repeatedly and gets no requests until the reset timeout has passed."""
+    HALF_OPEN = "half_open"
+    """Reset timeout passed, a single probe request decides if the circuit closes."""
+
+
+class NoHealthyEndpointError(ConnectionError):
+    """Raised when the circuit of every pool endpoint is open."""
+
+
+class EndpointHealth:
+    """Circuit breaker and recent success rate of a provider endpoint.
+
+    Attributes:
+        failure_threshold: Consecutive retryable failures that open the circuit
+        reset_timeout: Seconds an open circuit waits before letting a probe request through
+    """
+
+    def __init__(self, *, failure_threshold: int = 3, reset_timeout: float = 30.0, window: int = 20) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._latency: float | None = None
+        self._successes = 0
+        self._failures = 0
+        self._opens = 0
+
+    def _current_state(self, now: float) -> CircuitState:
+        """Get the state, moving an open circuit past its reset timeout to half open. Must hold the lock."""
+        if self._state == CircuitState.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = CircuitState.HALF_OPEN
+        return self._state
+
+    @property
+    def state(self) -> CircuitState:
+        """Current circuit state."""
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    @property
+    def opened_at(self) -> float:
+        """time.monotonic() timestamp the circuit last opened at, 0 if it never opened."""
+        with self._lock:
+            return self._opened_at
+
+    @property
+    def success_rate(self) -> float:
+        """Fraction of recent requests that succeeded, 1 without requests."""
+        with self._lock:
+            if not self._outcomes:
+                return 1.0
+            return self._outcomes.count(True) / len(self._outcomes)
+
+    def try_acquire(self) -> bool:
+        """Check if a request may be sent, taking the probe slot of a half open circuit."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CircuitState.CLOSED:
+                return True
+            if state == CircuitState.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency: float) -> None:
+        """Record a successful request, closing the circuit."""
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            self._outcomes.append(True)
+            self._successes += 1
+            self._latency = latency if self._latency is None else self._latency * 0.9 + latency * 0.1
+
+    def record_failure(self) -> None:
+        """Record a retryable failure, opening the circuit past the threshold or when a probe failed."""
+        with self._lock:
+            now = time.monotonic()
+            self._consecutive_failures += 1
+            self._outcomes.append(False)
+            self._failures += 1
+            if (
+                self._current_state(now) == CircuitState.HALF_OPEN
+                or self._consecutive_failures >= self.failure_threshold
+            ):
+                if self._state != CircuitState.OPEN:
+                    self._opens += 1
+                self._state = CircuitState.OPEN
+                self._opened_at = now
+            self._probe_in_flight = False
+
+    def release(self) -> None:
+        """End a request whose outcome says nothing about the endpoint, such as a bad request or cancellation."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> dict[str, Any]:
+        """Get the circuit state and counters as a metrics dict."""
+        with self._lock:
+            return {
+                "state": str(self._current_state(time.monotonic())),
+                "consecutive_failures": self._consecutive_failures,
+                "success_rate": round(self._outcomes.count(True) / len(self._outcomes), 3) if self._outcomes else 1.0,
+                "latency": round(self._latency or 0.0, 3),
+                "successes": self._successes,
+                "failures": self._failures,
+                "opens": self._opens,
+            }
+
+
+_health_lock = threading.Lock()
+_health: dict[tuple[str, str, str | None], EndpointHealth] = {}
+
+
+def get_endpoint_health(llm_config: LlmConfig, **kwargs: Any) -> EndpointHealth:
+    """Get the shared health of a provider / model / base url, creating it on first use.
+
+    Args:
+        llm_config: Config of the endpoint
+        **kwargs: EndpointHealth arguments used when the health is created
+
+    Returns:
+        EndpointHealth: Health shared by all pools containing the endpoint
+    """
+    with _health_lock:
+        key = (str(llm_config.provider.value), llm_config.model_name, llm_config.base_url)
+        if key not in _health:
+            _health[key] = EndpointHealth(**kwargs)
+        return _health[key]
+
+
+@dataclass
+class PoolMember:
+    """Provider endpoint of a pool."""
+
+    llm_config: LlmConfig
+    """Provider, model and base url requests are sent to."""
+    weight: float = 1.0
+    """Relative share of requests with the weighted strategy."""
+    health: EndpointHealth = field(default_factory=EndpointHealth)
+    """Circuit breaker of the endpoint."""
+
+    @property
+    def name(self) -> str:
+        """Unique name of the endpoint, also used in logs."""
+        name = f"{self.llm_config.provider.value}/{self.llm_config.model_name}"
+        return f"{name}@{self.llm_config.base_url}" if self.llm_config.base_url else name
+
+
+FailureCallback = Callable[[PoolMember, LlmErrorKind, BaseException], None]
+"""Called with the endpoint, error kind and error of every retryable failure."""
+
+
+class ProviderPool:
+    """Ordered or weighted list of provider endpoints with failover.
+
+    Attributes:
+        members: Endpoints of the pool, the first is the primary one
+        strategy: Order in which healthy endpoints are tried
+    """
+
+    def __init__(self, members: list[PoolMember], *, strategy: PoolStrategy = PoolStrategy.PRIORITY) -> None:
+        if not members:
+            raise ValueError("A provider pool needs at least one endpoint")
+        self.members = members
+        self.strategy = strategy
+
+    @classmethod
+    def from_configs(
+        cls,
+        endpoints: list[tuple[LlmConfig, float]],
+        *,
+        strategy: PoolStrategy = PoolStrategy.PRIORITY,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+    ) -> ProviderPool:
+        """Create a pool of endpoints sharing the process wide health of each endpoint.
+
+        Args:
+            endpoints: Config and weight of each endpoint in priority order
+            strategy: Order in which healthy endpoints are tried
+            failure_threshold: Consecutive retryable failures that open an endpoint circuit
+            reset_timeout: Seconds an open circuit waits before letting a probe request through
+
+        Returns:
+            ProviderPool: The pool
+        """
+        return cls(
+            [
+                PoolMember(
+                    llm_config=llm_config,
+                    weight=weight,
+                    health=get_endpoint_health(
+                        llm_config, failure_threshold=failure_threshold, reset_timeout=reset_timeout
+                    ),
+                )
+                for llm_config, weight in endpoints
+            ],
+            strategy=strategy,
+        )
+
+    def candidates(self, avoid: Collection[str] = ()) -> list[PoolMember]:
+        """Get the endpoints in the order they should be tried.
+
+        Endpoints with a closed circuit come first, in list order or shuffled by weight times recent
+        success rate. Endpoints with an open circuit follow, longest open first, and only get a request
+        once their reset timeout has passed.
+
+        Args:
+            avoid: Names of endpoints only tried after every other endpoint, such as the endpoint
+                a request being hedged is waiting on
+        """
+        closed: list[PoolMember] = []
+        waiting: list[PoolMember] = []
+        for member in self.members:
+            (closed if member.health.state == CircuitState.CLOSED else waiting).append(member)
+        if self.strategy == PoolStrategy.WEIGHTED:
+            # weighted random order without replacement
+            closed.sort(
+                key=lambda member: random.random() ** (1 / max(member.weight * member.health.success_rate, 1e-6)),
+                reverse=True,
+            )
+        ordered = closed + sorted(waiting, key=lambda member: member.health.opened_at)
+        return [member for member in ordered if member.name not in avoid] + [
+            member for member in ordered if member.name in avoid
+        ]
+
+    def _failed(
+        self, member: PoolMember, error: BaseException, on_failure: FailureCallback | None
+    ) -> BaseException | None:
+        """Record a failed request, returning the error if the next endpoint should be tried."""
+        kind = classify_llm_error(error)
+        if kind not in RETRYABLE_ERROR_KINDS:
+            member.health.release()
+            return None
+        member.health.record_failure()
+        if on_failure:
+            on_failure(member, kind, error)
+        return error
+
+    def call(
+        self,
+        fn: Callable[[PoolMember], T],
+        *,
+        on_failure: FailureCallback | None = None,
+        avoid: Collection[str] = (),
+    ) -> T:
+        """Call fn with the healthiest endpoint, failing over to the next one on retryable errors.
+
+        Args:
+            fn: Function performing a single request to an endpoint
+            on_failure: Called for every retryable failure
+            avoid: Names of endpoints only tried after every other endpoint
+
+        Returns:
+            The result of fn
+
+        Raises:
+            NoHealthyEndpointError: If the circuit of every endpoint is open
+        """
+        last_error: BaseException | None = None
+        for member in self.candidates(avoid):
+            if not member.health.try_acquire():
+                continue
+            start_time = time.monotonic()
+            try:
+                result = fn(member)
+            except Exception as e:  # pylint: disable=broad-except
+                last_error = self._failed(member, e, on_failure)
+                if last_error is None:
+                    raise
+                continue
+            except BaseException:
+                member.health.release()
+                raise
+            member.health.record_success(time.monotonic() - start_time)
+            return result
+        if last_error:
+            raise last_error
+        raise NoHealthyEndpointError("The circuit of every provider pool endpoint is open")
+
+    async def acall(
+        self,
+        fn: Callable[[PoolMember], Awaitable[T]],
+        *,
+        on_failure: FailureCallback | None = None,
+        avoid: Collection[str] = (),
+    ) -> T:
+        """Async version of ``call``."""
+        last_error: BaseException | None = None
+        for member in self.candidates(avoid):
+            if not member.health.try_acquire():
+                continue
+            start_time = time.monotonic()
+            try:
+                result = await fn(member)
+            except Exception as e:  # pylint: disable=broad-except
+                last_error = self._failed(member, e, on_failure)
+                if last_error is None:
+                    raise
+                continue
+            except BaseException:
+                member.health.release()
+                raise
+            member.health.record_success(time.monotonic() - start_time)
+            return result
+        if last_error:
+            raise last_error
+        raise NoHealthyEndpointError("The circuit of every provider pool endpoint is open")
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """Get the health of every endpoint as a metrics dict keyed by endpoint name."""
+        return {member.name: member.health.snapshot() | {"weight": member.weight} for member in self.members}
@@ -0,0 +1,215 @@
+"""Provider quota aware rate limiting for LLM requests.
+
+Providers enforce both requests-per-minute (RPM) and tokens-per-minute (TPM)
+quotas. This module keeps a pair of token buckets per (provider, model) so every
+caller in the process, including concurrent documents in a warm container,
+draws from the same budget instead of competing blindly and tripping throttles.
+
+Each request reserves one request and its estimated token count up front. When
+a bucket would go negative the caller waits until the reservation has been paid
+back by the refill rate, so waiting callers are served roughly in arrival order.
+
+Quotas are registered through ``LlmConfig.requests_per_minute`` /
+``LlmConfig.tokens_per_minute`` or the ``<PROVIDER>_REQUESTS_PER_MINUTE`` and
+``<PROVIDER>_TOKENS_PER_MINUTE`` environment variables (e.g.
+``BEDROCK_TOKENS_PER_MINUTE``).
+
+Usage:
+    from par_ai_core.llm_rate_limiter import get_rate_limiter
+
+    limiter = get_rate_limiter(LlmProvider.BEDROCK, model_name, requests_per_minute=50, tokens_per_minute=200_000)
+    limiter.acquire(tokens=estimated_input_tokens)
+    response = model.invoke(messages)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any
+
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+
+
+class TokenBucket:
+    """Token bucket that allows reserving more than is available and reports how long to wait.
+
+    Attributes:
+        capacity: Max number of tokens the bucket holds, also the allowed burst size
+        refill_rate: Tokens added per second
+    """
+
+    def __init__(self, *, capacity: float, refill_rate: float) -> None:
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_rate)
+        self._updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount from the bucket and return the seconds to wait before using it.
+
+        Not thread safe, callers must serialize access.
+        """
+        self._refill(now)
+        self._tokens -= min(amount, self.capacity)
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.refill_rate
+
+
+class ProviderRateLimiter:
+    """Request and token budget for a single provider / model.
+
+    Attributes:
+        requests_per_minute: Request quota, None for unlimited
+        tokens_per_minute: Token quota, None for unlimited
+    """
+
+    def __init__(self, *, requests_per_minute: int | None = None, tokens_per_minute: int | None = None) -> None:
+        self._lock = threading.Lock()
+        self.requests_per_minute: int | None = None
+        self.tokens_per_minute: int | None = None
+        self._request_bucket: TokenBucket | None = None
+        self._token_bucket: TokenBucket | None = None
+        self._requests = 0
+        self._tokens = 0
+        self._delayed_requests = 0
+        self._total_wait = 0.0
+        self.set_quotas(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+
+    def set_quotas(self, *, requests_per_minute: int | None = None, tokens_per_minute: int | None = None) -> None:
+        """Update the quotas, keeping the current bucket levels if a quota is unchanged."""
+        with self._lock:
+            if requests_per_minute != self.requests_per_minute:
+                self.requests_per_minute = requests_per_minute
+                self._request_bucket = (
+                    TokenBucket(capacity=requests_per_minute, refill_rate=requests_per_minute / 60)
+                    if requests_per_minute
+                    else None
+                )
+            if tokens_per_minute != self.tokens_per_minute:
+                self.tokens_per_minute = tokens_per_minute
+                self._token_bucket = (
+                    TokenBucket(capacity=tokens_per_minute, refill_rate=tokens_per_minute / 60)
+                    if tokens_per_minute
+                    else None
+                )
+
+    def _reserve(self, tokens: int) -> float:
+        """Reserve one request and tokens, returning the seconds the caller must wait."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._request_bucket:
+                wait = max(wait, self._request_bucket.reserve(1, now))
+            if self._token_bucket and tokens:
+                wait = max(wait, self._token_bucket.reserve(tokens, now))
+            self._requests += 1
+            self._tokens += tokens
+            if wait > 0:
+                self._delayed_requests += 1
+                self._total_wait += wait
+            return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until the request fits in the quotas.
+
+        Args:
+            tokens: Estimated tokens for the request
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        """Async version of ``acquire``."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def snapshot(self) -> dict[str, Any]:
+        """Get quota and usage counters as a metrics dict."""
+        with self._lock:
+            return {
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "requests": self._requests,
+                "tokens": self._tokens,
+                "delayed_requests": self._delayed_requests,
+                "total_wait": round(self._total_wait, 3),
+            }
+
+
+def quota_env_var(provider: LlmProvider, quota: str) -> str:
+    """Get the environment variable of a provider quota, such as BEDROCK_REQUESTS_PER_MINUTE.
+
+    Args:
+        provider: LLM provider the quota applies to
+        quota: Quota name, REQUESTS_PER_MINUTE or TOKENS_PER_MINUTE
+    """
+    return f"{provider.value.upper()}_{quota}"
+
+
+def get_quota_from_env(provider: LlmProvider, quota: str) -> int | None:
+    """Read a quota such as REQUESTS_PER_MINUTE for a provider from the environment.
+
+    Args:
+        provider: LLM provider the quota applies to
+        quota: Quota name, REQUESTS_PER_MINUTE or TOKENS_PER_MINUTE
+
+    Returns:
+        int | None: Quota value if set
+    """
+    value = os.environ.get(quota_env_var(provider, quota))
+    return int(value) if value else None
+
+
+_limiters_lock = threading.Lock()
+_limiters: dict[tuple[LlmProvider, str], ProviderRateLimiter] = {}
+
+
+def get_rate_limiter(
+    provider: LlmProvider,
+    model_name: str,
+    *,
+    requests_per_minute: int | None = None,
+    tokens_per_minute: int | None = None,
+) -> ProviderRateLimiter | None:
+    """Get the shared rate limiter for a provider / model.
+
+    Quotas not passed in are read from the environment. Passing quotas for an
+    existing limiter updates it.
+
+    Args:
+        provider: LLM provider the requests go to
+        model_name: Model the requests go to
+        requests_per_minute: Request quota
+        tokens_per_minute: Token quota
+
+    Returns:
+        ProviderRateLimiter | None: Shared limiter or None if no quota is configured
+    """
+    requests_per_minute = requests_per_minute or get_quota_from_env(provider, "REQUESTS_PER_MINUTE")
+    tokens_per_minute = tokens_per_minute or get_quota_from_env(provider, "TOKENS_PER_MINUTE")
+    key = (provider, model_name)
+    with _limiters_lock:
+        if not requests_per_minute and not tokens_per_minute:
+            return _limiters.get(key)
+        if key not in _limiters:
+            _limiters[key] = ProviderRateLimiter(
+                requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute
+            )
+        else:
+            _limiters[key].set_quotas(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+        return _limiters[key]
@@ -0,0 +1,155 @@
+"""Retry of LLM requests with jittered exponential backoff and deadlines.
+
+Transient provider failures (throttling, timeouts and 5xx errors) are retried
+with full-jitter exponential backoff so concurrent callers spread their
+retries out instead of hammering the provider in lock step. Throttling waits
+start from a longer base delay since the provider has explicitly asked for
+less traffic. Non-retryable errors such as bad requests are raised at once.
+
+A deadline (a ``time.monotonic()`` timestamp) bounds the whole call: no retry
+is started if its backoff would end past the deadline, and async attempts are
+cancelled when the deadline is reached.
+
+Usage:
+    from par_ai_core.llm_retry import RetryPolicy, call_with_retry
+
+    response = call_with_retry(
+        lambda: model.invoke(messages),
+        policy=RetryPolicy(max_attempts=4),
+        deadline=time.monotonic() + 120,
+        on_retry=lambda kind, attempt, delay, error: log.warning(f"retry {attempt} in {delay:.1f}s: {error}"),
+    )
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import TypeVar
+
+from ai_ocr.lib.par_ai_core.llm_errors import RETRYABLE_ERROR_KINDS, LlmErrorKind, classify_llm_error
+
+T = TypeVar("T")
+
+RetryCallback = Callable[[LlmErrorKind, int, float, BaseException], None]
+"""Called before sleeping with the error kind, the attempt that failed, the backoff delay and the error."""
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a request can not complete before its deadline."""
+
+
+@dataclass
+class RetryPolicy:
+    """Retry settings for LLM requests.
+
+    Attributes:
+        max_attempts: Total number of attempts including the first
+        base_delay: Backoff base in seconds for timeouts and server errors
+        throttle_base_delay: Backoff base in seconds for throttling errors
+        max_delay: Upper bound for a single backoff in seconds
+    """
+
+    max_attempts: int = 4
+    """Total number of attempts including the first. 1 disables retries."""
+    base_delay: float = 1.0
+    """Backoff base in seconds for timeouts and server errors."""
+    throttle_base_delay: float = 2.0
+    """Backoff base in seconds for throttling errors."""
+    max_delay: float = 30.0
+    """Upper bound for a single backoff in seconds."""
+
+    def backoff(self, kind: LlmErrorKind, attempt: int) -> float:
+        """Get a full jitter backoff delay for the given failed attempt (1 based)."""
+        base = self.throttle_base_delay if kind == LlmErrorKind.THROTTLING else self.base_delay
+        return random.uniform(0, min(self.max_delay, base * 2 ** (attempt - 1)))
+
+    def next_delay(self, error: BaseException, attempt: int, deadline: float | None) -> tuple[LlmErrorKind, float]:
+        """Decide if a failed attempt should be retried.
+
+        Returns:
+            tuple[LlmErrorKind, float]: Error kind and backoff delay, delay is negative if the error should be raised
+        """
+        kind = classify_llm_error(error)
+        if kind not in RETRYABLE_ERROR_KINDS or attempt >= self.max_attempts:
+            return kind, -1
+        delay = self.backoff(kind, attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return kind, -1
+        return kind, delay
+
+
+def _check_deadline(deadline: float | None) -> None:
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceededError("Deadline exceeded before request could be sent")
+
+
+def call_with_retry(
+    fn: Callable[[], T],
+    *,
+    policy: RetryPolicy,
+    deadline: float | None = None,
+    on_retry: RetryCallback | None = None,
+) -> T:
+    """Call fn, retrying transient provider errors.
+
+    A blocking call in flight can not be interrupted, so the deadline is only
+    checked before each attempt and before each backoff.
+
+    Args:
+        fn: Function performing a single request
+        policy: Retry policy
+        deadline: time.monotonic() timestamp after which no new attempt is started
+        on_retry: Called before each backoff
+
+    Returns:
+        The result of fn
+    """
+    attempt = 0
+    while True:
+        _check_deadline(deadline)
+        attempt += 1
+        try:
+            return fn()
+        except Exception as e:  # pylint: disable=broad-except
+            kind, delay = policy.next_delay(e, attempt, deadline)
+            if delay < 0:
+                raise
+            if on_retry:
+                on_retry(kind, attempt, delay, e)
+            time.sleep(delay)
+
+
+async def acall_with_retry(
+    fn: Callable[[], Awaitable[T]],
+    *,
+    policy: RetryPolicy,
+    deadline: float | None = None,
+    on_retry: RetryCallback | None = None,
+) -> T:
+    """Async version of ``call_with_retry``. Attempts still running at the deadline are cancelled."""
+    attempt = 0
+    while True:
+        _check_deadline(deadline)
+        attempt += 1
+        try:
+            if deadline is None:
+                return await fn()
+            try:
+                return await asyncio.wait_for(fn(), timeout=deadline - time.monotonic())
+            except TimeoutError as e:
+                if time.monotonic() >= deadline:
+                    raise DeadlineExceededError("Deadline exceeded while waiting for response") from e
+                raise
+        except DeadlineExceededError:
+            raise
+        except Exception as e:  # pylint: disable=broad-except
+            kind, delay = policy.next_delay(e, attempt, deadline)
+            if delay < 0:
+                raise
+            if on_retry:
+                on_retry(kind, attempt, delay, e)
+            await asyncio.sleep(delay)
@@ -113,19 +113,19 @@ pricing_lookup = {
         "input": (3.0 / 1_000_000),
         "output": (15.0 / 1_000_000),
         "cache_read": 0.1,
-        "cache_write": 3.75,
+        "cache_write": 1.25,
     },
     "claude-3-5-sonnet-20241022": {
         "input": (3.0 / 1_000_000),
         "output": (15.0 / 1_000_000),
         "cache_read": 0.1,
-        "cache_write": 3.75,
+        "cache_write": 1.25,
     },
     "claude-3-5-sonnet-latest": {
         "input": (3.0 / 1_000_000),
         "output": (15.0 / 1_000_000),
         "cache_read": 0.1,
-        "cache_write": 3.75,
+        "cache_write": 1.25,
     },
     "claude-3-5-haiku-20241022": {
         "input": (1.0 / 1_000_000),
@@ -186,13 +186,13 @@ pricing_lookup = {
         "input": (3.0 / 1_000_000),
         "output": (15.0 / 1_000_000),
         "cache_read": 0.1,
-        "cache_write": 3.75,
+        "cache_write": 1.25,
     },
     "anthropic.claude-3-5-sonnet-20241022-v2:0": {
         "input": (3.0 / 1_000_000),
         "output": (15.0 / 1_000_000),
         "cache_read": 0.1,
-        "cache_write": 3.75,
+        "cache_write": 1.25,
     },
     # Google
     "flash1.5": {
@@ -258,7 +258,8 @@ def mk_usage_metadata() -> dict[str, int | float]:
     """Create a new usage metadata dictionary.
 
     Initializes a dictionary to track various usage metrics including:
-    token counts, cache operations, tool calls, and costs.
+    token counts, cache operations, tool calls, retries, provider failovers, OCR result cache
+    hits / misses, and costs.
 
     Returns:
         Dictionary with usage tracking fields initialized to zero
@@ -272,6 +273,16 @@ def mk_usage_metadata() -> dict[str, int | float]:
         "reasoning": 0,
         "successful_requests": 0,
         "tool_call_count": 0,
+        "retries": 0,
+        "throttling_retries": 0,
+        "timeout_retries": 0,
+        "server_retries": 0,
+        "failovers": 0,
+        "ocr_cache_hits": 0,
+        "ocr_cache_misses": 0,
+        "ocr_cache_saved_cost": 0.0,
+        "prompt_cache_hits": 0,
+        "prompt_cache_saved_cost": 0.0,
         "total_cost": 0.0,
     }
 
@@ -340,6 +351,28 @@ def get_api_call_cost(
     return 0
 
 
+def get_prompt_cache_savings(llm_config: LlmConfig, usage_metadata: dict[str, int | float]) -> float:
+    """Calculate how much prompt caching saved compared to sending every input token uncached.
+
+    Cache reads are billed at a discount while cache writes cost a premium, so the savings
+    are negative when a cached prefix is written but never read back.
+
+    Args:
+        llm_config: Configuration of the LLM used
+        usage_metadata: Dictionary containing usage statistics
+
+    Returns:
+        Savings in USD
+    """
+    model_name = get_api_cost_model_name(llm_config.model_name)
+    if model_name not in pricing_lookup:
+        return 0
+    pricing = pricing_lookup[model_name]
+    read_savings = usage_metadata["cache_read"] * pricing["input"] * (1 - pricing["cache_read"])
+    write_premium = usage_metadata["cache_write"] * pricing["input"] * (pricing["cache_write"] - 1)
+    return read_savings - write_premium
+
+
 def accumulate_cost(response: object | dict, usage_metadata: dict[str, int | float]) -> None:
     if isinstance(response, dict):
         usage_metadata["input_tokens"] += response.get("input_tokens", 0)
@@ -350,7 +383,8 @@ def accumulate_cost(response: object | dict, usage_metadata: dict[str, int | flo
         return
 
     if hasattr(response, "usage_metadata"):
-        for key, value in response.usage_metadata.items():  # type: ignore
+        usage = response.usage_metadata or {}  # type: ignore
+        for key, value in usage.items():
             if key in usage_metadata:
                 usage_metadata[key] += value
             if key == "input_token_details":
@@ -358,6 +392,14 @@ def accumulate_cost(response: object | dict, usage_metadata: dict[str, int | flo
                 usage_metadata["cache_read"] += value.get("cache_read", value.get("cache_read", 0))
             if key == "output_token_details":
                 usage_metadata["reasoning"] += value.get("reasoning", 0)
+        # Bedrock Converse leaves cached tokens out of input_tokens while other providers include them
+        details = usage.get("input_token_details") or {}
+        cached = details.get("cache_read", 0) + details.get("cache_creation", 0)
+        if (
+            cached
+            and usage.get("total_tokens", 0) - usage.get("input_tokens", 0) - usage.get("output_tokens", 0) >= cached
+        ):
+            usage_metadata["input_tokens"] += cached
 
 
 def show_llm_cost(
@@ -42,6 +42,7 @@ from ai_ocr.lib.par_ai_core.pricing_lookup import (
     PricingDisplay,
     accumulate_cost,
     get_api_call_cost,
+    get_prompt_cache_savings,
     mk_usage_metadata,
     show_llm_cost,
 )
@@ -85,6 +86,7 @@ class ParAICallbackHandler(BaseCallbackHandler, Serializable):
         super().__init__()
         self._lock = threading.Lock()
         self._usage_metadata = {}
+        self._provider_usage_metadata: dict[str, dict[str, dict[str, int | float]]] = {}
         self._console = console or console_err
         self.llm_config = llm_config
         self.show_prompts = show_prompts
@@ -111,12 +113,45 @@ class ParAICallbackHandler(BaseCallbackHandler, Serializable):
         with self._lock:
             return deepcopy(self._usage_metadata)
 
+    @property
+    def provider_usage_metadata(self) -> dict[str, dict[str, dict[str, int | float]]]:
+        """Get thread-safe copy of usage metadata by provider, then model.
+
+        Only holds usage of calls and counters attributed to a provider, models served by several
+        providers such as in a provider pool are split out here.
+        """
+        with self._lock:
+            return deepcopy(self._provider_usage_metadata)
+
     def _get_usage_metadata(self, model_name: str) -> dict[str, int | float]:
         """Get usage metadata for model_name. Create if not found."""
         if model_name not in self._usage_metadata:
             self._usage_metadata[model_name] = mk_usage_metadata()
         return self._usage_metadata[model_name]
 
+    def _get_provider_usage_metadata(self, provider: str, model_name: str) -> dict[str, int | float]:
+        """Get usage metadata for model_name of provider. Create if not found."""
+        models = self._provider_usage_metadata.setdefault(provider, {})
+        if model_name not in models:
+            models[model_name] = mk_usage_metadata()
+        return models[model_name]
+
+    def add_usage(self, model_name: str, *, provider: str | None = None, **counters: int | float) -> None:
+        """Add to usage counters that are tracked outside of LLM callbacks, such as retries.
+
+        Args:
+            model_name: Model the counters apply to
+            provider: Provider the counters apply to, also adds them to the provider usage if set
+            **counters: Counter names and amounts to add
+        """
+        with self._lock:
+            usage_metadatas = [self._get_usage_metadata(model_name)]
+            if provider:
+                usage_metadatas.append(self._get_provider_usage_metadata(provider, model_name))
+            for usage_metadata in usage_metadatas:
+                for key, value in counters.items():
+                    usage_metadata[key] = usage_metadata.get(key, 0) + value
+
     def on_llm_start(self, serialized: dict[str, Any], prompts: list[str], **kwargs: Any) -> None:
         """Print out the prompts."""
         if self.show_prompts:
@@ -154,25 +189,37 @@ class ParAICallbackHandler(BaseCallbackHandler, Serializable):
                 "[yellow]Warning: config_id not found in on_llm_end did you forget to set a RunnableConfig?[/yellow]"
             )
         else:
+            # price this call on its own so total_cost does not re-count earlier calls
+            call_usage = mk_usage_metadata()
+            if isinstance(generation, ChatGeneration):
+                if hasattr(generation.message, "tool_calls"):
+                    call_usage["tool_call_count"] += len(generation.message.tool_calls)  # type: ignore
+
+                # Handle token usage from additional_kwargs
+                if "token_usage" in generation.message.additional_kwargs:
+                    token_usage = generation.message.additional_kwargs["token_usage"]
+                    call_usage["input_tokens"] += token_usage.get("prompt_tokens", 0)
+                    call_usage["output_tokens"] += token_usage.get("completion_tokens", 0)
+                    call_usage["total_tokens"] += token_usage.get("total_tokens", 0)
+                accumulate_cost(generation.message, call_usage)
+            else:
+                if response.llm_output and "token_usage" in response.llm_output:
+                    accumulate_cost(response.llm_output, call_usage)
+            call_usage["total_cost"] = get_api_call_cost(llm_config, call_usage)
+            call_usage["successful_requests"] = 1
+            if call_usage["cache_read"]:
+                call_usage["prompt_cache_hits"] = 1
+            if call_usage["cache_read"] or call_usage["cache_write"]:
+                call_usage["prompt_cache_saved_cost"] = get_prompt_cache_savings(llm_config, call_usage)
+
             # update shared state behind lock
             with self._lock:
-                usage_metadata = self._get_usage_metadata(llm_config.model_name)
-                if isinstance(generation, ChatGeneration):
-                    if hasattr(generation.message, "tool_calls"):
-                        usage_metadata["tool_call_count"] += len(generation.message.tool_calls)  # type: ignore
-
-                    # Handle token usage from additional_kwargs
-                    if "token_usage" in generation.message.additional_kwargs:
-                        token_usage = generation.message.additional_kwargs["token_usage"]
-                        usage_metadata["input_tokens"] += token_usage.get("prompt_tokens", 0)
-                        usage_metadata["output_tokens"] += token_usage.get("completion_tokens", 0)
-                        usage_metadata["total_tokens"] += token_usage.get("total_tokens", 0)
-                    accumulate_cost(generation.message, usage_metadata)
-                else:
-                    if response.llm_output and "token_usage" in response.llm_output:
-                        accumulate_cost(response.llm_output, usage_metadata)
-                usage_metadata["total_cost"] += get_api_call_cost(llm_config, usage_metadata)
-                usage_metadata["successful_requests"] += 1
+                for usage_metadata in (
+                    self._get_usage_metadata(llm_config.model_name),
+                    self._get_provider_usage_metadata(llm_config.provider.value, llm_config.model_name),
+                ):
+                    for key, value in call_usage.items():
+                        usage_metadata[key] = usage_metadata.get(key, 0) + value
 
     def on_tool_start(
         self,
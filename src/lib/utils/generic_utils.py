@@ -18,6 +18,7 @@ import boto3
 import simplejson as json
 from aws_lambda_powertools import Logger
 
+from ..get_client import cached_client, client_config
 from .headers_util import get_cors_headers
 
 logger = Logger()
@@ -307,11 +308,11 @@ def sns_topic_pub_msg(topic, message, group_id=None):
 def get_client(service_name: str, region: str = None, as_resource: bool = True):
     if not region:
         region = os.environ.get("AWS_REGION", "us-east-1")
-    session = boto3.session.Session()
     if as_resource:
-        return session.resource(service_name, region_name=region)
+        # resources are not thread safe, so they are not shared
+        return boto3.session.Session().resource(service_name, region_name=region, config=client_config())
     else:
-        return session.client(service_name, region_name=region)
+        return cached_client(service_name, region)
 
 
 def dict_keys_to_lower(dictionary: dict) -> dict:
@@ -1,6 +1,7 @@
-import boto3
 from botocore.exceptions import ClientError
 
+from ..get_client import cached_client
+
 
 def get_ssm_parameter(parameter_name: str):
     """Get an SSM parameter value
@@ -12,8 +13,8 @@ def get_ssm_parameter(parameter_name: str):
             The value of the SSM parameter, or None if an error occurred
     """
     try:
-        # Create a SSM client
-        ssm = boto3.client("ssm")
+        # Get the shared SSM client
+        ssm = cached_client("ssm")
 
         # Get the parameter
         response = ssm.get_parameter(
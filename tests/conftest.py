@@ -0,0 +1,30 @@
+"""Make ``ai_ocr`` importable from the source tree.
+
+The inbox container build copies ``src/lib`` into the ``ai_ocr`` package as
+``ai_ocr.lib``, see the ``assemble`` target of ``src/inbox_container/makefile``.
+Tests run against the source tree, so ``src/lib`` is registered as ``ai_ocr.lib``
+before anything imports it.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+LIB_DIR = ROOT / "src" / "lib"
+
+sys.path.insert(0, str(ROOT / "src" / "inbox_container" / "src"))
+# ai_ocr creates its S3 client at import time
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+if "ai_ocr.lib" not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        "ai_ocr.lib", LIB_DIR / "__init__.py", submodule_search_locations=[str(LIB_DIR)]
+    )
+    assert spec and spec.loader
+    lib = importlib.util.module_from_spec(spec)
+    sys.modules["ai_ocr.lib"] = lib
+    spec.loader.exec_module(lib)
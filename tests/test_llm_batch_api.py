@@ -0,0 +1,52 @@
+"""Tests of the provider batch endpoints."""
+
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+from ai_ocr.lib.par_ai_core.llm_batch_api import BEDROCK_MIN_BATCH_RECORDS, BatchRequest, BedrockBatchEndpoint
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+
+    def put_object(self, **kwargs: Any) -> None:
+        self.calls.append("put_object")
+
+    def create_model_invocation_job(self, **kwargs: Any) -> dict[str, Any]:
+        self.calls.append("create_model_invocation_job")
+        return {"jobArn": "arn:aws:bedrock:us-east-1:123456789012:model-invocation-job/abc"}
+
+
+def bedrock_endpoint(client: FakeClient) -> BedrockBatchEndpoint:
+    endpoint = BedrockBatchEndpoint(
+        LlmConfig(provider=LlmProvider.BEDROCK, model_name="anthropic.claude-3-5-sonnet-20240620-v1:0"),
+        s3_client=client,
+        bucket="bucket",
+        prefix="batch",
+        role_arn="arn:aws:iam::123456789012:role/batch",
+    )
+    endpoint.client = client
+    return endpoint
+
+
+def requests(count: int) -> list[BatchRequest]:
+    return [BatchRequest(custom_id=f"p{i}", messages=[("user", "text")], max_tokens=16) for i in range(count)]
+
+
+def test_bedrock_rejects_jobs_under_the_minimum_before_staging() -> None:
+    client = FakeClient()
+    with pytest.raises(ValueError, match="at least 100 records"):
+        bedrock_endpoint(client).submit(requests(BEDROCK_MIN_BATCH_RECORDS - 1), job_name="ocr-1")
+    assert client.calls == []
+
+
+def test_bedrock_submits_jobs_at_the_minimum() -> None:
+    client = FakeClient()
+    job_id = bedrock_endpoint(client).submit(requests(BEDROCK_MIN_BATCH_RECORDS), job_name="ocr-1")
+    assert job_id.endswith("/abc")
+    assert client.calls == ["put_object", "create_model_invocation_job"]
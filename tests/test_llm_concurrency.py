@@ -0,0 +1,91 @@
+"""Tests of the adaptive concurrency limiter."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Iterator
+
+import pytest
+from ai_ocr.lib.par_ai_core.llm_concurrency import AdaptiveConcurrencyLimiter
+
+
+def test_timed_out_async_waiter_does_not_break_release() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+    limiter.acquire()
+
+    async def wait_for_slot() -> None:
+        await asyncio.wait_for(limiter.aacquire(), timeout=0.01)
+
+    # the waiter times out and asyncio.run closes its loop
+    with pytest.raises(TimeoutError):
+        asyncio.run(wait_for_slot())
+
+    limiter.release()
+    limiter.acquire()
+    limiter.release()
+    assert limiter.in_flight == 0
+
+
+def test_release_skips_waiters_of_closed_loops() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+    loop = asyncio.new_event_loop()
+    limiter._async_waiters.append((loop, loop.create_future()))  # pylint: disable=protected-access
+    loop.close()
+    limiter.acquire()
+
+    limiter.release()
+    assert limiter.in_flight == 0
+
+
+def test_async_waiter_gets_released_slot() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+
+    async def run() -> int:
+        await limiter.aacquire()
+        waiter = asyncio.create_task(limiter.aacquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        limiter.release()
+        await asyncio.wait_for(waiter, timeout=1)
+        return limiter.in_flight
+
+    assert asyncio.run(run()) == 1
+
+
+def test_cancelled_requests_release_without_an_outcome() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=2)
+
+    async def cancelled_request() -> None:
+        async with limiter.alimit_slot():
+            await asyncio.sleep(10)
+
+    async def run() -> None:
+        task = asyncio.create_task(cancelled_request())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    with pytest.raises(KeyboardInterrupt), limiter.limit_slot():
+        raise KeyboardInterrupt
+
+    def abandoned_stream() -> Iterator[str]:
+        with limiter.limit_slot():
+            yield "chunk"
+            yield "chunk"
+
+    stream = abandoned_stream()
+    next(stream)
+    stream.close()
+
+    snapshot = limiter.snapshot()
+    assert snapshot["in_flight"] == 0
+    assert (snapshot["successes"], snapshot["errors"], snapshot["throttles"]) == (0, 0, 0)
+
+
+def test_request_errors_are_recorded() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=2)
+    with pytest.raises(ValueError), limiter.limit_slot():
+        raise ValueError("bad response")
+    assert limiter.snapshot()["errors"] == 1
@@ -0,0 +1,93 @@
+"""Tests of the hedge budget and the cancellation of losing requests."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+from ai_ocr.lib.par_ai_core.llm_hedging import HedgePolicy, LatencyTracker, RequestHedger
+
+
+def fast_tracker(samples: int = 10) -> LatencyTracker:
+    tracker = LatencyTracker()
+    for _ in range(samples):
+        tracker.record(0.01)
+    return tracker
+
+
+def test_no_hedge_before_min_samples() -> None:
+    hedger = RequestHedger(HedgePolicy(min_samples=10, min_delay=0))
+    assert hedger.hedge_delay(fast_tracker(9)) is None
+    assert hedger.hedge_delay(fast_tracker(10)) == 0.01
+    assert RequestHedger(HedgePolicy(min_samples=10, min_delay=5)).hedge_delay(fast_tracker()) == 5
+
+
+def test_hedges_stay_within_the_budget() -> None:
+    # the lowest latency as the hedge delay, so the fast hedge answers do not raise it
+    hedger = RequestHedger(HedgePolicy(percentile=0, min_samples=1, min_delay=0, budget_percent=50))
+    tracker = fast_tracker()
+    try:
+        results = [
+            hedger.call(lambda: time.sleep(0.1) or "primary", lambda: "hedge", tracker=tracker) for _ in range(10)
+        ]
+    finally:
+        hedger.close()
+    # a hedge fits the budget on every second request, the others wait for the slow primary
+    assert results == ["primary", "hedge"] * 5
+    snapshot = hedger.snapshot()
+    assert snapshot["requests"] == 10 and snapshot["hedges"] == 5 and snapshot["hedge_wins"] == 5
+    assert snapshot["skipped_over_budget"] == 5
+    assert snapshot["hedge_percent"] == 50.0
+
+
+def test_async_hedge_cancels_the_slow_primary() -> None:
+    hedger = RequestHedger(HedgePolicy(min_samples=1, min_delay=0, budget_percent=100))
+    cancelled: list[str] = []
+
+    async def request(name: str, seconds: float) -> str:
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+        return name
+
+    result = asyncio.run(
+        hedger.acall(lambda: request("primary", 10), lambda: request("hedge", 0), tracker=fast_tracker())
+    )
+    assert result == "hedge"
+    assert cancelled == ["primary"]
+    assert hedger.snapshot()["hedge_wins"] == 1
+
+
+def test_async_primary_win_cancels_the_hedge() -> None:
+    hedger = RequestHedger(HedgePolicy(min_samples=1, min_delay=0, budget_percent=100))
+    cancelled: list[str] = []
+
+    async def request(name: str, seconds: float) -> str:
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+        return name
+
+    result = asyncio.run(
+        hedger.acall(lambda: request("primary", 0.05), lambda: request("hedge", 10), tracker=fast_tracker())
+    )
+    assert result == "primary"
+    assert cancelled == ["hedge"]
+    assert hedger.snapshot()["hedges"] == 1 and hedger.snapshot()["hedge_wins"] == 0
+
+
+def test_async_failed_hedge_falls_back_to_the_primary() -> None:
+    hedger = RequestHedger(HedgePolicy(min_samples=1, min_delay=0, budget_percent=100))
+
+    async def primary() -> str:
+        await asyncio.sleep(0.05)
+        return "primary"
+
+    async def hedge() -> str:
+        raise TimeoutError("read timed out")
+
+    assert asyncio.run(hedger.acall(primary, hedge, tracker=fast_tracker())) == "primary"
@@ -0,0 +1,140 @@
+"""Tests of the provider pool circuit breaker and failover."""
+
+from __future__ import annotations
+
+import types
+
+import pytest
+from ai_ocr.lib.par_ai_core import llm_provider_pool
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig
+from ai_ocr.lib.par_ai_core.llm_provider_pool import (
+    CircuitState,
+    EndpointHealth,
+    NoHealthyEndpointError,
+    PoolMember,
+    ProviderPool,
+)
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    fake_clock = FakeClock()
+    monkeypatch.setattr(llm_provider_pool, "time", types.SimpleNamespace(monotonic=fake_clock))
+    return fake_clock
+
+
+def member(model_name: str, health: EndpointHealth) -> PoolMember:
+    return PoolMember(LlmConfig(provider=LlmProvider.OPENAI, model_name=model_name), health=health)
+
+
+def test_circuit_opens_after_consecutive_failures(clock: FakeClock) -> None:
+    health = EndpointHealth(failure_threshold=3, reset_timeout=30)
+    health.record_failure()
+    health.record_failure()
+    health.record_success(1.0)
+    # a success resets the count, only consecutive failures open the circuit
+    health.record_failure()
+    health.record_failure()
+    assert health.state == CircuitState.CLOSED and health.try_acquire()
+    health.record_failure()
+    assert health.state == CircuitState.OPEN
+    assert health.opened_at == clock.now
+    assert not health.try_acquire()
+    assert health.snapshot()["opens"] == 1
+
+
+def test_half_open_lets_a_single_probe_through(clock: FakeClock) -> None:
+    health = EndpointHealth(failure_threshold=1, reset_timeout=30)
+    health.record_failure()
+    clock.now += 29
+    assert health.state == CircuitState.OPEN and not health.try_acquire()
+    clock.now += 1
+    assert health.state == CircuitState.HALF_OPEN
+    assert health.try_acquire()
+    # the probe is in flight, no other request gets through
+    assert not health.try_acquire()
+    health.record_success(1.0)
+    assert health.state == CircuitState.CLOSED
+    assert health.try_acquire() and health.try_acquire()
+
+
+def test_failed_probe_reopens_for_another_timeout(clock: FakeClock) -> None:
+    health = EndpointHealth(failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        health.record_failure()
+    clock.now += 30
+    assert health.try_acquire()
+    # a single failed probe reopens the circuit, no matter the threshold
+    health.record_failure()
+    assert health.state == CircuitState.OPEN
+    assert health.opened_at == clock.now
+    assert health.snapshot()["opens"] == 2
+    clock.now += 29
+    assert not health.try_acquire()
+    clock.now += 1
+    assert health.try_acquire()
+
+
+def test_released_probe_frees_the_probe_slot(clock: FakeClock) -> None:
+    health = EndpointHealth(failure_threshold=1, reset_timeout=30)
+    health.record_failure()
+    clock.now += 30
+    assert health.try_acquire()
+    # a bad request or cancellation says nothing about the endpoint, it stays half open
+    health.release()
+    assert health.state == CircuitState.HALF_OPEN
+    assert health.try_acquire()
+
+
+def test_call_fails_over_and_skips_open_circuits(clock: FakeClock) -> None:
+    primary = member("primary", EndpointHealth(failure_threshold=1, reset_timeout=30))
+    secondary = member("secondary", EndpointHealth(failure_threshold=1, reset_timeout=30))
+    pool = ProviderPool([primary, secondary])
+    called: list[str] = []
+
+    def fn(pool_member: PoolMember) -> str:
+        called.append(pool_member.llm_config.model_name)
+        if pool_member is primary:
+            raise TimeoutError("read timed out")
+        return "ok"
+
+    assert pool.call(fn) == "ok"
+    assert called == ["primary", "secondary"]
+    assert primary.health.state == CircuitState.OPEN
+    # the primary circuit is open, requests go straight to the secondary
+    assert pool.call(fn) == "ok"
+    assert called == ["primary", "secondary", "secondary"]
+    # past the reset timeout the primary is tried again, after the endpoints with a closed circuit
+    clock.now += 30
+    assert pool.candidates() == [secondary, primary]
+
+
+def test_non_retryable_error_is_raised_without_failover(clock: FakeClock) -> None:
+    primary = member("primary", EndpointHealth(failure_threshold=1))
+    secondary = member("secondary", EndpointHealth(failure_threshold=1))
+    called: list[str] = []
+
+    def fn(pool_member: PoolMember) -> str:
+        called.append(pool_member.llm_config.model_name)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        ProviderPool([primary, secondary]).call(fn)
+    assert called == ["primary"]
+    assert primary.health.state == CircuitState.CLOSED
+
+
+def test_every_circuit_open_raises_no_healthy_endpoint(clock: FakeClock) -> None:
+    health = EndpointHealth(failure_threshold=1, reset_timeout=30)
+    health.record_failure()
+    with pytest.raises(NoHealthyEndpointError):
+        ProviderPool([member("primary", health)]).call(lambda pool_member: "ok")
@@ -0,0 +1,50 @@
+"""Tests of the provider quota token bucket."""
+
+from __future__ import annotations
+
+import os
+
+import pytest
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider
+from ai_ocr.lib.par_ai_core.llm_rate_limiter import TokenBucket, get_quota_from_env
+
+
+def test_burst_up_to_capacity_is_not_delayed() -> None:
+    bucket = TokenBucket(capacity=10, refill_rate=1)
+    now = bucket._updated  # pylint: disable=protected-access
+    assert [bucket.reserve(1, now) for _ in range(10)] == [0.0] * 10
+
+
+def test_overdraft_reports_wait_until_refilled() -> None:
+    bucket = TokenBucket(capacity=10, refill_rate=2)
+    now = bucket._updated  # pylint: disable=protected-access
+    assert bucket.reserve(10, now) == 0.0
+    assert bucket.reserve(4, now) == pytest.approx(2.0)
+    # the overdraft carries over, a later caller waits for it to be paid back too
+    assert bucket.reserve(2, now) == pytest.approx(3.0)
+
+
+def test_refill_is_capped_at_capacity() -> None:
+    bucket = TokenBucket(capacity=10, refill_rate=1)
+    now = bucket._updated  # pylint: disable=protected-access
+    assert bucket.reserve(10, now) == 0.0
+    assert bucket.reserve(10, now + 1000) == 0.0
+    assert bucket.reserve(1, now + 1000) == pytest.approx(1.0)
+
+
+def test_request_larger_than_capacity_only_takes_capacity() -> None:
+    bucket = TokenBucket(capacity=10, refill_rate=1)
+    now = bucket._updated  # pylint: disable=protected-access
+    assert bucket.reserve(50, now) == 0.0
+    assert bucket.reserve(1, now) == pytest.approx(1.0)
+
+
+def test_set_env_quotas_are_read_by_the_limiter(monkeypatch: pytest.MonkeyPatch) -> None:
+    # set_env writes every setting of the config, keep them out of the other tests
+    monkeypatch.setattr(os, "environ", {})
+    LlmConfig(
+        provider=LlmProvider.BEDROCK, model_name="model", requests_per_minute=50, tokens_per_minute=20000
+    ).set_env()
+    assert get_quota_from_env(LlmProvider.BEDROCK, "REQUESTS_PER_MINUTE") == 50
+    assert get_quota_from_env(LlmProvider.BEDROCK, "TOKENS_PER_MINUTE") == 20000
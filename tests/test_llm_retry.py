@@ -0,0 +1,89 @@
+"""Tests of retrying LLM requests."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+from ai_ocr.lib.par_ai_core import llm_retry
+from ai_ocr.lib.par_ai_core.llm_errors import LlmErrorKind
+from ai_ocr.lib.par_ai_core.llm_retry import DeadlineExceededError, RetryPolicy, acall_with_retry, call_with_retry
+
+NO_DELAY = RetryPolicy(max_attempts=3, base_delay=0, throttle_base_delay=0)
+
+
+class FlakyCall:
+    """Raises the given errors in turn, then returns ok."""
+
+    def __init__(self, *errors: Exception) -> None:
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self) -> str:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_transient_errors_are_retried() -> None:
+    retries: list[tuple[LlmErrorKind, int]] = []
+    call = FlakyCall(TimeoutError(), ConnectionError())
+    result = call_with_retry(
+        call, policy=NO_DELAY, on_retry=lambda kind, attempt, delay, error: retries.append((kind, attempt))
+    )
+    assert result == "ok"
+    assert call.calls == 3
+    assert retries == [(LlmErrorKind.TIMEOUT, 1), (LlmErrorKind.TIMEOUT, 2)]
+
+
+def test_non_retryable_error_is_raised_at_once() -> None:
+    call = FlakyCall(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        call_with_retry(call, policy=NO_DELAY)
+    assert call.calls == 1
+
+
+def test_last_attempt_error_is_raised() -> None:
+    call = FlakyCall(TimeoutError(), TimeoutError(), TimeoutError("third"))
+    with pytest.raises(TimeoutError, match="third"):
+        call_with_retry(call, policy=NO_DELAY)
+    assert call.calls == 3
+
+
+def test_expired_deadline_sends_no_request() -> None:
+    call = FlakyCall()
+    with pytest.raises(DeadlineExceededError):
+        call_with_retry(call, policy=NO_DELAY, deadline=time.monotonic() - 1)
+    assert call.calls == 0
+
+
+def test_no_retry_whose_backoff_ends_past_the_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(llm_retry.random, "uniform", lambda low, high: high)
+    call = FlakyCall(TimeoutError("first"))
+    with pytest.raises(TimeoutError, match="first"):
+        call_with_retry(call, policy=RetryPolicy(base_delay=10), deadline=time.monotonic() + 5)
+    assert call.calls == 1
+
+
+def test_backoff_is_capped_and_throttling_starts_longer(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(llm_retry.random, "uniform", lambda low, high: high)
+    policy = RetryPolicy(base_delay=1, throttle_base_delay=2, max_delay=5)
+    assert policy.backoff(LlmErrorKind.TIMEOUT, 1) == 1
+    assert policy.backoff(LlmErrorKind.THROTTLING, 1) == 2
+    assert policy.backoff(LlmErrorKind.TIMEOUT, 10) == 5
+
+
+def test_async_attempt_is_cancelled_at_the_deadline() -> None:
+    async def slow() -> str:
+        await asyncio.sleep(5)
+        return "late"
+
+    async def run() -> str:
+        return await acall_with_retry(slow, policy=NO_DELAY, deadline=time.monotonic() + 0.05)
+
+    start_time = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(run())
+    assert time.monotonic() - start_time < 1
@@ -0,0 +1,127 @@
+"""Tests of the page request steps and their thread and asyncio drivers."""
+
+from __future__ import annotations
+
+import asyncio
+import io
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import pytest
+from ai_ocr import ocr_engine
+from ai_ocr.lib.par_ai_core.llm_config import LlmConfig
+from ai_ocr.lib.par_ai_core.llm_providers import LlmProvider, provider_light_models
+from ai_ocr.ocr_config import OcrConfig, TextLayerMode
+from ai_ocr.ocr_engine import OcrModelClient, PageOcrEngine, RequestSteps
+from ai_ocr.run_summary import OcrRunSummary
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+from PIL import Image, ImageDraw
+
+HEAVY_MODEL = "gpt-4o"
+LIGHT_MODEL = provider_light_models[LlmProvider.OPENAI]
+
+
+def make_engine(
+    monkeypatch: pytest.MonkeyPatch, ocr_config: OcrConfig, responses: dict[str, list[str]]
+) -> PageOcrEngine:
+    """Build an engine whose models answer with the given responses per model name."""
+
+    def build_client(llm_config: LlmConfig, _ocr_config: OcrConfig, *, concurrency: int) -> OcrModelClient:
+        model = FakeMessagesListChatModel(
+            responses=[
+                AIMessage(content=content, usage_metadata={"input_tokens": 10, "output_tokens": 5, "total_tokens": 15})
+                for content in responses.get(llm_config.model_name, [])
+            ]
+        )
+        return OcrModelClient(llm_config=llm_config, model=model, runnable_config={})
+
+    monkeypatch.setattr(ocr_engine, "build_ocr_model_client", build_client)
+    return PageOcrEngine(
+        s3_client=None,
+        llm_config=LlmConfig(provider=LlmProvider.OPENAI, model_name=HEAVY_MODEL),
+        ocr_config=ocr_config,
+        system_prompt_text="You are an OCR engine.",
+        src_file=Path("doc.pdf"),
+        page_count=1,
+        output_bucket="bucket",
+        output_key="outbox/r1",
+        summary=OcrRunSummary(),
+        text_format_prompt_text="Format this text.",
+    )
+
+
+def run_threaded(engine: PageOcrEngine, steps: RequestSteps[Any]) -> Any:
+    return engine.run(steps)
+
+
+def run_async(engine: PageOcrEngine, steps: RequestSteps[Any]) -> Any:
+    return asyncio.run(engine.arun(steps))
+
+
+drivers = pytest.mark.parametrize("drive", [run_threaded, run_async], ids=["thread", "async"])
+
+
+def page_image() -> bytes:
+    img = Image.new("RGB", (200, 260), "white")
+    draw = ImageDraw.Draw(img)
+    for y in range(20, 240, 20):
+        draw.text((10, y), "lorem ipsum dolor sit amet", fill="black")
+    data = io.BytesIO()
+    img.save(data, format="JPEG")
+    return data.getvalue()
+
+
+@drivers
+def test_direct_text_layer_sends_no_request(
+    monkeypatch: pytest.MonkeyPatch, drive: Callable[[PageOcrEngine, RequestSteps[Any]], Any]
+) -> None:
+    engine = make_engine(monkeypatch, OcrConfig(text_layer=TextLayerMode.DIRECT), {})
+    assert drive(engine, engine.text_steps(1, "embedded text")) == "embedded text"
+    assert engine.summary.page_usage == {}
+
+
+@drivers
+def test_formatted_text_layer(
+    monkeypatch: pytest.MonkeyPatch, drive: Callable[[PageOcrEngine, RequestSteps[Any]], Any]
+) -> None:
+    engine = make_engine(monkeypatch, OcrConfig(text_layer=TextLayerMode.FORMAT), {HEAVY_MODEL: ["# Formatted"]})
+    assert drive(engine, engine.text_steps(1, "embedded text")) == "# Formatted"
+    assert engine.summary.page_usage == {1: {"input_tokens": 10, "output_tokens": 5}}
+
+
+@drivers
+def test_light_model_output_passing_the_quality_gate_is_kept(
+    monkeypatch: pytest.MonkeyPatch, drive: Callable[[PageOcrEngine, RequestSteps[Any]], Any]
+) -> None:
+    text = "\n".join(f"lorem ipsum dolor sit amet line {i}" for i in range(40))
+    engine = make_engine(monkeypatch, OcrConfig(cascade=True, cascade_min_chars_per_ink=0), {LIGHT_MODEL: [text]})
+    assert drive(engine, engine.page_steps(page_image(), "jpeg", 1)) == text
+    assert engine.summary.cascade_pages == [1]
+    assert engine.summary.escalated_pages == {}
+
+
+@drivers
+def test_light_model_refusal_is_escalated_to_the_heavy_model(
+    monkeypatch: pytest.MonkeyPatch, drive: Callable[[PageOcrEngine, RequestSteps[Any]], Any]
+) -> None:
+    engine = make_engine(
+        monkeypatch,
+        OcrConfig(cascade=True, cascade_min_chars_per_ink=0),
+        {LIGHT_MODEL: ["I'm sorry, I can't help with that."], HEAVY_MODEL: ["# Page one"]},
+    )
+    assert drive(engine, engine.page_steps(page_image(), "jpeg", 1)) == "# Page one"
+    assert list(engine.summary.escalated_pages) == [1]
+    # both requests count towards the page
+    assert engine.summary.page_usage == {1: {"input_tokens": 20, "output_tokens": 10}}
+
+
+@drivers
+def test_request_errors_propagate(
+    monkeypatch: pytest.MonkeyPatch, drive: Callable[[PageOcrEngine, RequestSteps[Any]], Any]
+) -> None:
+    # a model without responses left fails every request
+    engine = make_engine(monkeypatch, OcrConfig(text_layer=TextLayerMode.FORMAT, max_attempts=1), {})
+    with pytest.raises(IndexError):
+        drive(engine, engine.text_steps(1, "embedded text"))
@@ -0,0 +1,62 @@
+"""Tests of the cascade quality gate."""
+
+from __future__ import annotations
+
+from ai_ocr.ocr_quality import QualityIssue, check_ocr_quality, garbage_ratio, has_broken_table, has_repetition
+
+BODY = "\n".join(f"Line {num} of the transcribed page with enough text to pass." for num in range(40))
+
+
+def check(content: str, ink_ratio: float = 0.01) -> list[QualityIssue]:
+    return check_ocr_quality(content, ink_ratio, min_chars_per_ink=100, max_garbage_ratio=0.3)
+
+
+def test_good_output_passes() -> None:
+    assert check(BODY) == []
+
+
+def test_fenced_output_is_checked_without_fences() -> None:
+    assert check(f"```markdown\n{BODY}\n```") == []
+
+
+def test_short_output_for_inky_page() -> None:
+    assert check("Title only", ink_ratio=0.02) == [QualityIssue.TOO_SHORT]
+
+
+def test_refusal_prefix() -> None:
+    assert QualityIssue.REFUSAL in check("I'm sorry, but I can't help with transcribing this image. " + BODY)
+    assert QualityIssue.REFUSAL in check("**Sorry, the image is unreadable.** " + BODY)
+    assert QualityIssue.REFUSAL not in check("Sorry Street 12\n" + BODY)
+
+
+def test_garbage_output() -> None:
+    assert garbage_ratio("abc def") == 0.0
+    assert garbage_ratio("") == 0.0
+    assert garbage_ratio("a, b; “c” — d.") == 0.0
+    assert QualityIssue.GARBAGE in check("▒░█■□◆" * 200)
+
+
+def test_repeated_lines() -> None:
+    assert has_repetition(["the same line again"] * 6)
+    assert not has_repetition(["the same line again"] * 6 + [f"other line {num}" for num in range(10)])
+    assert not has_repetition(["short"] * 10)
+
+
+def test_table_with_separator_passes() -> None:
+    assert not has_broken_table(["| a | b |", "| --- | :-: |", "| 1 | 2 |", "| 3 | 4 |"])
+
+
+def test_table_without_separator_fails() -> None:
+    assert has_broken_table(["| a | b |", "| 1 | 2 |", "| 3 | 4 |"])
+
+
+def test_table_with_differing_column_counts_fails() -> None:
+    assert has_broken_table(["| a | b |", "|---|---|", "| 1 | 2 | 3 |"])
+
+
+def test_table_at_end_of_output_is_checked() -> None:
+    assert QualityIssue.TABLE_STRUCTURE in check(BODY + "\n| a | b |\n| 1 | 2 |")
+
+
+def test_single_pipe_line_is_not_a_table() -> None:
+    assert not has_broken_table(["| not a table", "text"])
@@ -0,0 +1,48 @@
+"""Tests of splitting multi page responses."""
+
+from __future__ import annotations
+
+from ai_ocr.page_batches import is_truncated, split_batch_response
+from langchain_core.messages import AIMessage
+
+
+def test_split_response_by_page_markers() -> None:
+    content = "<<<PAGE 3>>>\n# Page three\ntext\n<<<PAGE 4>>>\nPage four\n"
+    assert split_batch_response(content, [3, 4]) == {3: "# Page three\ntext", 4: "Page four"}
+
+
+def test_missing_page_marker() -> None:
+    content = "<<<PAGE 3>>>\nPage three\n"
+    assert split_batch_response(content, [3, 4]) == {3: "Page three"}
+
+
+def test_response_without_markers() -> None:
+    assert split_batch_response("Page three\nPage four", [3, 4]) == {}
+
+
+def test_text_before_the_first_marker_is_ignored() -> None:
+    content = "Here are the pages:\n<<<PAGE 1>>>\nPage one"
+    assert split_batch_response(content, [1]) == {1: "Page one"}
+
+
+def test_unexpected_and_empty_sections_are_ignored() -> None:
+    content = "<<<PAGE 1>>>\n\n<<<PAGE 9>>>\nPage nine\n<<<PAGE 2>>>\nPage two"
+    assert split_batch_response(content, [1, 2]) == {2: "Page two"}
+
+
+def test_repeated_page_marker_is_ambiguous() -> None:
+    content = "<<<PAGE 1>>>\nPage one\n<<<PAGE 1>>>\nPage one again"
+    assert split_batch_response(content, [1]) == {}
+
+
+def test_marker_must_be_on_its_own_line() -> None:
+    content = "<<<PAGE 1>>>\nsee <<<PAGE 2>>> inline"
+    assert split_batch_response(content, [1, 2]) == {1: "see <<<PAGE 2>>> inline"}
+
+
+def test_is_truncated() -> None:
+    assert is_truncated(AIMessage(content="", response_metadata={"stop_reason": "max_tokens"}))
+    assert is_truncated(AIMessage(content="", response_metadata={"finish_reason": "length"}))
+    assert is_truncated(AIMessage(content="", response_metadata={"stopReason": "max_tokens"}))
+    assert not is_truncated(AIMessage(content="", response_metadata={"stop_reason": "end_turn"}))
+    assert not is_truncated(AIMessage(content=""))
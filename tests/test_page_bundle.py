@@ -0,0 +1,71 @@
+"""Tests of the bundle manifest byte ranges."""
+
+from __future__ import annotations
+
+import gzip
+from pathlib import Path
+from typing import Any
+
+from ai_ocr.page_bundle import BUNDLE_VERSION, BundleRecordKind, PageBundleWriter
+
+
+def read_record(bundle: bytes, record: dict[str, Any]) -> bytes:
+    # the same slice as the ranged GET a reader sends
+    data = bundle[record["offset"] : record["offset"] + record["length"]]
+    return gzip.decompress(data) if record.get("encoding") == "gzip" else data
+
+
+def test_manifest_ranges_address_every_record(tmp_path: Path) -> None:
+    writer = PageBundleWriter(tmp_path / "doc.bundle")
+    # records arrive out of page order as pages finish
+    writer.add(2, BundleRecordKind.IMAGE, b"\xff\xd8jpeg page 2", content_type="image/jpeg")
+    writer.add(1, BundleRecordKind.IMAGE, b"\xff\xd8jpeg page 1", content_type="image/jpeg")
+    writer.add(2, BundleRecordKind.MARKDOWN, b"# Page two\n", content_type="text/markdown", compress=True)
+    writer.add(1, BundleRecordKind.MARKDOWN, b"# Page one\n", content_type="text/markdown", compress=True)
+    writer.close()
+    bundle = (tmp_path / "doc.bundle").read_bytes()
+    manifest = writer.manifest(
+        bundle_key="outbox/r1/doc.bundle", pages={1: {"status": "ok"}, 2: {"status": "ok"}}, source="inbox/doc.pdf"
+    )
+
+    assert manifest["version"] == BUNDLE_VERSION
+    assert manifest["bundle"] == "outbox/r1/doc.bundle" and manifest["source"] == "inbox/doc.pdf"
+    assert manifest["bundle_bytes"] == len(bundle) == writer.size
+    assert [page["page"] for page in manifest["pages"]] == [1, 2]
+    for page_num, page in enumerate(manifest["pages"], start=1):
+        assert page["status"] == "ok"
+        assert read_record(bundle, page["image"]) == f"\xff\xd8jpeg page {page_num}".encode("latin-1")
+        assert "encoding" not in page["image"]
+        assert page["markdown"]["encoding"] == "gzip" and page["markdown"]["content_type"] == "text/markdown"
+    assert read_record(bundle, manifest["pages"][0]["markdown"]) == b"# Page one\n"
+    assert read_record(bundle, manifest["pages"][1]["markdown"]) == b"# Page two\n"
+    # the records tile the bundle without gaps or overlap
+    ranges = sorted(
+        (record["offset"], record["length"])
+        for page in manifest["pages"]
+        for record in (page["image"], page["markdown"])
+    )
+    assert [offset for offset, _ in ranges] == [0] + [offset + length for offset, length in ranges[:-1]]
+    assert sum(length for _, length in ranges) == len(bundle)
+
+
+def test_replaced_record_points_at_the_latest_bytes(tmp_path: Path) -> None:
+    writer = PageBundleWriter(tmp_path / "doc.bundle")
+    writer.add(1, BundleRecordKind.MARKDOWN, b"first attempt", content_type="text/markdown", compress=True)
+    record = writer.add(1, BundleRecordKind.MARKDOWN, b"retried page", content_type="text/markdown", compress=True)
+    writer.close()
+    bundle = (tmp_path / "doc.bundle").read_bytes()
+    manifest = writer.manifest(bundle_key="doc.bundle", pages={})
+    assert manifest["pages"][0]["markdown"]["offset"] == record.offset > 0
+    assert read_record(bundle, manifest["pages"][0]["markdown"]) == b"retried page"
+
+
+def test_pages_without_records_are_listed(tmp_path: Path) -> None:
+    writer = PageBundleWriter(tmp_path / "doc.bundle")
+    writer.add(1, BundleRecordKind.IMAGE, b"jpeg", content_type="image/jpeg")
+    writer.close()
+    manifest = writer.manifest(bundle_key="doc.bundle", pages={2: {"status": "failed"}})
+    assert manifest["pages"] == [
+        {"page": 1, "image": {"offset": 0, "length": 4, "content_type": "image/jpeg"}},
+        {"page": 2, "status": "failed"},
+    ]
@@ -0,0 +1,48 @@
+"""Tests of the page range render window."""
+
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+from ai_ocr import __main__ as ocr_main
+from ai_ocr.page_image import PageImage, PageImageStore
+
+
+@pytest.mark.parametrize("render_workers", [2, 3])
+def test_renders_stay_within_the_worker_window(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path, render_workers: int
+) -> None:
+    lock = threading.Lock()
+    submitted: list[int] = []
+
+    def render_page_range(*, first_page: int, last_page: int, **kwargs: Any) -> list[PageImage]:
+        with lock:
+            submitted.append(first_page)
+        return [
+            PageImage(name="doc", suffix=ocr_main.page_suffix(page_num), data=b"jpeg")
+            for page_num in range(first_page, last_page + 1)
+        ]
+
+    monkeypatch.setattr(ocr_main, "render_page_range", render_page_range)
+    images = ocr_main.convert_pdf_to_images(
+        src_file=Path("doc.pdf"),
+        pdf_path=tmp_path / "doc.pdf",
+        image_store=PageImageStore(spill_dir=tmp_path, max_memory_bytes=1024),
+        page_count=40,
+        render_workers=render_workers,
+        chunk_size=2,
+    )
+    page_nums = []
+    for range_index, image in enumerate(images, start=1):
+        page_nums.append(ocr_main.page_num_from_suffix(image.suffix))
+        if range_index % 2:
+            # a slow consumer, the renders must not run further ahead of it than the worker count
+            time.sleep(0.005)
+            with lock:
+                assert len(submitted) - (range_index + 1) // 2 <= render_workers
+    assert page_nums == list(range(1, 41))
+    assert submitted == list(range(1, 41, 2))
@@ -0,0 +1,57 @@
+"""Tests of the incremental cleaning of streamed page responses."""
+
+from __future__ import annotations
+
+import itertools
+
+import pytest
+from ai_ocr.ocr_engine import clean_ocr_content
+from ai_ocr.page_stream import MarkdownStreamCleaner
+
+RESPONSES = [
+    "# Title\n\nSome text.",
+    "```markdown\n# Title\n\n| a | b |\n|---|---|\n| 1 | 2 |\n```",
+    "  \n\n```markdown\nText with ``` inline and a trailing fence```\n\n  \n",
+    "line one\n   \nline two  \n\t\n",
+    "```\ncode fence only\n```\n```markdown\nsecond block\n```",
+    " \n ",
+    "",
+]
+
+
+def clean_chunks(chunks: list[str], page_num: int = 7) -> str:
+    cleaner = MarkdownStreamCleaner(page_num)
+    return "".join(cleaner.feed(chunk) for chunk in chunks) + cleaner.finish()
+
+
+def splits(text: str, cuts: int) -> list[list[str]]:
+    """Every way of cutting text into cuts + 1 chunks, empty chunks included."""
+    return [
+        [text[start:end] for start, end in zip((0, *points), (*points, len(text)), strict=True)]
+        for points in itertools.combinations_with_replacement(range(len(text) + 1), cuts)
+    ]
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+def test_single_chunk_matches_clean_ocr_content(response: str) -> None:
+    assert clean_chunks([response]) == clean_ocr_content(response, 7)
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+def test_every_three_chunk_split_matches_clean_ocr_content(response: str) -> None:
+    expected = clean_ocr_content(response, 7)
+    for chunks in splits(response, 2):
+        assert clean_chunks(chunks) == expected, chunks
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+def test_character_chunks_match_clean_ocr_content(response: str) -> None:
+    assert clean_chunks(list(response)) == clean_ocr_content(response, 7)
+
+
+def test_text_before_the_last_line_break_is_emitted_early() -> None:
+    cleaner = MarkdownStreamCleaner(1)
+    assert cleaner.feed("```markdown\nfirst line\nsecond") == "\nfirst line\n"
+    # the fence could continue on the incomplete line, it is held back
+    assert cleaner.feed(" line```") == ""
+    assert cleaner.finish() == "second line\n\nPage # 1\n"
@@ -0,0 +1,35 @@
+"""Tests of stitching tile markdown."""
+
+from __future__ import annotations
+
+from ai_ocr.page_tiles import stitch_tile_markdown
+
+
+def test_tiles_are_joined_in_reading_order() -> None:
+    tiles = [(1, 0, "bottom left"), (0, 1, "top right"), (0, 0, "top left")]
+    assert stitch_tile_markdown(tiles) == "top left\n\ntop right\n\nbottom left"
+
+
+def test_overlap_with_left_neighbour_is_dropped() -> None:
+    tiles = [(0, 0, "Intro\nShared overlap line"), (0, 1, "Shared overlap line\nRight side text")]
+    assert stitch_tile_markdown(tiles) == "Intro\nShared overlap line\n\nRight side text"
+
+
+def test_overlap_with_tile_above_is_dropped_ignoring_markdown_markers() -> None:
+    tiles = [(0, 0, "Paragraph cut at the bottom"), (1, 0, "## Paragraph cut at the bottom\nNext paragraph")]
+    assert stitch_tile_markdown(tiles) == "Paragraph cut at the bottom\n\nNext paragraph"
+
+
+def test_lines_of_tiles_that_do_not_touch_are_kept() -> None:
+    tiles = [(0, 0, "Repeated footer text"), (0, 2, "Repeated footer text")]
+    assert stitch_tile_markdown(tiles) == "Repeated footer text\n\nRepeated footer text"
+
+
+def test_short_lines_are_kept() -> None:
+    tiles = [(0, 0, "|---|\nTotal"), (0, 1, "|---|\nTotal")]
+    assert stitch_tile_markdown(tiles) == "|---|\nTotal\n\n|---|\nTotal"
+
+
+def test_fences_and_empty_tiles_are_dropped() -> None:
+    tiles = [(0, 0, "```markdown\nLeft tile text\n```"), (0, 1, "  ")]
+    assert stitch_tile_markdown(tiles) == "Left tile text"
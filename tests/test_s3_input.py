@@ -0,0 +1,193 @@
+"""Tests of the progressive source download and the streaming first page path."""
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from ai_ocr import __main__ as ocr_main
+from ai_ocr.ocr_config import OcrConfig, TextLayerMode
+from ai_ocr.page_image import PageImageStore
+from ai_ocr.run_summary import OcrRunSummary
+from ai_ocr.s3_input import DiskUsageTracker, Linearization, ProgressiveDownload, parse_linearization
+from PIL import Image
+
+LINEARIZED_HEAD = (
+    b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n15 0 obj\n<</Linearized 1/L 71862/O 17/E 65733/N 3/T 71544/H [ 503 173]>>\nendobj\n"
+)
+
+
+class FakeBody:
+    def __init__(self, data: bytes, gate: threading.Event | None) -> None:
+        self.data = data
+        self.gate = gate
+
+    def iter_chunks(self, chunk_size: int) -> Iterator[bytes]:
+        if self.gate:
+            assert self.gate.wait(5)
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start : start + chunk_size]
+
+
+class FakeS3:
+    """Serves ranged GETs of one object, parts starting at an offset in gates wait for their event."""
+
+    def __init__(self, data: bytes, gates: dict[int, threading.Event] | None = None, fail_at: int | None = None):
+        self.data = data
+        self.gates = gates or {}
+        self.fail_at = fail_at
+        self.ranges: list[tuple[int, int]] = []
+
+    def head_object(self, Bucket: str, Key: str) -> dict[str, Any]:
+        return {"ContentLength": len(self.data), "ETag": '"etag"'}
+
+    def get_object(self, Bucket: str, Key: str, Range: str, IfMatch: str) -> dict[str, Any]:
+        assert IfMatch == '"etag"'
+        start, end = (int(x) for x in Range.removeprefix("bytes=").split("-"))
+        self.ranges.append((start, end))
+        if start == self.fail_at:
+            raise ConnectionError("connection reset")
+        return {"Body": FakeBody(self.data[start : end + 1], self.gates.get(start))}
+
+
+def start_download(client: FakeS3, path: Path, part_size: int = 10) -> ProgressiveDownload:
+    download = ProgressiveDownload(client, "bucket", "key", path, part_size=part_size, max_concurrency=4)
+    download.start()
+    return download
+
+
+def test_parse_linearization() -> None:
+    assert parse_linearization(LINEARIZED_HEAD) == Linearization(length=71862, first_page_end=65733, page_count=3)
+    assert parse_linearization(LINEARIZED_HEAD.replace(b"/E 65733", b"/E 65733/P 2")).first_page == 3  # type: ignore
+
+
+@pytest.mark.parametrize(
+    "head",
+    [
+        b"%PDF-1.7\n1 0 obj\n<</Type /Catalog /Pages 2 0 R>>\nendobj\n",
+        LINEARIZED_HEAD.replace(b"/E 65733", b""),
+        b"\x89PNG\r\n" + LINEARIZED_HEAD,
+        LINEARIZED_HEAD[:40],
+    ],
+    ids=["not-linearized", "missing-entry", "not-a-pdf", "truncated"],
+)
+def test_parse_linearization_rejects(head: bytes) -> None:
+    assert parse_linearization(head) is None
+
+
+def test_download_writes_every_part(tmp_path: Path) -> None:
+    data = bytes(range(256)) * 3
+    client = FakeS3(data)
+    download = start_download(client, tmp_path / "doc.pdf", part_size=100)
+    result = download.wait()
+    assert (tmp_path / "doc.pdf").read_bytes() == data
+    assert result.bytes == len(data) and result.parts == 8
+    assert sorted(client.ranges) == [(start, min(start + 99, len(data) - 1)) for start in range(0, len(data), 100)]
+
+
+def test_prefix_is_readable_before_later_parts_arrive(tmp_path: Path) -> None:
+    data = b"%PDF-1.7 " + b"x" * 41
+    gate = threading.Event()
+    download = start_download(FakeS3(data, gates={30: gate}), tmp_path / "doc.pdf")
+    download.wait_for(30)
+    assert download.read_head(20) == data[:20]
+    assert download.filled_bytes == 30
+    gate.set()
+    download.wait()
+    assert download.filled_bytes == len(data)
+
+
+def test_prefix_waits_for_an_earlier_part(tmp_path: Path) -> None:
+    gate = threading.Event()
+    download = start_download(FakeS3(b"y" * 40, gates={0: gate}), tmp_path / "doc.pdf")
+    # the later parts complete first, the prefix only grows once part 0 is in
+    assert download.filled_bytes == 0
+    gate.set()
+    download.wait_for(40)
+    assert download.filled_bytes == 40
+    download.close()
+
+
+def test_part_error_is_raised_to_waiters(tmp_path: Path) -> None:
+    download = start_download(FakeS3(b"z" * 40, fail_at=20), tmp_path / "doc.pdf")
+    with pytest.raises(ConnectionError):
+        download.wait()
+
+
+def test_close_wakes_waiters(tmp_path: Path) -> None:
+    gate = threading.Event()
+    download = start_download(FakeS3(b"z" * 40, gates={0: gate}), tmp_path / "doc.pdf")
+    threading.Timer(0.05, download.close).start()
+    threading.Timer(0.1, gate.set).start()
+    with pytest.raises(RuntimeError):
+        download.wait_for(40)
+
+
+def linearized_pdf(page_count: int, first_page_end: int, size: int) -> bytes:
+    head = b"%%PDF-1.7\n4 0 obj\n<</Linearized 1/L %d/E %d/N %d/O 6/T 900/H [ 60 20]>>\nendobj\n" % (
+        size,
+        first_page_end,
+        page_count,
+    )
+    return head + b"\0" * (size - len(head))
+
+
+@pytest.mark.parametrize(
+    ("ocr_config", "data", "streamable"),
+    [
+        (OcrConfig(), linearized_pdf(3, 100, 300), True),
+        (OcrConfig(text_layer=TextLayerMode.DIRECT), linearized_pdf(3, 100, 300), False),
+        (OcrConfig(tile_pages=True), linearized_pdf(3, 100, 300), False),
+        # updated after it was linearized
+        (OcrConfig(), linearized_pdf(3, 100, 300) + b"%%EOF\n", False),
+        (OcrConfig(), b"%PDF-1.7\n1 0 obj\n<</Type /Catalog>>\nendobj\n" + b"\0" * 200, False),
+    ],
+    ids=["linearized", "text-layer", "tiling", "updated", "not-linearized"],
+)
+def test_streamable_linearization(tmp_path: Path, ocr_config: OcrConfig, data: bytes, streamable: bool) -> None:
+    download = start_download(FakeS3(data), tmp_path / "doc.pdf", part_size=64)
+    assert (ocr_main.streamable_linearization(download, ocr_config) is not None) == streamable
+    download.wait()
+
+
+def fake_render(rendered: list[tuple[int, int]], download: ProgressiveDownload, fail_strict: bool):
+    def convert_from_path(pdf_path: Path, *, first_page: int, last_page: int, strict: bool, **kwargs: Any):
+        if strict and fail_strict:
+            raise ValueError("Syntax Error: Couldn't read xref table")
+        rendered.append((first_page, download.filled_bytes))
+        return [Image.new("RGB", (20, 20), "white") for _ in range(first_page, last_page + 1)]
+
+    return convert_from_path
+
+
+@pytest.mark.parametrize("fail_strict", [False, True], ids=["early", "fallback"])
+def test_stream_pdf_images(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, fail_strict: bool) -> None:
+    data = linearized_pdf(3, 1100, 3000)
+    gate = threading.Event()
+    download = start_download(FakeS3(data, gates={1536: gate}), tmp_path / "doc.pdf", part_size=512)
+    linearization = ocr_main.streamable_linearization(download, OcrConfig())
+    assert linearization
+    rendered: list[tuple[int, int]] = []
+    monkeypatch.setattr(ocr_main, "convert_from_path", fake_render(rendered, download, fail_strict))
+    summary = OcrRunSummary()
+    images = ocr_main.stream_pdf_images(
+        download=download,
+        linearization=linearization,
+        summary=summary,
+        disk_usage=DiskUsageTracker(tmp_path),
+        src_file=Path("doc.pdf"),
+        image_store=PageImageStore(spill_dir=tmp_path / "pages", max_memory_bytes=1024 * 1024),
+    )
+    suffixes = []
+    if not fail_strict:
+        # page 1 renders from the first page section while the rest of the pdf is still downloading
+        suffixes.append(next(images).suffix)
+        assert summary.input_bytes == 0
+    gate.set()
+    suffixes += [image.suffix for image in images]
+    assert suffixes == ["-page001.jpg", "-page002.jpg", "-page003.jpg"]
+    assert rendered == [(1, 3000 if fail_strict else 1536), (2, 3000), (3, 3000)]
+    assert summary.input_bytes == len(data)
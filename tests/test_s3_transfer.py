@@ -0,0 +1,53 @@
+"""Tests of the background S3 transfers."""
+
+from __future__ import annotations
+
+import threading
+from typing import Any
+
+import pytest
+from ai_ocr.s3_transfer import S3Transfers
+
+
+class BlockingClient:
+    """S3 client whose uploads wait for ``release`` and fail for keys starting with bad."""
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.uploaded: list[str] = []
+
+    def upload_fileobj(self, fileobj: Any, bucket: str, key: str, **kwargs: Any) -> None:
+        self.started.set()
+        self.release.wait(timeout=5)
+        if key.startswith("bad"):
+            raise ValueError(f"upload of {key} failed")
+        self.uploaded.append(key)
+
+
+def test_close_raises_first_upload_failure() -> None:
+    client = BlockingClient()
+    client.release.set()
+    transfers = S3Transfers(client, max_workers=1)
+    transfers.upload(b"data", "bucket", "bad-key")
+    with pytest.raises(ValueError, match="bad-key"):
+        transfers.close()
+    # closing again does nothing
+    transfers.close()
+
+
+def test_abort_cancels_queued_uploads_without_raising() -> None:
+    client = BlockingClient()
+    transfers = S3Transfers(client, max_workers=1, max_pending=8)
+    transfers.upload(b"data", "bucket", "bad-running")
+    client.started.wait(timeout=5)
+    for num in range(3):
+        transfers.upload(b"data", "bucket", f"queued-{num}")
+
+    threading.Timer(0.05, client.release.set).start()
+    transfers.abort()
+
+    assert client.uploaded == []
+    with pytest.raises(RuntimeError):
+        transfers.upload(b"data", "bucket", "after-abort")
+    transfers.close()